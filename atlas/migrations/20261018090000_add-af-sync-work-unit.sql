@@ -0,0 +1,24 @@
+-- Create "af_sync_work_unit" table
+CREATE TABLE "af_sync_work_unit" (
+  "id" serial NOT NULL,
+  "batch_key" text NOT NULL,
+  "stream" character varying(30) NOT NULL,
+  "app_id" text NOT NULL,
+  "geo" text NOT NULL,
+  "media_source" text NOT NULL,
+  "unit_date" date NOT NULL,
+  "status" character varying(20) NOT NULL DEFAULT 'pending',
+  "lease_owner" text NULL,
+  "lease_expires_at" timestamptz NULL,
+  "heartbeat_at" timestamptz NULL,
+  "attempts" integer NOT NULL DEFAULT 0,
+  "records_processed" integer NULL,
+  "last_error" text NULL,
+  "created_at" timestamptz NOT NULL DEFAULT now(),
+  "completed_at" timestamptz NULL,
+  PRIMARY KEY ("id")
+);
+-- Create index "idx_af_sync_work_unit_claim" to table: "af_sync_work_unit"
+CREATE INDEX "idx_af_sync_work_unit_claim" ON "af_sync_work_unit" ("batch_key", "status", "lease_expires_at");
+-- Create index "unique_af_sync_work_unit" to table: "af_sync_work_unit"
+CREATE UNIQUE INDEX "unique_af_sync_work_unit" ON "af_sync_work_unit" ("batch_key", "stream", "app_id", "geo", "media_source", "unit_date");
@@ -0,0 +1,2 @@
+-- Create index "creative_latest_idx" to table: "creative_evaluation"
+CREATE INDEX "creative_latest_idx" ON "creative_evaluation" ("evaluation_day", "campaign_id", "creative_id", "created_at" DESC);
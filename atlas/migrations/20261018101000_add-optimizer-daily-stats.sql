@@ -0,0 +1,108 @@
+-- Create "optimizer_daily_stats" table
+CREATE TABLE "optimizer_daily_stats" (
+  "id" serial NOT NULL,
+  "optimizer_email" character varying(100) NOT NULL,
+  "operation_date" date NOT NULL,
+  "account_id" integer NOT NULL DEFAULT 0,
+  "operation_type" character varying(50) NOT NULL DEFAULT 'OTHER',
+  "score_stage" character varying(10) NOT NULL DEFAULT 'T+7',
+  "total_operations" integer NOT NULL DEFAULT 0,
+  "excellent_count" integer NOT NULL DEFAULT 0,
+  "qualified_count" integer NOT NULL DEFAULT 0,
+  "failed_count" integer NOT NULL DEFAULT 0,
+  "roas_achievement_sum" numeric(14,2) NOT NULL DEFAULT 0,
+  "roas_achievement_count" integer NOT NULL DEFAULT 0,
+  "ret_achievement_sum" numeric(14,2) NOT NULL DEFAULT 0,
+  "ret_achievement_count" integer NOT NULL DEFAULT 0,
+  "min_achievement_sum" numeric(14,2) NOT NULL DEFAULT 0,
+  "min_achievement_count" integer NOT NULL DEFAULT 0,
+  "last_updated" timestamp NOT NULL DEFAULT now(),
+  PRIMARY KEY ("id")
+);
+-- Create index "optimizer_daily_stats_date_idx" to table: "optimizer_daily_stats"
+CREATE INDEX "optimizer_daily_stats_date_idx" ON "optimizer_daily_stats" ("operation_date");
+-- Create index "unique_optimizer_daily_stats" to table: "optimizer_daily_stats"
+CREATE UNIQUE INDEX "unique_optimizer_daily_stats" ON "optimizer_daily_stats" ("optimizer_email", "operation_date", "account_id", "operation_type", "score_stage");
+-- Create "refresh_optimizer_daily_stats" function
+-- Recomputes the optimizer_daily_stats buckets of the given (optimizer, operation date) pairs
+-- from operation_score and deletes buckets that no longer have rows; NULL arrays rebuild the
+-- whole table. Operations are bucketed on min(roas, ret) achievement rate. This is the only
+-- writer of the table: OperationEvaluator.refresh_optimizer_stats (Python) and
+-- refreshOptimizerDailyStats (server/db/queries-evaluation.ts) both call it.
+CREATE FUNCTION "refresh_optimizer_daily_stats" ("emails" text[], "dates" date[], "qualified_rate" numeric, "excellent_rate" numeric) RETURNS void LANGUAGE sql AS $$
+WITH keys AS (
+  SELECT k.optimizer_email, k.operation_date
+  FROM unnest(emails, dates) AS k(optimizer_email, operation_date)
+  UNION
+  SELECT os.optimizer_email, os.operation_date FROM operation_score os
+  WHERE emails IS NULL AND os.optimizer_email IS NOT NULL
+  UNION
+  SELECT s.optimizer_email, s.operation_date FROM optimizer_daily_stats s
+  WHERE emails IS NULL
+),
+scored AS (
+  SELECT
+    os.optimizer_email,
+    os.operation_date,
+    COALESCE(ce.account_id, 0) AS account_id,
+    COALESCE(os.operation_type, 'OTHER') AS operation_type,
+    os.score_stage,
+    os.roas_achievement_rate,
+    os.ret_achievement_rate,
+    LEAST(os.roas_achievement_rate, os.ret_achievement_rate) AS min_rate
+  FROM operation_score os
+  JOIN keys k
+    ON k.optimizer_email = os.optimizer_email
+   AND k.operation_date = os.operation_date
+  LEFT JOIN change_events ce ON ce.id = os.operation_id
+),
+fresh AS (
+  SELECT
+    optimizer_email, operation_date, account_id, operation_type, score_stage,
+    COUNT(*) AS total_operations,
+    COUNT(*) FILTER (WHERE min_rate >= excellent_rate) AS excellent_count,
+    COUNT(*) FILTER (WHERE min_rate >= qualified_rate AND min_rate < excellent_rate) AS qualified_count,
+    COUNT(*) FILTER (WHERE min_rate < qualified_rate) AS failed_count,
+    COALESCE(SUM(roas_achievement_rate), 0) AS roas_achievement_sum,
+    COUNT(roas_achievement_rate) AS roas_achievement_count,
+    COALESCE(SUM(ret_achievement_rate), 0) AS ret_achievement_sum,
+    COUNT(ret_achievement_rate) AS ret_achievement_count,
+    COALESCE(SUM(min_rate), 0) AS min_achievement_sum,
+    COUNT(min_rate) AS min_achievement_count
+  FROM scored
+  GROUP BY optimizer_email, operation_date, account_id, operation_type, score_stage
+),
+upserted AS (
+  INSERT INTO optimizer_daily_stats (
+    optimizer_email, operation_date, account_id, operation_type, score_stage,
+    total_operations, excellent_count, qualified_count, failed_count,
+    roas_achievement_sum, roas_achievement_count,
+    ret_achievement_sum, ret_achievement_count,
+    min_achievement_sum, min_achievement_count,
+    last_updated
+  )
+  SELECT fresh.*, NOW() FROM fresh
+  ON CONFLICT (optimizer_email, operation_date, account_id, operation_type, score_stage)
+  DO UPDATE SET
+    total_operations = EXCLUDED.total_operations,
+    excellent_count = EXCLUDED.excellent_count,
+    qualified_count = EXCLUDED.qualified_count,
+    failed_count = EXCLUDED.failed_count,
+    roas_achievement_sum = EXCLUDED.roas_achievement_sum,
+    roas_achievement_count = EXCLUDED.roas_achievement_count,
+    ret_achievement_sum = EXCLUDED.ret_achievement_sum,
+    ret_achievement_count = EXCLUDED.ret_achievement_count,
+    min_achievement_sum = EXCLUDED.min_achievement_sum,
+    min_achievement_count = EXCLUDED.min_achievement_count,
+    last_updated = NOW()
+  RETURNING id
+)
+DELETE FROM optimizer_daily_stats s
+USING keys k
+WHERE s.optimizer_email = k.optimizer_email
+  AND s.operation_date = k.operation_date
+  AND s.id NOT IN (SELECT id FROM upserted)
+$$;
+-- Seed "optimizer_daily_stats" from the existing "operation_score" rows, with the default
+-- buckets 85 / 110 (scoring.OPERATION_THRESHOLDS)
+SELECT "refresh_optimizer_daily_stats"(NULL, NULL, 85, 110);
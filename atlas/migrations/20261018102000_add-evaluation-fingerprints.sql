@@ -0,0 +1,29 @@
+-- Keep the latest row per natural key before adding the unique indexes
+UPDATE "action_recommendation" ar SET "evaluation_id" = keep."id"
+FROM "campaign_evaluation" e
+JOIN (SELECT "campaign_id", "evaluation_date", MAX("id") AS "id" FROM "campaign_evaluation" GROUP BY 1, 2) keep
+  ON keep."campaign_id" = e."campaign_id" AND keep."evaluation_date" = e."evaluation_date"
+WHERE ar."evaluation_id" = e."id" AND e."id" <> keep."id";
+DELETE FROM "campaign_evaluation" e
+USING "campaign_evaluation" newer
+WHERE newer."campaign_id" = e."campaign_id" AND newer."evaluation_date" = e."evaluation_date" AND newer."id" > e."id";
+DELETE FROM "creative_evaluation" e
+USING "creative_evaluation" newer
+WHERE newer."campaign_id" = e."campaign_id" AND newer."creative_id" = e."creative_id"
+  AND newer."evaluation_day" = e."evaluation_day" AND newer."id" > e."id";
+-- Modify "campaign_evaluation" table
+ALTER TABLE "campaign_evaluation" ADD COLUMN "input_fingerprint" character varying(64) NULL;
+-- Drop index "campaign_date_idx" from table: "campaign_evaluation"
+DROP INDEX "campaign_date_idx";
+-- Create index "campaign_date_uidx" to table: "campaign_evaluation"
+CREATE UNIQUE INDEX "campaign_date_uidx" ON "campaign_evaluation" ("campaign_id", "evaluation_date");
+-- Modify "creative_evaluation" table
+ALTER TABLE "creative_evaluation" ADD COLUMN "input_fingerprint" character varying(64) NULL;
+-- Drop index "creative_idx" from table: "creative_evaluation"
+DROP INDEX "creative_idx";
+-- Create index "creative_stage_uidx" to table: "creative_evaluation"
+CREATE UNIQUE INDEX "creative_stage_uidx" ON "creative_evaluation" ("campaign_id", "creative_id", "evaluation_day");
+-- Drop index "creative_latest_idx" from table: "creative_evaluation"
+DROP INDEX "creative_latest_idx";
+-- Modify "operation_score" table
+ALTER TABLE "operation_score" ADD COLUMN "input_fingerprint" character varying(64) NULL;
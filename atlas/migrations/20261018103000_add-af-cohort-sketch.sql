@@ -0,0 +1,20 @@
+-- Create "af_cohort_sketch" table
+CREATE TABLE "af_cohort_sketch" (
+  "id" serial NOT NULL,
+  "app_id" text NOT NULL,
+  "geo" text NOT NULL,
+  "media_source" text NOT NULL,
+  "install_date" date NOT NULL,
+  "metric" character varying(20) NOT NULL,
+  "centroid_means" double precision[] NOT NULL,
+  "centroid_weights" double precision[] NOT NULL,
+  "min_value" double precision NOT NULL,
+  "max_value" double precision NOT NULL,
+  "sample_count" integer NOT NULL,
+  "updated_at" timestamptz NOT NULL DEFAULT now(),
+  PRIMARY KEY ("id")
+);
+-- Create index "idx_af_cohort_sketch_install_date" to table: "af_cohort_sketch"
+CREATE INDEX "idx_af_cohort_sketch_install_date" ON "af_cohort_sketch" ("install_date");
+-- Create index "unique_af_cohort_sketch" to table: "af_cohort_sketch"
+CREATE UNIQUE INDEX "unique_af_cohort_sketch" ON "af_cohort_sketch" ("app_id", "geo", "media_source", "metric", "install_date");
@@ -0,0 +1,2 @@
+-- Modify "af_cohort_kpi_daily" table
+ALTER TABLE "af_cohort_kpi_daily" ADD COLUMN "settled_at" timestamptz NULL;
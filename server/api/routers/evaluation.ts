@@ -290,6 +290,9 @@ export const evaluationRouter = createTRPCRouter({
       z.object({
         days: z.number().default(30),
         limit: z.number().default(20),
+        operationType: z.string().optional(),
+        accountId: z.number().optional(),
+        scoreStage: z.enum(["T+1", "T+3", "T+7"]).optional(),
       })
     )
     .query(async ({ input }) => {
@@ -297,7 +300,8 @@ export const evaluationRouter = createTRPCRouter({
         "@/server/evaluation/wrappers/operation-evaluator"
       );
 
-      const result = await getOptimizerLeaderboard(input.days, input.limit);
+      const { days, limit, ...filters } = input;
+      const result = await getOptimizerLeaderboard(days, limit, filters);
 
       return result;
     }),
@@ -9,6 +9,7 @@ Usage:
     python backfill.py                    # Backfill 30 days (test mode)
     python backfill.py --days 180         # Backfill 180 days
     python backfill.py --days 90 --chunk-size 15   # Custom settings
+    python backfill.py --days 180 --sharded        # Split across ETL replicas (run on each node)
 """
 
 import os
@@ -21,6 +22,7 @@ from datetime import date, timedelta
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from sync_af_data import sync_events, sync_cohort_kpi, create_sync_log, update_sync_log
+from work_units import run_sharded_sync
 
 # Configure logging
 logging.basicConfig(
@@ -31,17 +33,23 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def backfill(days: int = 180, chunk_size: int = 30):
+def backfill(days: int = 180, chunk_size: int = 30, sharded: bool = False, batch_key: str = None):
     """
     Backfill historical AppsFlyer data in chunks.
 
     Args:
         days: Total number of days to backfill (default: 180)
         chunk_size: Size of each chunk in days (default: 30)
+        sharded: Split into per-day work units leased across replicas (chunk_size is ignored)
+        batch_key: Work unit batch key for sharded mode (default: backfill:<start>:<end>)
     """
     end_date = date.today() - timedelta(days=1)  # Start from yesterday
     start_date = end_date - timedelta(days=days - 1)
 
+    if sharded:
+        backfill_sharded(start_date, end_date, batch_key or f"backfill:{start_date}:{end_date}")
+        return
+
     chunks = (days + chunk_size - 1) // chunk_size  # Ceiling division
 
     logger.info("=" * 70)
@@ -106,6 +114,28 @@ def backfill(days: int = 180, chunk_size: int = 30):
         raise
 
 
+def backfill_sharded(start_date: date, end_date: date, batch_key: str):
+    """
+    Sharded backfill: every replica enqueues the same per-day units and drains
+    whatever is still unclaimed, so N nodes split the range without overlap.
+    """
+    logger.info("=" * 70)
+    logger.info("AppsFlyer Historical Data Backfill (sharded)")
+    logger.info(f"Total range: {start_date} to {end_date}")
+    logger.info(f"Batch key: {batch_key}")
+    logger.info("=" * 70)
+
+    master_log_id = create_sync_log("backfill", start_date, end_date)
+    try:
+        stats = run_sharded_sync(batch_key, start_date, end_date)
+        update_sync_log(master_log_id, "success", stats["records_processed"])
+        logger.info(f"Backfill replica finished: {stats}")
+    except Exception as e:
+        update_sync_log(master_log_id, "failed", error_message=str(e))
+        logger.error(f"Backfill failed: {e}")
+        raise
+
+
 def main():
     parser = argparse.ArgumentParser(
         description='AppsFlyer Historical Data Backfill',
@@ -115,12 +145,17 @@ Examples:
   python backfill.py                         # Backfill 30 days (test mode)
   python backfill.py --days 180              # Backfill 180 days (full baseline)
   python backfill.py --days 90 --chunk-size 15   # Custom settings
+  python backfill.py --days 180 --sharded    # Run on each replica to split the work
         """
     )
     parser.add_argument('--days', type=int, default=30,
                         help='Number of days to backfill (default: 30 for testing)')
     parser.add_argument('--chunk-size', type=int, default=30,
                         help='Chunk size in days (default: 30)')
+    parser.add_argument('--sharded', action='store_true',
+                        help='Split into leased per-day work units shared with other replicas')
+    parser.add_argument('--batch-key', dest='batch_key',
+                        help='Work unit batch key for --sharded (default: backfill:<start>:<end>)')
 
     args = parser.parse_args()
 
@@ -132,7 +167,7 @@ Examples:
         logger.error("Chunk size must be at least 1")
         sys.exit(1)
 
-    backfill(days=args.days, chunk_size=args.chunk_size)
+    backfill(days=args.days, chunk_size=args.chunk_size, sharded=args.sharded, batch_key=args.batch_key)
 
 
 if __name__ == "__main__":
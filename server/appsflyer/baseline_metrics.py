@@ -0,0 +1,241 @@
+# baseline_metrics.py
+"""
+Percentile Baselines from AppsFlyer Cohorts
+
+Fills baseline_metrics (PRD 6.2.5) from the AppsFlyer cohort data with one
+statement:
+1. one scan of the sample window, summed per (app, geo, media source, install date)
+2. GROUPING SETS turn every cohort day into the four fallback levels
+   (app+geo+media_source, app+geo, app+media_source, app; 'ALL' for rolled-up dimensions)
+3. per level key, percentile_cont (P50 by default) over the cohort days of
+   ROAS D3/D7, RET D3/D7 and CPI
+4. upsert on (app_id, media_source, geo, platform); rows with manual_override
+   are left alone
+
+Sample window: [as_of - offset - window, as_of - offset] (offset 180 / window
+30 days, like the on-demand getBaselineMetrics in queries-appsflyer.ts).
+The two inputs of af_cohort_metrics_daily (af_cohort_kpi_daily and the
+af_revenue_cohort_daily view over af_events) are read directly so the
+install_date window reaches both install_date indexes; through the joined
+view it only reached af_events and the KPI table was scanned in full. The cost
+of a recalculation depends on the window, not on how much history is stored.
+
+baseline_cvr stays NULL: AppsFlyer cohorts carry no impressions/clicks.
+
+Usage:
+    python baseline_metrics.py                          # as of today
+    python baseline_metrics.py --as-of 2026-10-01 --app-id com.example.app
+    python baseline_metrics.py --percentile 0.4 --min-sample-size 14
+"""
+
+import os
+import argparse
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional
+
+from sync_af_data import get_pg_connection, release_pg_connection, logger
+
+BASELINE_OFFSET_DAYS_DEFAULT = int(os.getenv("AF_BASELINE_OFFSET_DAYS", "180"))
+BASELINE_WINDOW_DAYS_DEFAULT = int(os.getenv("AF_BASELINE_WINDOW_DAYS", "30"))
+BASELINE_MIN_SAMPLE_DEFAULT = int(os.getenv("AF_BASELINE_MIN_SAMPLE", "7"))
+BASELINE_PERCENTILE_DEFAULT = float(os.getenv("AF_BASELINE_PERCENTILE", "0.5"))
+
+BASELINE_METRICS_QUERY = """
+    WITH kpi AS (
+        SELECT
+            app_id,
+            geo,
+            media_source,
+            install_date,
+            SUM(cost_usd) FILTER (WHERE days_since_install = 0) AS cost_usd,
+            SUM(installs) FILTER (WHERE days_since_install = 0) AS installs,
+            SUM(retention_rate * installs) FILTER (WHERE days_since_install = 3) AS retained_d3,
+            SUM(installs) FILTER (WHERE days_since_install = 3 AND retention_rate IS NOT NULL) AS ret_installs_d3,
+            SUM(retention_rate * installs) FILTER (WHERE days_since_install = 7) AS retained_d7,
+            SUM(installs) FILTER (WHERE days_since_install = 7 AND retention_rate IS NOT NULL) AS ret_installs_d7
+        FROM af_cohort_kpi_daily
+        WHERE install_date BETWEEN %(sample_start)s AND %(sample_end)s
+          AND (%(app_id)s::text IS NULL OR app_id = %(app_id)s::text)
+        GROUP BY app_id, geo, media_source, install_date
+    ),
+    revenue AS (
+        SELECT
+            app_id,
+            geo,
+            media_source,
+            install_date,
+            SUM(total_revenue_usd) FILTER (WHERE days_since_install <= 3) AS revenue_d3,
+            SUM(total_revenue_usd) FILTER (WHERE days_since_install <= 7) AS revenue_d7
+        FROM af_revenue_cohort_daily
+        WHERE install_date BETWEEN %(sample_start)s AND %(sample_end)s
+          AND (%(app_id)s::text IS NULL OR app_id = %(app_id)s::text)
+        GROUP BY app_id, geo, media_source, install_date
+    ),
+    -- Cohort days with cost / installs but no revenue row earned nothing: keep
+    -- them (ROAS 0) like cohort_sketches.COHORT_VALUES_QUERY
+    cohort AS (
+        SELECT
+            kpi.*,
+            COALESCE(revenue.revenue_d3, 0) AS revenue_d3,
+            COALESCE(revenue.revenue_d7, 0) AS revenue_d7
+        FROM kpi
+        LEFT JOIN revenue USING (app_id, geo, media_source, install_date)
+    ),
+    daily AS (
+        SELECT
+            app_id,
+            CASE WHEN GROUPING(geo) = 1 THEN 'ALL' ELSE geo END AS geo,
+            CASE WHEN GROUPING(media_source) = 1 THEN 'ALL' ELSE media_source END AS media_source,
+            install_date,
+            SUM(cost_usd) AS cost_usd,
+            SUM(installs) AS installs,
+            SUM(revenue_d3) AS revenue_d3,
+            SUM(revenue_d7) AS revenue_d7,
+            SUM(retained_d3) / NULLIF(SUM(ret_installs_d3), 0) AS ret_d3,
+            SUM(retained_d7) / NULLIF(SUM(ret_installs_d7), 0) AS ret_d7
+        FROM cohort
+        WHERE geo IS NOT NULL AND media_source IS NOT NULL
+        GROUP BY GROUPING SETS (
+            (app_id, geo, media_source, install_date),
+            (app_id, geo, install_date),
+            (app_id, media_source, install_date),
+            (app_id, install_date)
+        )
+    ),
+    computed AS (
+        SELECT
+            app_id,
+            geo,
+            media_source,
+            percentile_cont(%(percentile)s) WITHIN GROUP (ORDER BY revenue_d3 / NULLIF(cost_usd, 0)) AS roas_d3,
+            percentile_cont(%(percentile)s) WITHIN GROUP (ORDER BY revenue_d7 / NULLIF(cost_usd, 0)) AS roas_d7,
+            percentile_cont(%(percentile)s) WITHIN GROUP (ORDER BY ret_d3) AS ret_d3,
+            percentile_cont(%(percentile)s) WITHIN GROUP (ORDER BY ret_d7) AS ret_d7,
+            percentile_cont(%(percentile)s) WITHIN GROUP (ORDER BY cost_usd / NULLIF(installs, 0)) AS cpi,
+            COUNT(*) AS sample_size
+        FROM daily
+        GROUP BY app_id, geo, media_source
+        HAVING COUNT(*) >= %(min_sample_size)s
+    ),
+    upserted AS (
+        INSERT INTO baseline_metrics (
+            app_id, media_source, geo, platform,
+            baseline_roas_d3, baseline_roas_d7, baseline_ret_d3, baseline_ret_d7, baseline_cpi,
+            sample_start_date, sample_end_date, sample_size, next_update_date, updated_at
+        )
+        SELECT
+            app_id, media_source, geo, 'ALL',
+            -- clamp to the column precision so one outlier cannot fail the statement
+            LEAST(ROUND(roas_d3::numeric, 4), 99.9999),
+            LEAST(ROUND(roas_d7::numeric, 4), 99.9999),
+            LEAST(ROUND(ret_d3::numeric, 4), 9.9999),
+            LEAST(ROUND(ret_d7::numeric, 4), 9.9999),
+            LEAST(ROUND(cpi::numeric, 4), 999999.9999),
+            %(sample_start)s, %(sample_end)s, sample_size, %(next_update)s, NOW()
+        FROM computed
+        ON CONFLICT (app_id, media_source, geo, platform) DO UPDATE SET
+            baseline_roas_d3 = EXCLUDED.baseline_roas_d3,
+            baseline_roas_d7 = EXCLUDED.baseline_roas_d7,
+            baseline_ret_d3 = EXCLUDED.baseline_ret_d3,
+            baseline_ret_d7 = EXCLUDED.baseline_ret_d7,
+            baseline_cpi = EXCLUDED.baseline_cpi,
+            sample_start_date = EXCLUDED.sample_start_date,
+            sample_end_date = EXCLUDED.sample_end_date,
+            sample_size = EXCLUDED.sample_size,
+            next_update_date = EXCLUDED.next_update_date,
+            updated_at = NOW()
+        WHERE baseline_metrics.manual_override IS NOT TRUE
+        RETURNING (xmax = 0) AS inserted
+    )
+    SELECT
+        (SELECT COUNT(*) FROM computed) AS computed,
+        COUNT(*) FILTER (WHERE inserted) AS inserted,
+        COUNT(*) FILTER (WHERE NOT inserted) AS updated
+    FROM upserted
+"""
+
+
+def first_of_next_month(day: date) -> date:
+    return (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def compute_baseline_metrics(
+    as_of: Optional[date] = None,
+    app_id: Optional[str] = None,
+    offset_days: int = BASELINE_OFFSET_DAYS_DEFAULT,
+    window_days: int = BASELINE_WINDOW_DAYS_DEFAULT,
+    min_sample_size: int = BASELINE_MIN_SAMPLE_DEFAULT,
+    percentile: float = BASELINE_PERCENTILE_DEFAULT,
+) -> Dict[str, int]:
+    """
+    Recompute baseline_metrics for every app / geo / media source combination.
+
+    Args:
+        as_of: Calculation date (default: today); next_update_date is the 1st of the following month
+        app_id: Restrict to one app (default: all apps in the window)
+        offset_days: Sample window ends this many days before as_of
+        window_days: Sample window length in install dates (minus one)
+        min_sample_size: Minimum cohort days for a key to get a baseline
+        percentile: percentile_cont fraction (0.5 = P50)
+
+    Returns:
+        {"computed": keys with enough samples, "inserted": n, "updated": n,
+         "manual_override": keys left alone}
+    """
+    as_of = as_of or date.today()
+    sample_end = as_of - timedelta(days=offset_days)
+    sample_start = sample_end - timedelta(days=window_days)
+    params = {
+        "sample_start": sample_start,
+        "sample_end": sample_end,
+        "next_update": first_of_next_month(as_of),
+        "app_id": app_id,
+        "min_sample_size": min_sample_size,
+        "percentile": percentile,
+    }
+
+    conn = get_pg_connection()
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(BASELINE_METRICS_QUERY, params)
+                computed, inserted, updated = cur.fetchone()
+    finally:
+        release_pg_connection(conn)
+
+    result = {
+        "computed": computed,
+        "inserted": inserted,
+        "updated": updated,
+        "manual_override": computed - inserted - updated,
+    }
+    logger.info(f"Baseline metrics P{percentile * 100:g} over {sample_start} ~ {sample_end}: {result}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute baseline_metrics percentiles from AppsFlyer cohorts")
+    parser.add_argument("--as-of", help="Calculation date YYYY-MM-DD (default: today)")
+    parser.add_argument("--app-id", help="Only this app (default: all)")
+    parser.add_argument("--offset-days", type=int, default=BASELINE_OFFSET_DAYS_DEFAULT,
+                        help=f"Window ends this many days before --as-of (default: {BASELINE_OFFSET_DAYS_DEFAULT})")
+    parser.add_argument("--window-days", type=int, default=BASELINE_WINDOW_DAYS_DEFAULT,
+                        help=f"Window length in days (default: {BASELINE_WINDOW_DAYS_DEFAULT})")
+    parser.add_argument("--min-sample-size", type=int, default=BASELINE_MIN_SAMPLE_DEFAULT,
+                        help=f"Minimum cohort days per key (default: {BASELINE_MIN_SAMPLE_DEFAULT})")
+    parser.add_argument("--percentile", type=float, default=BASELINE_PERCENTILE_DEFAULT,
+                        help=f"Percentile as fraction (default: {BASELINE_PERCENTILE_DEFAULT})")
+    args = parser.parse_args()
+
+    compute_baseline_metrics(
+        as_of=datetime.strptime(args.as_of, "%Y-%m-%d").date() if args.as_of else None,
+        app_id=args.app_id,
+        offset_days=args.offset_days,
+        window_days=args.window_days,
+        min_sample_size=args.min_sample_size,
+        percentile=args.percentile,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+Local AppsFlyer API stand-in for ETL benchmarks.
+
+Serves synthetic CSVs for the three endpoints sync_af_data.py calls:
+- /api/raw-data/export/app/<app_id>/in_app_events_report/v5
+- /api/raw-data/export/app/<app_id>/ad_revenue_raw/v5
+- /api/master-agg-data/v4/app/<app_id>
+
+Data is deterministic per (endpoint, date), so repeated syncs hit the same
+event_ids / cohort keys just like re-pulling real data. Latency, 5xx error rate
+and 429 rate limiting are configurable. GET /_stats returns request counters.
+
+Point the ETL at it with AF_BASE_URL=http://127.0.0.1:<port>/api
+
+Usage:
+    python bench/af_standin.py --port 8765 --events-per-day 5000
+    python bench/af_standin.py --latency-ms 200 --error-rate 0.05 --rate-limit 10
+"""
+
+import io
+import csv
+import json
+import random
+import hashlib
+import argparse
+import threading
+import time
+from dataclasses import dataclass, asdict
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+
+
+RAW_EVENT_COLUMNS = [
+    "Install Time",
+    "Event Time",
+    "Event Name",
+    "Event Revenue",
+    "Event Revenue USD",
+    "Event Revenue Currency",
+    "App ID",
+    "App Name",
+    "Bundle ID",
+    "AppsFlyer ID",
+    "Country Code",
+    "Media Source",
+    "Channel",
+    "Campaign",
+    "Campaign ID",
+    "Adset",
+    "Adset ID",
+    "Ad",
+    "Is Primary Attribution",
+]
+
+MASTER_AGG_COLUMNS = [
+    "Media Source",
+    "Campaign",
+    "GEO",
+    "Cost",
+    "Installs",
+    "Retention Rate Day 1",
+    "Retention Rate Day 3",
+    "Retention Rate Day 5",
+    "Retention Rate Day 7",
+]
+
+# Other networks show up in master-agg regardless of the filter (see fetch_master_agg_for_install_date)
+OTHER_MEDIA_SOURCES = ["Facebook Ads", "unityads_int", "organic"]
+
+
+@dataclass
+class StandinConfig:
+    events_per_day: int = 1000
+    campaigns: int = 20
+    geos: Tuple[str, ...] = ("US",)
+    latency_ms: float = 0.0
+    latency_jitter_ms: float = 0.0
+    error_rate: float = 0.0
+    rate_limit: float = 0.0  # requests per second, 0 = unlimited
+    seed: int = 42
+
+
+@dataclass
+class StandinStats:
+    requests: int = 0
+    ok: int = 0
+    errors_5xx: int = 0
+    rate_limited: int = 0
+    rows_served: int = 0
+    bytes_served: int = 0
+
+
+# -----------------------------------------------------------------------------
+# Synthetic data
+# -----------------------------------------------------------------------------
+
+def _rng(config: StandinConfig, *key) -> random.Random:
+    digest = hashlib.sha1("|".join(map(str, (config.seed, *key))).encode("utf-8")).hexdigest()
+    return random.Random(int(digest[:16], 16))
+
+
+def _days(from_date: str, to_date: str) -> List[date]:
+    start = datetime.strptime(from_date, "%Y-%m-%d").date()
+    end = datetime.strptime(to_date, "%Y-%m-%d").date()
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+def generate_raw_events_csv(
+    config: StandinConfig,
+    app_id: str,
+    report: str,
+    from_date: str,
+    to_date: str,
+    media_source: str,
+    geo: str,
+) -> Tuple[str, int]:
+    """
+    Raw-data export rows for every event day in [from_date, to_date].
+    """
+    event_name = "iap_purchase" if report == "in_app_events_report" else "af_ad_revenue"
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(RAW_EVENT_COLUMNS)
+    rows = 0
+    for day in _days(from_date, to_date):
+        rng = _rng(config, report, app_id, media_source, geo, day)
+        day_start = datetime.combine(day, datetime.min.time())
+        for i in range(config.events_per_day):
+            event_time = day_start + timedelta(seconds=rng.randrange(86400))
+            install_time = event_time - timedelta(seconds=rng.randrange(30 * 86400))
+            revenue = round(rng.lognormvariate(-1.0, 1.2), 4) if event_name == "iap_purchase" else round(rng.random() * 0.05, 6)
+            campaign_no = rng.randrange(config.campaigns)
+            writer.writerow([
+                install_time.strftime("%Y-%m-%d %H:%M:%S"),
+                event_time.strftime("%Y-%m-%d %H:%M:%S"),
+                event_name,
+                revenue,
+                revenue,
+                "USD",
+                app_id,
+                "Bench App",
+                app_id,
+                f"{day:%Y%m%d}-{report[:3]}-{i:08d}",
+                geo,
+                media_source,
+                "ACI_Search",
+                f"campaign_{campaign_no:03d}",
+                str(100000 + campaign_no),
+                f"adset_{rng.randrange(5)}",
+                str(200000 + rng.randrange(5)),
+                f"ad_{rng.randrange(10)}",
+                "true",
+            ])
+            rows += 1
+    return buf.getvalue(), rows
+
+
+def generate_master_agg_csv(config: StandinConfig, app_id: str, from_date: str, to_date: str) -> Tuple[str, int]:
+    """
+    One row per media source x campaign x geo for the install date range.
+    The first media source is the ETL default (googleadwords_int).
+    """
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(MASTER_AGG_COLUMNS)
+    rows = 0
+    for media_source in ["googleadwords_int", *OTHER_MEDIA_SOURCES]:
+        rng = _rng(config, "master-agg", app_id, media_source, from_date, to_date)
+        for campaign_no in range(config.campaigns):
+            for geo in config.geos:
+                installs = rng.randrange(50, 5000)
+                d1 = rng.uniform(0.25, 0.45)
+                writer.writerow([
+                    media_source,
+                    f"campaign_{campaign_no:03d}",
+                    geo,
+                    round(installs * rng.uniform(0.5, 3.0), 2),
+                    installs,
+                    round(d1, 4),
+                    round(d1 * 0.6, 4),
+                    round(d1 * 0.45, 4),
+                    # D7 not yet available for some cohorts
+                    "" if rng.random() < 0.1 else round(d1 * 0.35, 4),
+                ])
+                rows += 1
+    return buf.getvalue(), rows
+
+
+# -----------------------------------------------------------------------------
+# HTTP server
+# -----------------------------------------------------------------------------
+
+class _TokenBucket:
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self) -> bool:
+        if self.rate <= 0:
+            return True
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+class StandinServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, config: StandinConfig):
+        super().__init__(address, StandinHandler)
+        self.config = config
+        self.stats = StandinStats()
+        self.stats_lock = threading.Lock()
+        self.bucket = _TokenBucket(config.rate_limit)
+        self.fault_rng = random.Random(config.seed)
+
+    def count(self, **deltas) -> None:
+        with self.stats_lock:
+            for name, value in deltas.items():
+                setattr(self.stats, name, getattr(self.stats, name) + value)
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    server: StandinServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: str, content_type: str = "text/csv", headers: Optional[Dict[str, str]] = None):
+        payload = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+        return len(payload)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/_stats":
+            self._send(200, json.dumps(asdict(self.server.stats)), content_type="application/json")
+            return
+
+        config = self.server.config
+        self.server.count(requests=1)
+
+        if not self.server.bucket.take():
+            self.server.count(rate_limited=1)
+            self._send(429, "Too Many Requests", content_type="text/plain", headers={"Retry-After": "1"})
+            return
+
+        if config.latency_ms or config.latency_jitter_ms:
+            delay = config.latency_ms + self.server.fault_rng.uniform(0, config.latency_jitter_ms)
+            time.sleep(delay / 1000.0)
+
+        if config.error_rate and self.server.fault_rng.random() < config.error_rate:
+            self.server.count(errors_5xx=1)
+            self._send(503, "Service Unavailable", content_type="text/plain")
+            return
+
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        parts = url.path.strip("/").split("/")
+        try:
+            if parts[:4] == ["api", "raw-data", "export", "app"] and len(parts) == 7:
+                body, rows = generate_raw_events_csv(
+                    config, parts[4], parts[5], query["from"], query["to"],
+                    query.get("media_source", "googleadwords_int"), query.get("geo", "US"),
+                )
+            elif parts[:4] == ["api", "master-agg-data", "v4", "app"] and len(parts) == 5:
+                body, rows = generate_master_agg_csv(config, parts[4], query["from"], query["to"])
+            else:
+                self._send(404, "Not Found", content_type="text/plain")
+                return
+        except (KeyError, ValueError) as e:
+            self._send(400, f"Bad Request: {e}", content_type="text/plain")
+            return
+
+        sent = self._send(200, body)
+        self.server.count(ok=1, rows_served=rows, bytes_served=sent)
+
+
+def start_standin(config: StandinConfig, host: str = "127.0.0.1", port: int = 0) -> StandinServer:
+    """
+    Start the stand-in on a background thread. port=0 picks a free port;
+    the base URL for AF_BASE_URL is http://<host>:<server.server_port>/api
+    """
+    server = StandinServer((host, port), config)
+    thread = threading.Thread(target=server.serve_forever, name="af-standin", daemon=True)
+    thread.start()
+    return server
+
+
+def add_standin_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--events-per-day", type=int, default=1000, help="Raw events per day per stream (default: 1000)")
+    parser.add_argument("--campaigns", type=int, default=20, help="Campaigns per media source (default: 20)")
+    parser.add_argument("--geos", default="US", help="Comma-separated geos in master-agg (default: US)")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Fixed response latency (default: 0)")
+    parser.add_argument("--latency-jitter-ms", type=float, default=0.0, help="Extra uniform random latency (default: 0)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 503 (default: 0)")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Requests/s before answering 429 (default: unlimited)")
+    parser.add_argument("--seed", type=int, default=42)
+
+
+def standin_config_from_args(args: argparse.Namespace) -> StandinConfig:
+    return StandinConfig(
+        events_per_day=args.events_per_day,
+        campaigns=args.campaigns,
+        geos=tuple(g.strip() for g in args.geos.split(",") if g.strip()),
+        latency_ms=args.latency_ms,
+        latency_jitter_ms=args.latency_jitter_ms,
+        error_rate=args.error_rate,
+        rate_limit=args.rate_limit,
+        seed=args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local AppsFlyer API stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_standin_arguments(parser)
+    args = parser.parse_args()
+
+    server = StandinServer((args.host, args.port), standin_config_from_args(args))
+    print(f"AppsFlyer stand-in listening on http://{args.host}:{server.server_port}/api")
+    print(f"  export AF_BASE_URL=http://{args.host}:{server.server_port}/api")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
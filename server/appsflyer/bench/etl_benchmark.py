@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+End-to-end ETL load benchmark.
+
+Drives sync_events, sync_cohort_kpi and backfill against the local AppsFlyer
+stand-in (bench/af_standin.py) and a local Postgres (PG_* from .env), and
+reports rows/s, peak memory and per-stage timings.
+
+Rows are written under a dedicated app id (--app-id, default bench.app) so they
+never mix with real data; --reset deletes those rows before each stage of
+the first run only, so --repeat runs 2+ deliberately measure the re-sync of
+unchanged rows.
+
+Usage:
+    python bench/etl_benchmark.py --days 7 --events-per-day 5000 --reset
+    python bench/etl_benchmark.py --stages events,cohort --geos US,CA,GB --json out.json
+    python bench/etl_benchmark.py --standin-url http://127.0.0.1:8765/api   # external stand-in
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tracemalloc
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from af_standin import add_standin_arguments, standin_config_from_args, start_standin
+
+
+STAGES = ("events", "cohort", "backfill")
+
+# sync_af_data functions timed individually; the sync functions resolve these
+# through module globals, so wrapping them there covers backfill as well.
+TIMED_FUNCTIONS = (
+    "fetch_raw_events_csv",
+    "normalize_events_df",
+    "upsert_events",
+    "fetch_master_agg_for_install_date",
+    "build_cohort_kpi_frame",
+    "upsert_cohort_kpi",
+    "refresh_synced_sketches",
+)
+UPSERT_FUNCTIONS = ("upsert_events", "upsert_cohort_kpi")
+
+
+class StageProfile:
+    def __init__(self):
+        self.seconds: Dict[str, float] = defaultdict(float)
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.rows = 0
+
+    def wrap(self, name: str, func: Callable) -> Callable:
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                self.seconds[name] += time.perf_counter() - start
+                self.calls[name] += 1
+            if name in UPSERT_FUNCTIONS:
+                self.rows += result or 0
+            return result
+        timed.__wrapped__ = func
+        return timed
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def reset_bench_rows(sync_module, app_id: str) -> None:
+    conn = sync_module.get_pg_connection()
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM af_events WHERE app_id = %s", (app_id,))
+                cur.execute("DELETE FROM af_cohort_kpi_daily WHERE app_id = %s", (app_id,))
+                cur.execute("DELETE FROM af_cohort_sketch WHERE app_id = %s", (app_id,))
+    finally:
+        sync_module.release_pg_connection(conn)
+
+
+def run_stage(name: str, func: Callable[[], Any], sync_module, trace_memory: bool) -> Dict[str, Any]:
+    profile = StageProfile()
+    originals = {fn: getattr(sync_module, fn) for fn in TIMED_FUNCTIONS}
+    for fn, original in originals.items():
+        setattr(sync_module, fn, profile.wrap(fn, original))
+
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        func()
+    finally:
+        elapsed = time.perf_counter() - start
+        traced_peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+        if trace_memory:
+            tracemalloc.stop()
+        for fn, original in originals.items():
+            setattr(sync_module, fn, original)
+
+    accounted = sum(profile.seconds.values())
+    return {
+        "stage": name,
+        "seconds": round(elapsed, 3),
+        "rows": profile.rows,
+        "rows_per_sec": round(profile.rows / elapsed, 1) if elapsed else None,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "peak_traced_mb": round(traced_peak / (1024 * 1024), 1) if traced_peak is not None else None,
+        "steps": {
+            fn: {"seconds": round(profile.seconds[fn], 3), "calls": profile.calls[fn]}
+            for fn in TIMED_FUNCTIONS if profile.calls[fn]
+        },
+        "other_seconds": round(max(elapsed - accounted, 0.0), 3),
+    }
+
+
+def print_report(results: List[Dict[str, Any]], standin_stats: Optional[Dict[str, int]]) -> None:
+    print("")
+    print(f"{'stage':<10} {'seconds':>9} {'rows':>10} {'rows/s':>10} {'peak RSS MB':>12} {'traced MB':>10}")
+    print("-" * 66)
+    for r in results:
+        traced = "-" if r["peak_traced_mb"] is None else f"{r['peak_traced_mb']:.1f}"
+        print(
+            f"{r['stage']:<10} {r['seconds']:>9.3f} {r['rows']:>10} "
+            f"{(r['rows_per_sec'] or 0):>10.1f} {r['peak_rss_mb']:>12.1f} {traced:>10}"
+        )
+        for fn, step in r["steps"].items():
+            print(f"    {fn:<36} {step['seconds']:>9.3f}s  x{step['calls']}")
+        print(f"    {'(other: sync log, retries, glue)':<36} {r['other_seconds']:>9.3f}s")
+    if standin_stats:
+        print("")
+        print(f"stand-in: {standin_stats}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="End-to-end AppsFlyer ETL load benchmark",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"Comma-separated subset of {STAGES}")
+    parser.add_argument("--days", type=int, default=7, help="Days per stage, ending yesterday (default: 7)")
+    parser.add_argument("--chunk-size", type=int, default=7, help="Backfill chunk size in days (default: 7)")
+    parser.add_argument("--repeat", type=int, default=1, help="Run each stage N times (2nd+ runs measure re-sync of existing rows)")
+    parser.add_argument("--app-id", default="bench.app", help="App id the benchmark writes under (default: bench.app)")
+    parser.add_argument("--reset", action="store_true", help="Delete rows of --app-id before each stage of the first run (later --repeat runs re-sync existing rows)")
+    parser.add_argument("--trace-memory", action="store_true", help="Also report tracemalloc peak (slows the run)")
+    parser.add_argument("--standin-url", help="Use an already running stand-in instead of starting one in-process")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    add_standin_arguments(parser)
+    args = parser.parse_args()
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"Unknown stages: {sorted(unknown)}")
+
+    server = None
+    if args.standin_url:
+        base_url = args.standin_url.rstrip("/")
+    else:
+        server = start_standin(standin_config_from_args(args))
+        base_url = f"http://127.0.0.1:{server.server_port}/api"
+
+    # Must be set before sync_af_data is imported (it reads env at import time)
+    load_dotenv()
+    os.environ["AF_BASE_URL"] = base_url
+    os.environ["AF_APP_ID"] = args.app_id
+    os.environ.setdefault("AF_API_TOKEN", "bench")
+
+    import sync_af_data
+    import backfill
+
+    end_date = date.today() - timedelta(days=1)
+    start_date = end_date - timedelta(days=args.days - 1)
+    from_str, to_str = start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d")
+
+    stage_funcs = {
+        "events": lambda: sync_af_data.sync_events(from_str, to_str),
+        "cohort": lambda: sync_af_data.sync_cohort_kpi(from_str, to_str),
+        "backfill": lambda: backfill.backfill(days=args.days, chunk_size=args.chunk_size),
+    }
+
+    results = []
+    for run in range(1, args.repeat + 1):
+        for stage in stages:
+            if args.reset and run == 1:
+                reset_bench_rows(sync_af_data, args.app_id)
+            result = run_stage(stage, stage_funcs[stage], sync_af_data, args.trace_memory)
+            result["run"] = run
+            results.append(result)
+
+    standin_stats = None
+    if server is not None:
+        standin_stats = vars(server.stats).copy()
+        server.shutdown()
+
+    print_report(results, standin_stats)
+
+    if args.json:
+        report = {
+            "config": {k: v for k, v in vars(args).items() if k != "json"},
+            "date_range": [from_str, to_str],
+            "results": results,
+            "standin": standin_stats,
+        }
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the ETL hot functions in sync_af_data.py.
+
+Runs offline (no AppsFlyer, no Postgres): inputs are generated deterministically
+with the stand-in's CSV generators, so numbers are comparable across runs and
+branches on the same machine.
+
+Cases (each at several sizes):
+    parse_datetime_utc, compute_days_since_install, generate_event_id,
+    normalize_events_df, build_event_rows (upsert_events row building),
+    build_cohort_kpi_frame, build_cohort_kpi_copy_buffer (upsert_cohort_kpi COPY input)
+
+Results are per-call best-of-repeats timings. Baselines are machine specific and
+are kept out of git (bench/baselines/).
+
+Usage:
+    python bench/micro_benchmark.py --save-baseline          # on main, before the change
+    python bench/micro_benchmark.py --compare                # on the branch; exit 1 on regression
+    python bench/micro_benchmark.py --only normalize --sizes 1000,10000 --json out.json
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import statistics
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+# sync_af_data reads these at import time; nothing here connects anywhere
+for _name, _value in {
+    "AF_API_TOKEN": "bench",
+    "AF_APP_ID": "bench.app",
+    "PG_HOST": "localhost",
+    "PG_USER": "bench",
+    "PG_PASSWORD": "bench",
+    "PG_DATABASE": "bench",
+}.items():
+    os.environ.setdefault(_name, _value)
+
+import pandas as pd
+
+import sync_af_data as af
+from af_standin import StandinConfig, generate_master_agg_csv, generate_raw_events_csv
+
+
+DEFAULT_SIZES = (100, 1000, 10000)
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baselines", "micro.json")
+INSTALL_DATE = date(2025, 1, 1)
+
+
+# -----------------------------------------------------------------------------
+# Deterministic inputs
+# -----------------------------------------------------------------------------
+
+def raw_events_df(size: int) -> pd.DataFrame:
+    config = StandinConfig(events_per_day=size, campaigns=20)
+    text, _ = generate_raw_events_csv(
+        config, "bench.app", "in_app_events_report", "2025-01-01", "2025-01-01", "googleadwords_int", "US"
+    )
+    return pd.read_csv(io.StringIO(text))
+
+
+def master_agg_df(size: int) -> pd.DataFrame:
+    # 4 media sources x campaigns x 1 geo rows, mirrors fetch_master_agg_for_install_date
+    config = StandinConfig(campaigns=max(1, size // 4), geos=("US",))
+    text, _ = generate_master_agg_csv(config, "bench.app", "2025-01-01", "2025-01-01")
+    return pd.read_csv(io.StringIO(text)).rename(columns=af.MASTER_AGG_COLUMN_MAPPING)
+
+
+@dataclass
+class Case:
+    name: str
+    setup: Callable[[int], Any]
+    run: Callable[[Any], Any]
+
+
+def _parse_all(values: List[str]) -> None:
+    for v in values:
+        af.parse_datetime_utc(v)
+
+
+def _days_all(pairs: List[Tuple[datetime, datetime]]) -> None:
+    for install_time, event_time in pairs:
+        af.compute_days_since_install(install_time, event_time)
+
+
+def _event_id_all(rows: List[pd.Series]) -> None:
+    for r in rows:
+        af.generate_event_id(r)
+
+
+def _parsed_pairs(size: int) -> List[Tuple[datetime, datetime]]:
+    df = raw_events_df(size)
+    return [
+        (af.parse_datetime_utc(i), af.parse_datetime_utc(e))
+        for i, e in zip(df["Install Time"], df["Event Time"])
+    ]
+
+
+def _event_id_rows(size: int) -> List[pd.Series]:
+    df = raw_events_df(size)
+    df["Event Time Parsed"] = df["Event Time"].apply(af.parse_datetime_utc)
+    df["event_name"] = "iap_purchase"
+    return [r for _, r in df.iterrows()]
+
+
+CASES = [
+    Case("parse_datetime_utc", lambda n: list(raw_events_df(n)["Event Time"]), _parse_all),
+    Case("compute_days_since_install", _parsed_pairs, _days_all),
+    Case("generate_event_id", _event_id_rows, _event_id_all),
+    # normalize_events_df mutates its input, so each call gets a fresh copy (copy cost is included)
+    Case("normalize_events_df", raw_events_df, lambda df: af.normalize_events_df(df.copy(), "iap_purchase")),
+    Case("build_event_rows", lambda n: af.normalize_events_df(raw_events_df(n), "iap_purchase"), af.build_event_rows),
+    Case("build_cohort_kpi_frame", master_agg_df, lambda agg: af.build_cohort_kpi_frame(agg, INSTALL_DATE)),
+    Case(
+        "build_cohort_kpi_copy_buffer",
+        lambda n: af.build_cohort_kpi_frame(master_agg_df(n), INSTALL_DATE),
+        af.build_cohort_kpi_copy_buffer,
+    ),
+]
+
+
+# -----------------------------------------------------------------------------
+# Timing
+# -----------------------------------------------------------------------------
+
+def time_case(func: Callable[[Any], Any], arg: Any, repeat: int, min_time: float) -> Dict[str, float]:
+    """
+    timeit-style: calibrate loops so one repeat takes >= min_time, report per-call seconds.
+    """
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            func(arg)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or loops >= 1_000_000:
+            break
+        loops *= 2 if elapsed == 0 else max(2, min(10, int(min_time / elapsed) + 1))
+
+    samples = [elapsed / loops]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            func(arg)
+        samples.append((time.perf_counter() - start) / loops)
+
+    return {
+        "best_s": min(samples),
+        "median_s": statistics.median(samples),
+        "loops": loops,
+        "repeat": repeat,
+    }
+
+
+def run_suite(sizes: List[int], only: Optional[str], repeat: int, min_time: float) -> Dict[str, Dict[str, Any]]:
+    results = {}
+    for case in CASES:
+        if only and only not in case.name:
+            continue
+        for size in sizes:
+            arg = case.setup(size)
+            timing = time_case(case.run, arg, repeat, min_time)
+            timing["size"] = size
+            timing["per_item_us"] = timing["best_s"] / size * 1e6
+            key = f"{case.name}[{size}]"
+            results[key] = timing
+            print(f"  {key:<40} {timing['best_s'] * 1e3:>10.3f} ms  {timing['per_item_us']:>9.2f} us/item")
+    return results
+
+
+def environment_info() -> Dict[str, str]:
+    return {
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+# -----------------------------------------------------------------------------
+# Baseline comparison
+# -----------------------------------------------------------------------------
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """
+    Print current vs baseline best-of timings; return keys slower than baseline by more than threshold.
+    """
+    regressions = []
+    base_results = baseline.get("results", {})
+    print("")
+    print(f"{'case':<40} {'baseline ms':>12} {'current ms':>12} {'change':>9}")
+    print("-" * 77)
+    for key, timing in results.items():
+        base = base_results.get(key)
+        if base is None:
+            print(f"{key:<40} {'-':>12} {timing['best_s'] * 1e3:>12.3f} {'new':>9}")
+            continue
+        ratio = timing["best_s"] / base["best_s"] if base["best_s"] else float("inf")
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            regressions.append(key)
+        elif ratio < 1 - threshold:
+            flag = "  faster"
+        print(f"{key:<40} {base['best_s'] * 1e3:>12.3f} {timing['best_s'] * 1e3:>12.3f} {ratio - 1:>+8.1%}{flag}")
+
+    if baseline.get("environment", {}).get("python") != platform.python_version():
+        print("\nNote: baseline was recorded with a different Python version.")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Micro-benchmarks for sync_af_data.py hot functions",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="Comma-separated input sizes (rows)")
+    parser.add_argument("--only", help="Run only cases whose name contains this string")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed repeats per case (default: 5)")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Minimum seconds per repeat (default: 0.2)")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    parser.add_argument("--save-baseline", nargs="?", const=DEFAULT_BASELINE, help="Store results as baseline")
+    parser.add_argument("--compare", nargs="?", const=DEFAULT_BASELINE, help="Compare with a stored baseline")
+    parser.add_argument("--threshold", type=float, default=0.15, help="Regression threshold as fraction (default: 0.15)")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    print(f"Running micro-benchmarks (sizes={sizes}, repeat={args.repeat})")
+    report = {
+        "environment": environment_info(),
+        "results": run_suite(sizes, args.only, args.repeat, args.min_time),
+    }
+
+    for path in filter(None, (args.json, args.save_baseline)):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {path}")
+
+    if args.compare:
+        if not os.path.exists(args.compare):
+            print(f"No baseline at {args.compare}; run with --save-baseline first.")
+            sys.exit(2)
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report["results"], baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) above {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+        print(f"\nNo regressions above {args.threshold:.0%}.")
+
+
+if __name__ == "__main__":
+    main()
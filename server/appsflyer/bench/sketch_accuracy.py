@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Accuracy check for the cohort quantile sketches (cohort_sketches.py).
+
+Offline (default, no Postgres): for several value distributions, builds one
+TDigest per synthetic cohort day, merges a window of days and compares the
+quantiles with the exact percentile_cont (np.quantile, linear) of all values.
+
+--db: compares window_quantiles() over af_cohort_sketch with the exact
+quantiles of the raw campaign-day values (af_cohort_kpi_daily + af_events)
+of the same window.
+
+Errors are reported as rank error (how many ranks, as a fraction of all
+values, the estimate is away from the exact quantile) and relative value error; exits 1 when the max rank error
+exceeds --max-rank-error.
+
+Usage:
+    python bench/sketch_accuracy.py
+    python bench/sketch_accuracy.py --days 180 --campaigns 400 --compression 100
+    python bench/sketch_accuracy.py --db --app-id com.example.app --start 2026-03-01 --end 2026-04-01
+"""
+
+import os
+import sys
+import argparse
+from datetime import datetime
+from typing import Dict, List, Sequence
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+# sync_af_data reads these at import time; only --db connects (with the real settings)
+for _name, _value in {
+    "AF_API_TOKEN": "bench",
+    "AF_APP_ID": "bench.app",
+    "PG_HOST": "localhost",
+    "PG_USER": "bench",
+    "PG_PASSWORD": "bench",
+    "PG_DATABASE": "bench",
+}.items():
+    os.environ.setdefault(_name, _value)
+
+import numpy as np
+
+from cohort_sketches import SKETCH_COMPRESSION, SKETCH_METRICS, TDigest
+
+QUANTILES = (0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)
+
+# name -> generator(rng, size); shapes of ROAS / retention-like values
+DISTRIBUTIONS = {
+    "lognormal_roas": lambda rng, n: rng.lognormal(-0.7, 0.6, n),
+    "beta_retention": lambda rng, n: rng.beta(2, 12, n),
+    "bimodal": lambda rng, n: np.where(rng.random(n) < 0.7, rng.normal(0.4, 0.05, n), rng.normal(1.2, 0.2, n)),
+    "heavy_tail": lambda rng, n: rng.pareto(2.5, n),
+    "ties": lambda rng, n: rng.integers(0, 20, n) / 100,
+}
+
+
+def errors(exact_values: np.ndarray, estimates: np.ndarray, quantiles: Sequence[float]) -> List[Dict[str, float]]:
+    exact_values = np.sort(exact_values)
+    exact = np.quantile(exact_values, quantiles)
+    n = len(exact_values)
+    rows = []
+    for q, e, est in zip(quantiles, exact, estimates):
+        # Rank error: distance from the target rank q * (n - 1) to the ranks the
+        # estimate can interpolate between, [values below it - 1, values up to it]
+        # (a run of ties spans several ranks); a relative tolerance absorbs
+        # rounding in centroid means
+        tol = 1e-9 * max(1.0, abs(est))
+        lo = np.searchsorted(exact_values, est - tol, side="left")
+        hi = np.searchsorted(exact_values, est + tol, side="right")
+        target = q * (n - 1)
+        rank_error = max(0.0, (lo - 1) - target, target - hi) / n
+        rows.append({
+            "q": q,
+            "exact": float(e),
+            "estimate": float(est),
+            "rank_error": rank_error,
+            "rel_error": abs(est - e) / abs(e) if e else abs(est - e),
+        })
+    return rows
+
+
+def print_rows(label: str, rows: List[Dict[str, float]]) -> float:
+    print(f"  {label}")
+    for r in rows:
+        print(f"    q={r['q']:<5} exact={r['exact']:<12.6g} sketch={r['estimate']:<12.6g} "
+              f"rank_err={r['rank_error']:.4%} rel_err={r['rel_error']:.3%}")
+    return max(r["rank_error"] for r in rows)
+
+
+def run_offline(days: int, campaigns: int, compression: int, seed: int) -> float:
+    rng = np.random.default_rng(seed)
+    worst = 0.0
+    print(f"Offline: {days} days, up to {campaigns} campaigns/day, compression {compression}")
+    for name, generate in DISTRIBUTIONS.items():
+        day_values = [generate(rng, int(rng.integers(1, campaigns + 1))) for _ in range(days)]
+        digests = [TDigest.from_values(v, compression) for v in day_values]
+        merged = TDigest.merge(digests)
+        exact_values = np.concatenate(day_values)
+        label = (f"{name}: {len(exact_values)} values, {sum(len(d.means) for d in digests)} stored centroids")
+        worst = max(worst, print_rows(label, errors(exact_values, merged.quantile(QUANTILES), QUANTILES)))
+
+        # Re-compressed merge (what a stored multi-day sketch would hold)
+        compact = TDigest.merge(digests, compression)
+        label = f"{name} (merged + compressed to {len(compact.means)} centroids)"
+        worst = max(worst, print_rows(label, errors(exact_values, compact.quantile(QUANTILES), QUANTILES)))
+    return worst
+
+
+def run_db(app_id: str, start: str, end: str, geo: str, media_source: str) -> float:
+    import pandas as pd
+
+    from sync_af_data import get_pg_connection, release_pg_connection, daterange
+    from cohort_sketches import load_cohort_values, window_quantiles
+
+    start_date = datetime.strptime(start, "%Y-%m-%d").date()
+    end_date = datetime.strptime(end, "%Y-%m-%d").date()
+    conn = get_pg_connection()
+    try:
+        with conn.cursor() as cur:
+            frame = load_cohort_values(cur, list(daterange(start_date, end_date)))
+        conn.rollback()
+    finally:
+        release_pg_connection(conn)
+
+    frame = frame[frame["app_id"] == app_id]
+    if geo:
+        frame = frame[frame["geo"] == geo]
+    if media_source:
+        frame = frame[frame["media_source"] == media_source]
+
+    sketched = window_quantiles(app_id, start_date, end_date, QUANTILES, geo=geo, media_source=media_source)
+    print(f"DB: {app_id} {start} ~ {end} geo={geo or 'ALL'} media_source={media_source or 'ALL'}")
+    worst = 0.0
+    for metric in SKETCH_METRICS:
+        values = pd.to_numeric(frame[metric], errors="coerce").dropna().to_numpy(dtype=float)
+        if metric not in sketched or len(values) == 0:
+            print(f"  {metric}: no data")
+            continue
+        estimates = [sketched[metric][f"p{q * 100:g}"] for q in QUANTILES]
+        label = f"{metric}: {len(values)} campaign-days, sketch count {sketched[metric]['sample_count']}"
+        worst = max(worst, print_rows(label, errors(values, estimates, QUANTILES)))
+    return worst
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Accuracy of merged cohort sketches against exact percentiles")
+    parser.add_argument("--days", type=int, default=180, help="Synthetic cohort days (default: 180)")
+    parser.add_argument("--campaigns", type=int, default=300, help="Max values per synthetic day (default: 300)")
+    parser.add_argument("--compression", type=int, default=SKETCH_COMPRESSION,
+                        help=f"Digest compression (default: {SKETCH_COMPRESSION})")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--db", action="store_true", help="Check stored sketches against the database instead")
+    parser.add_argument("--app-id")
+    parser.add_argument("--start", help="First install date (YYYY-MM-DD)")
+    parser.add_argument("--end", help="Last install date (YYYY-MM-DD)")
+    parser.add_argument("--geo")
+    parser.add_argument("--media-source")
+    parser.add_argument("--max-rank-error", type=float, default=0.01,
+                        help="Fail above this rank error (default: 0.01 = 1%%)")
+    args = parser.parse_args()
+
+    if args.db:
+        if not (args.app_id and args.start and args.end):
+            parser.error("--db needs --app-id, --start and --end")
+        worst = run_db(args.app_id, args.start, args.end, args.geo, args.media_source)
+    else:
+        worst = run_offline(args.days, args.campaigns, args.compression, args.seed)
+
+    ok = worst <= args.max_rank_error
+    print(f"Max rank error {worst:.4%} ({'OK' if ok else 'FAIL'}, limit {args.max_rank_error:.2%})")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
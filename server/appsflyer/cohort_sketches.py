@@ -0,0 +1,361 @@
+# cohort_sketches.py
+"""
+Mergeable Quantile Sketches per Cohort Day
+
+af_cohort_sketch keeps one t-digest per (app, geo, media source, install date,
+metric) over the campaign values of that cohort day:
+- roas_d3 / roas_d7: revenue of days 0..N / day-0 cost, campaigns with cost > 0
+- ret_d3 / ret_d7:   retention rate at day N
+
+The sketches are rebuilt inside the sync transaction for the install dates a
+write touched (upsert_events / upsert_cohort_kpi), so they follow the cohorts
+as they mature and never disagree with committed raw rows. Quantiles of any
+window and any level (one geo / media source, or all of them) come from
+merging the day sketches, about 180 small arrays for the baseline window,
+instead of scanning af_events and af_cohort_kpi_daily.
+
+The digest is a merging t-digest (k1 scale function) on NumPy arrays. A day
+keeps every value until it has more than AF_SKETCH_COMPRESSION of them, so
+small cohorts are exact; quantiles interpolate like percentile_cont.
+
+Usage:
+    python cohort_sketches.py rebuild --from-date 2026-04-01 --to-date 2026-10-01
+    python cohort_sketches.py query --app-id com.example.app --start 2026-03-01 --end 2026-04-01
+    python cohort_sketches.py query --app-id com.example.app --start 2026-03-01 --end 2026-04-01 \\
+        --geo US --quantiles 0.25,0.5
+"""
+
+import os
+import json
+import argparse
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+import psycopg2.extras
+
+from sync_af_data import get_pg_connection, release_pg_connection, daterange, logger
+
+SKETCH_COMPRESSION = int(os.getenv("AF_SKETCH_COMPRESSION", "200"))
+SKETCH_METRICS = ("roas_d3", "roas_d7", "ret_d3", "ret_d7")
+# Install dates per transaction for `rebuild`
+REBUILD_CHUNK_DAYS = 31
+
+# Per-campaign cohort values of the given install dates
+COHORT_VALUES_QUERY = """
+    WITH kpi AS (
+        SELECT
+            app_id,
+            geo,
+            media_source,
+            campaign,
+            install_date,
+            SUM(cost_usd) FILTER (WHERE days_since_install = 0) AS cost_usd,
+            MAX(retention_rate) FILTER (WHERE days_since_install = 3) AS ret_d3,
+            MAX(retention_rate) FILTER (WHERE days_since_install = 7) AS ret_d7
+        FROM af_cohort_kpi_daily
+        WHERE install_date = ANY(%(install_dates)s::date[])
+        GROUP BY app_id, geo, media_source, campaign, install_date
+    ),
+    revenue AS (
+        SELECT
+            app_id,
+            geo,
+            media_source,
+            campaign,
+            install_date,
+            SUM(total_revenue_usd) FILTER (WHERE days_since_install <= 3) AS revenue_d3,
+            SUM(total_revenue_usd) FILTER (WHERE days_since_install <= 7) AS revenue_d7
+        FROM af_revenue_cohort_daily
+        WHERE install_date = ANY(%(install_dates)s::date[])
+        GROUP BY app_id, geo, media_source, campaign, install_date
+    )
+    SELECT
+        k.app_id,
+        k.geo,
+        k.media_source,
+        k.install_date,
+        COALESCE(r.revenue_d3, 0) / NULLIF(k.cost_usd, 0) AS roas_d3,
+        COALESCE(r.revenue_d7, 0) / NULLIF(k.cost_usd, 0) AS roas_d7,
+        k.ret_d3,
+        k.ret_d7
+    FROM kpi k
+    LEFT JOIN revenue r USING (app_id, geo, media_source, campaign, install_date)
+    WHERE k.geo IS NOT NULL AND k.media_source IS NOT NULL
+"""
+
+SKETCH_COLUMNS = [
+    "app_id", "geo", "media_source", "install_date", "metric",
+    "centroid_means", "centroid_weights", "min_value", "max_value", "sample_count",
+]
+
+WINDOW_SKETCH_QUERY = """
+    SELECT metric, install_date, centroid_means, centroid_weights, min_value, max_value
+    FROM af_cohort_sketch
+    WHERE app_id = %(app_id)s
+      AND install_date BETWEEN %(start_date)s AND %(end_date)s
+      AND metric = ANY(%(metrics)s)
+      AND (%(geo)s::text IS NULL OR geo = %(geo)s::text)
+      AND (%(media_source)s::text IS NULL OR media_source = %(media_source)s::text)
+"""
+
+
+class TDigest:
+    """
+    Merging t-digest: centroid means (sorted) and weights plus the exact min / max.
+    """
+
+    __slots__ = ("means", "weights", "min", "max")
+
+    def __init__(self, means: np.ndarray, weights: np.ndarray, min_value: float, max_value: float):
+        self.means = np.asarray(means, dtype=float)
+        self.weights = np.asarray(weights, dtype=float)
+        self.min = float(min_value)
+        self.max = float(max_value)
+
+    @classmethod
+    def from_values(cls, values: Iterable[float], compression: int = SKETCH_COMPRESSION) -> Optional["TDigest"]:
+        """Digest of the finite values, None when there are none"""
+        values = np.asarray(values, dtype=float)
+        values = np.sort(values[np.isfinite(values)])
+        if len(values) == 0:
+            return None
+        return cls(values, np.ones(len(values)), values[0], values[-1]).compress(compression)
+
+    @classmethod
+    def merge(cls, digests: Sequence["TDigest"], compression: Optional[int] = None) -> Optional["TDigest"]:
+        """
+        Union of the digests; compression=None keeps every centroid (ad-hoc
+        queries: a window holds at most days x compression centroids).
+        """
+        digests = [d for d in digests if d is not None and len(d.means)]
+        if not digests:
+            return None
+        means = np.concatenate([d.means for d in digests])
+        weights = np.concatenate([d.weights for d in digests])
+        order = np.argsort(means, kind="stable")
+        merged = cls(means[order], weights[order], min(d.min for d in digests), max(d.max for d in digests))
+        return merged.compress(compression) if compression else merged
+
+    @property
+    def count(self) -> float:
+        return float(self.weights.sum())
+
+    def compress(self, compression: int) -> "TDigest":
+        """
+        Merge neighbouring centroids whose midpoint quantiles fall in the same
+        unit of the k1 scale k(q) = compression / (2 pi) * asin(2q - 1): small
+        clusters near the tails, large ones around the median.
+        """
+        if len(self.means) <= compression:
+            return self
+        total = self.weights.sum()
+        q_mid = (np.cumsum(self.weights) - self.weights / 2) / total
+        k = compression / (2 * np.pi) * np.arcsin(np.clip(2 * q_mid - 1, -1.0, 1.0))
+        _, cluster = np.unique(np.floor(k + compression / 4).astype(np.int64), return_inverse=True)
+        weights = np.bincount(cluster, weights=self.weights)
+        means = np.bincount(cluster, weights=self.means * self.weights) / weights
+        return TDigest(means, weights, self.min, self.max)
+
+    def quantile(self, q):
+        """
+        Interpolated quantile(s), percentile_cont semantics: a centroid of
+        weight w covering ranks [r, r + w - 1] sits at its middle rank, and
+        the target rank is q * (count - 1). Exact while uncompressed.
+        """
+        total = self.weights.sum()
+        positions = np.cumsum(self.weights) - (self.weights + 1) / 2
+        xp = np.concatenate(([0.0], positions, [total - 1]))
+        fp = np.concatenate(([self.min], self.means, [self.max]))
+        return np.interp(np.asarray(q, dtype=float) * (total - 1), xp, fp)
+
+    @classmethod
+    def from_row(cls, means, weights, min_value, max_value) -> "TDigest":
+        return cls(np.asarray(means, dtype=float), np.asarray(weights, dtype=float), min_value, max_value)
+
+
+def load_cohort_values(cur, install_dates: Sequence[date]) -> pd.DataFrame:
+    """Per-campaign ROAS / retention values of the install dates"""
+    cur.execute(COHORT_VALUES_QUERY, {"install_dates": list(install_dates)})
+    columns = [c[0] for c in cur.description]
+    frame = pd.DataFrame(cur.fetchall(), columns=columns)
+    for metric in SKETCH_METRICS:
+        frame[metric] = pd.to_numeric(frame[metric], errors="coerce").astype(float)
+    return frame
+
+
+def build_day_sketches(frame: pd.DataFrame, compression: int = SKETCH_COMPRESSION) -> List[List[Any]]:
+    """af_cohort_sketch rows (SKETCH_COLUMNS order) for every cohort day and metric with values"""
+    rows = []
+    if frame.empty:
+        return rows
+    for (app_id, geo, media_source, install_date), group in frame.groupby(
+        ["app_id", "geo", "media_source", "install_date"], sort=False
+    ):
+        for metric in SKETCH_METRICS:
+            digest = TDigest.from_values(group[metric].to_numpy(), compression)
+            if digest is None:
+                continue
+            rows.append([
+                app_id, geo, media_source, install_date, metric,
+                digest.means.tolist(), digest.weights.tolist(), digest.min, digest.max, int(digest.count),
+            ])
+    return rows
+
+
+def refresh_cohort_sketches(cur, install_dates: Iterable[date], compression: int = SKETCH_COMPRESSION) -> int:
+    """
+    Rebuild the sketches of the install dates on the writer's cursor, so they
+    commit (or roll back) together with the raw rows that changed them.
+
+    Writers touching the same install date are serialised with a per-date
+    advisory lock; the values are read after the lock, so the last committer
+    sees everyone else's rows. Returns the number of sketch rows written.
+    """
+    dates = sorted(set(install_dates))
+    if not dates:
+        return 0
+
+    cur.execute(
+        """
+        SELECT pg_advisory_xact_lock(hashtext('af_cohort_sketch'), d - DATE '2000-01-01')
+        FROM (SELECT d FROM unnest(%s::date[]) AS d ORDER BY d) locked
+        """,
+        (dates,),
+    )
+    rows = build_day_sketches(load_cohort_values(cur, dates), compression)
+
+    cur.execute("DELETE FROM af_cohort_sketch WHERE install_date = ANY(%s::date[])", (dates,))
+    if rows:
+        psycopg2.extras.execute_values(
+            cur,
+            f"INSERT INTO af_cohort_sketch ({', '.join(SKETCH_COLUMNS)}) VALUES %s",
+            rows,
+            page_size=1000,
+        )
+    return len(rows)
+
+
+def rebuild_cohort_sketches(start_date: date, end_date: date, compression: int = SKETCH_COMPRESSION) -> int:
+    """Rebuild the sketches of [start_date, end_date] from stored cohort data (one transaction per chunk)"""
+    dates = list(daterange(start_date, end_date))
+    written = 0
+    for i in range(0, len(dates), REBUILD_CHUNK_DAYS):
+        chunk = dates[i:i + REBUILD_CHUNK_DAYS]
+        conn = get_pg_connection()
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    written += refresh_cohort_sketches(cur, chunk, compression)
+        finally:
+            release_pg_connection(conn)
+        logger.info(f"Cohort sketches {chunk[0]} ~ {chunk[-1]}: {written} rows so far")
+    return written
+
+
+def _dimension(value: Optional[str]) -> Optional[str]:
+    """'ALL' (baseline_metrics convention) and empty mean every value"""
+    return None if not value or value == "ALL" else value
+
+
+def window_quantiles(
+    app_id: str,
+    start_date: date,
+    end_date: date,
+    quantiles: Sequence[float] = (0.25, 0.5),
+    geo: Optional[str] = None,
+    media_source: Optional[str] = None,
+    metrics: Sequence[str] = SKETCH_METRICS,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Quantiles of campaign-day values over an install-date window, merged
+    from the day sketches.
+
+    Args:
+        geo / media_source: One value, or None / 'ALL' for every value
+        quantiles: Fractions (0.5 = P50)
+
+    Returns:
+        {metric: {"p25": v, "p50": v, ..., "sample_count": n, "days": n}};
+        metrics without sketches in the window are omitted
+    """
+    params = {
+        "app_id": app_id,
+        "start_date": start_date,
+        "end_date": end_date,
+        "metrics": list(metrics),
+        "geo": _dimension(geo),
+        "media_source": _dimension(media_source),
+    }
+    conn = get_pg_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(WINDOW_SKETCH_QUERY, params)
+            rows = cur.fetchall()
+        conn.rollback()
+    finally:
+        release_pg_connection(conn)
+
+    by_metric: Dict[str, List[tuple]] = {}
+    for metric, install_date, means, weights, min_value, max_value in rows:
+        by_metric.setdefault(metric, []).append((install_date, TDigest.from_row(means, weights, min_value, max_value)))
+
+    result = {}
+    for metric in metrics:
+        entries = by_metric.get(metric)
+        if not entries:
+            continue
+        digest = TDigest.merge([d for _, d in entries])
+        values = digest.quantile(quantiles)
+        summary = {f"p{q * 100:g}": float(v) for q, v in zip(quantiles, values)}
+        summary["sample_count"] = int(digest.count)
+        summary["days"] = len({install_date for install_date, _ in entries})
+        result[metric] = summary
+    return result
+
+
+def _date(value: str) -> date:
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-cohort-day quantile sketches (t-digest)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    rebuild = sub.add_parser("rebuild", help="Rebuild sketches from stored cohort data")
+    rebuild.add_argument("--from-date", dest="from_date", required=True, help="First install date (YYYY-MM-DD)")
+    rebuild.add_argument("--to-date", dest="to_date", default=None, help="Last install date (default: yesterday)")
+    rebuild.add_argument("--compression", type=int, default=SKETCH_COMPRESSION,
+                         help=f"Max centroids kept exact per day (default: {SKETCH_COMPRESSION})")
+
+    query = sub.add_parser("query", help="Quantiles of an install-date window")
+    query.add_argument("--app-id", required=True)
+    query.add_argument("--start", required=True, help="First install date (YYYY-MM-DD)")
+    query.add_argument("--end", required=True, help="Last install date (YYYY-MM-DD)")
+    query.add_argument("--geo", help="One geo (default: all)")
+    query.add_argument("--media-source", help="One media source (default: all)")
+    query.add_argument("--quantiles", default="0.25,0.5", help="Comma-separated fractions (default: 0.25,0.5)")
+    query.add_argument("--metrics", default=",".join(SKETCH_METRICS), help="Comma-separated metrics")
+
+    args = parser.parse_args()
+
+    if args.command == "rebuild":
+        end = _date(args.to_date) if args.to_date else date.today() - timedelta(days=1)
+        written = rebuild_cohort_sketches(_date(args.from_date), end, args.compression)
+        logger.info(f"Rebuilt {written} cohort sketches")
+    else:
+        result = window_quantiles(
+            args.app_id,
+            _date(args.start),
+            _date(args.end),
+            quantiles=[float(q) for q in args.quantiles.split(",") if q.strip()],
+            geo=args.geo,
+            media_source=args.media_source,
+            metrics=[m for m in args.metrics.split(",") if m.strip()],
+        )
+        print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -14,13 +14,32 @@ Usage:
             error_message='API rate limit exceeded',
             records_processed=0
         )
+
+Digest mode (SMTP_DIGEST_WINDOW > 0, default 60s):
+    queue_failure_notification(...) returns immediately; failures arriving within
+    the window are coalesced into one digest email, sent by a background thread
+    over a reused SMTP connection. Pending failures are flushed on interpreter exit.
+    SMTP_DIGEST_WINDOW=0 sends synchronously, one email per failure (old behaviour).
+
+Local SMTP sink for testing:
+    python email_notifier.py sink --port 1025
+    SMTP_HOST=localhost SMTP_PORT=1025 SMTP_STARTTLS=false SMTP_FROM=a@x SMTP_TO=b@x ...
 """
 
 import os
+import sys
+import html
+import queue
+import atexit
 import smtplib
+import argparse
+import threading
+import time
+import socketserver
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime
+from typing import Dict, List, Optional
 import logging
 
 logger = logging.getLogger(__name__)
@@ -38,6 +57,8 @@ def get_smtp_config() -> dict:
         - password: SMTP password
         - from_addr: Sender email address
         - to_addr: Recipient email address
+        - starttls: Whether to upgrade with STARTTLS (default true; false for a local sink)
+        - digest_window: Seconds to coalesce failures into one digest (0 = send immediately)
     """
     return {
         'host': os.getenv('SMTP_HOST'),
@@ -46,45 +67,49 @@ def get_smtp_config() -> dict:
         'password': os.getenv('SMTP_PASSWORD'),
         'from_addr': os.getenv('SMTP_FROM'),
         'to_addr': os.getenv('SMTP_TO'),
+        'starttls': os.getenv('SMTP_STARTTLS', 'true').lower() in ('true', '1', 'yes'),
+        'digest_window': float(os.getenv('SMTP_DIGEST_WINDOW', '60')),
     }
 
 
 def is_email_configured() -> bool:
     """
     Check if all required email configuration is present.
+    SMTP_USER / SMTP_PASSWORD may be omitted for servers without auth (e.g. the local sink).
 
     Returns:
         True if all required SMTP settings are configured, False otherwise.
     """
     config = get_smtp_config()
-    required = ['host', 'user', 'password', 'from_addr', 'to_addr']
+    required = ['host', 'from_addr', 'to_addr']
     return all(config.get(key) for key in required)
 
 
-def send_failure_notification(
+def open_smtp_connection(config: dict) -> smtplib.SMTP:
+    """
+    Connect, STARTTLS (unless disabled) and log in (if credentials are set).
+    """
+    server = smtplib.SMTP(config['host'], config['port'], timeout=30)
+    try:
+        if config['starttls']:
+            server.starttls()
+        if config['user']:
+            server.login(config['user'], config['password'] or '')
+    except Exception:
+        server.close()
+        raise
+    return server
+
+
+def build_failure_message(
     sync_type: str,
     date_range: str,
     error_message: str,
     records_processed: int = 0
-) -> bool:
+) -> MIMEMultipart:
     """
-    Send email notification when AppsFlyer sync fails.
-
-    Args:
-        sync_type: Type of sync that failed ('events', 'cohort_kpi', 'baseline')
-        date_range: Date range that was being synced
-        error_message: Error message from the failure
-        records_processed: Number of records processed before failure
-
-    Returns:
-        True if email was sent successfully, False otherwise.
+    Build the single-failure email (headers are set by the sender).
     """
-    if not is_email_configured():
-        logger.warning("Email not configured, skipping notification")
-        return False
-
-    config = get_smtp_config()
-
     subject = f"[MonitorSysUA] AppsFlyer {sync_type} Sync Failed"
 
     html_body = f"""
@@ -172,15 +197,43 @@ Next Steps:
 
     msg = MIMEMultipart('alternative')
     msg['Subject'] = subject
-    msg['From'] = config['from_addr']
-    msg['To'] = config['to_addr']
     msg.attach(MIMEText(text_body, 'plain'))
     msg.attach(MIMEText(html_body, 'html'))
+    return msg
+
+
+
+def send_failure_notification(
+    sync_type: str,
+    date_range: str,
+    error_message: str,
+    records_processed: int = 0
+) -> bool:
+    """
+    Send email notification when AppsFlyer sync fails.
+
+    Blocks on SMTP; sync code should prefer queue_failure_notification.
+
+    Args:
+        sync_type: Type of sync that failed ('events', 'cohort_kpi', 'baseline')
+        date_range: Date range that was being synced
+        error_message: Error message from the failure
+        records_processed: Number of records processed before failure
+
+    Returns:
+        True if email was sent successfully, False otherwise.
+    """
+    if not is_email_configured():
+        logger.warning("Email not configured, skipping notification")
+        return False
+
+    config = get_smtp_config()
+    msg = build_failure_message(sync_type, date_range, error_message, records_processed)
+    msg['From'] = config['from_addr']
+    msg['To'] = config['to_addr']
 
     try:
-        with smtplib.SMTP(config['host'], config['port']) as server:
-            server.starttls()
-            server.login(config['user'], config['password'])
+        with open_smtp_connection(config) as server:
             server.send_message(msg)
         logger.info(f"Failure notification sent to {config['to_addr']}")
         return True
@@ -263,11 +316,357 @@ def send_success_notification(
     msg.attach(MIMEText(html_body, 'html'))
 
     try:
-        with smtplib.SMTP(config['host'], config['port']) as server:
-            server.starttls()
-            server.login(config['user'], config['password'])
+        with open_smtp_connection(config) as server:
             server.send_message(msg)
         return True
     except Exception as e:
         logger.error(f"Failed to send success notification: {e}")
         return False
+
+
+# =============================================================================
+# Digest mode: non-blocking queue + coalesced failure emails
+# =============================================================================
+
+def build_digest_message(failures: List[Dict]) -> MIMEMultipart:
+    """
+    Build one email covering several failures (a single failure uses the normal layout).
+    """
+    if len(failures) == 1:
+        f = failures[0]
+        return build_failure_message(f['sync_type'], f['date_range'], f['error_message'], f['records_processed'])
+
+    sync_types = sorted({f['sync_type'] for f in failures})
+    subject = f"[MonitorSysUA] AppsFlyer Sync Failed: {len(failures)} failures ({', '.join(sync_types)})"
+
+    rows_html = "\n".join(
+        f"""            <tr>
+                <td>{f['failed_at']}</td>
+                <td>{html.escape(f['sync_type'])}</td>
+                <td>{html.escape(f['date_range'])}</td>
+                <td>{f['records_processed']:,}</td>
+                <td class="error"><pre>{html.escape(f['error_message'])}</pre></td>
+            </tr>"""
+        for f in failures
+    )
+    html_body = f"""
+<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <style>
+        body {{ font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif; line-height: 1.6; color: #333; }}
+        .container {{ max-width: 900px; margin: 0 auto; padding: 20px; }}
+        h2 {{ color: #d32f2f; margin-bottom: 20px; }}
+        table {{ border-collapse: collapse; width: 100%; margin-bottom: 20px; }}
+        th {{ background: #f5f5f5; text-align: left; }}
+        th, td {{ padding: 8px; border: 1px solid #e0e0e0; vertical-align: top; }}
+        .error {{ color: #d32f2f; }}
+        pre {{ margin: 0; white-space: pre-wrap; word-wrap: break-word; }}
+        .footer {{ color: #666; font-size: 14px; margin-top: 20px; padding-top: 20px; border-top: 1px solid #e0e0e0; }}
+        code {{ background: #e8e8e8; padding: 2px 6px; border-radius: 3px; font-family: monospace; }}
+    </style>
+</head>
+<body>
+    <div class="container">
+        <h2>AppsFlyer Sync Failed ({len(failures)} failures)</h2>
+        <table>
+            <tr><th>Time (UTC)</th><th>Sync Type</th><th>Date Range</th><th>Records</th><th>Error</th></tr>
+{rows_html}
+        </table>
+        <div class="footer">
+            <p><strong>Next Steps:</strong></p>
+            <ul>
+                <li>Check container logs: <code>just af-docker-logs</code></li>
+                <li>View sync log: <code>just af-docker-sync-logs</code></li>
+                <li>Check database: <code>just af-status</code></li>
+            </ul>
+        </div>
+    </div>
+</body>
+</html>
+"""
+
+    text_body = f"AppsFlyer Sync Failed ({len(failures)} failures)\n\n" + "\n\n".join(
+        f"[{f['failed_at']}] {f['sync_type']} {f['date_range']} (records: {f['records_processed']:,})\n{f['error_message']}"
+        for f in failures
+    ) + "\n\nNext Steps:\n- Check container logs: just af-docker-logs\n- View sync log: just af-docker-sync-logs\n"
+
+    msg = MIMEMultipart('alternative')
+    msg['Subject'] = subject
+    msg.attach(MIMEText(text_body, 'plain'))
+    msg.attach(MIMEText(html_body, 'html'))
+    return msg
+
+
+class FailureDigestNotifier:
+    """
+    Background sender for failure notifications.
+
+    notify() only enqueues. The worker thread waits `window` seconds after the first
+    failure of a batch, collects everything that arrived meanwhile (up to max_batch)
+    and sends one digest over a kept-open SMTP connection, reconnecting if the
+    server dropped it. The connection is closed after `idle_close` seconds without mail.
+    """
+
+    def __init__(self, window: float, max_batch: int = 50, idle_close: float = 120.0):
+        self.window = window
+        self.max_batch = max_batch
+        self.idle_close = idle_close
+        self._queue: "queue.Queue[Dict]" = queue.Queue()
+        self._flush_requested = threading.Event()
+        self._stopped = threading.Event()
+        self._smtp: Optional[smtplib.SMTP] = None
+        self._last_sent = 0.0
+        self.sent_emails = 0
+        self.sent_failures = 0
+        self._thread = threading.Thread(target=self._run, name="failure-digest", daemon=True)
+        self._thread.start()
+
+    def notify(self, sync_type: str, date_range: str, error_message: str, records_processed: int = 0) -> None:
+        self._queue.put({
+            'sync_type': sync_type,
+            'date_range': date_range,
+            'error_message': error_message,
+            'records_processed': records_processed,
+            'failed_at': datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
+        })
+
+    def flush(self, timeout: float = 30.0) -> bool:
+        """
+        Send whatever is queued now and wait for it. Returns False on timeout.
+        """
+        deadline = time.monotonic() + timeout
+        self._flush_requested.set()
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return not self._queue.unfinished_tasks
+
+    def close(self, timeout: float = 30.0) -> None:
+        self.flush(timeout)
+        self._stopped.set()
+        self._thread.join(timeout=5)
+        self._disconnect()
+
+    # -- worker ---------------------------------------------------------------
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                first = self._queue.get(timeout=1.0)
+            except queue.Empty:
+                if self._smtp is not None and time.monotonic() - self._last_sent > self.idle_close:
+                    self._disconnect()
+                if self._flush_requested.is_set() and not self._queue.unfinished_tasks:
+                    self._flush_requested.clear()
+                continue
+
+            batch = [first]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch and not self._flush_requested.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=min(remaining, 0.25)))
+                except queue.Empty:
+                    continue
+            # Drain what is already queued (flush or full window)
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                self._send(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if self._queue.empty():
+                self._flush_requested.clear()
+
+    def _disconnect(self) -> None:
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass
+            self._smtp = None
+
+    def _send(self, batch: List[Dict]) -> None:
+        config = get_smtp_config()
+        msg = build_digest_message(batch)
+        msg['From'] = config['from_addr']
+        msg['To'] = config['to_addr']
+
+        for attempt in (1, 2):
+            try:
+                if self._smtp is None:
+                    self._smtp = open_smtp_connection(config)
+                self._smtp.send_message(msg)
+                self._last_sent = time.monotonic()
+                self.sent_emails += 1
+                self.sent_failures += len(batch)
+                logger.info(f"Failure digest ({len(batch)} failures) sent to {config['to_addr']}")
+                return
+            except smtplib.SMTPServerDisconnected as e:
+                # Kept-open connection timed out on the server side; reconnect once
+                self._smtp = None
+                if attempt == 2:
+                    logger.error(f"SMTP error sending failure digest: {e}")
+            except Exception as e:
+                self._disconnect()
+                logger.error(f"Failed to send failure digest ({len(batch)} failures): {e}")
+                return
+
+
+_NOTIFIER: Optional[FailureDigestNotifier] = None
+_NOTIFIER_LOCK = threading.Lock()
+
+
+def get_failure_notifier() -> FailureDigestNotifier:
+    global _NOTIFIER
+    with _NOTIFIER_LOCK:
+        if _NOTIFIER is None:
+            _NOTIFIER = FailureDigestNotifier(window=get_smtp_config()['digest_window'])
+            atexit.register(flush_failure_notifications)
+        return _NOTIFIER
+
+
+def queue_failure_notification(
+    sync_type: str,
+    date_range: str,
+    error_message: str,
+    records_processed: int = 0
+) -> bool:
+    """
+    Non-blocking failure notification (digest mode); falls back to
+    send_failure_notification when SMTP_DIGEST_WINDOW is 0.
+
+    Returns:
+        True if the notification was queued or sent, False if email is not configured.
+    """
+    if not is_email_configured():
+        logger.warning("Email not configured, skipping notification")
+        return False
+    if get_smtp_config()['digest_window'] <= 0:
+        return send_failure_notification(sync_type, date_range, error_message, records_processed)
+    get_failure_notifier().notify(sync_type, date_range, error_message, records_processed)
+    return True
+
+
+def flush_failure_notifications(timeout: float = 30.0) -> None:
+    """
+    Send queued failures now and close the SMTP connection (registered with atexit).
+    """
+    global _NOTIFIER
+    with _NOTIFIER_LOCK:
+        notifier, _NOTIFIER = _NOTIFIER, None
+    if notifier is not None:
+        notifier.close(timeout)
+
+
+# =============================================================================
+# Local SMTP sink (testing)
+# =============================================================================
+
+class _SinkHandler(socketserver.StreamRequestHandler):
+    """
+    Minimal SMTP server: accepts every message and prints it (or writes it to --out-dir).
+    No TLS, no auth - use with SMTP_STARTTLS=false and empty SMTP_USER.
+    """
+
+    def _reply(self, line: str) -> None:
+        self.wfile.write((line + "\r\n").encode("utf-8"))
+
+    def handle(self):
+        self._reply("220 localhost MonitorSysUA SMTP sink")
+        mail_from, rcpt_to = None, []
+        while True:
+            raw = self.rfile.readline()
+            if not raw:
+                return
+            line = raw.decode("utf-8", "replace").rstrip("\r\n")
+            verb = line.split(" ", 1)[0].upper()
+            if verb in ("EHLO", "HELO"):
+                self._reply("250 localhost")
+            elif verb == "MAIL":
+                mail_from, rcpt_to = line[10:].strip(), []
+                self._reply("250 OK")
+            elif verb == "RCPT":
+                rcpt_to.append(line[8:].strip())
+                self._reply("250 OK")
+            elif verb == "DATA":
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                while True:
+                    data_line = self.rfile.readline().decode("utf-8", "replace")
+                    if data_line in (".\r\n", ".\n", ""):
+                        break
+                    lines.append(data_line[1:] if data_line.startswith("..") else data_line)
+                self.server.deliver(mail_from, rcpt_to, "".join(lines))
+                self._reply("250 OK: queued")
+            elif verb in ("RSET", "NOOP"):
+                self._reply("250 OK")
+            elif verb == "QUIT":
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("502 Command not implemented")
+
+
+class SmtpSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, out_dir: Optional[str] = None):
+        super().__init__(address, _SinkHandler)
+        self.out_dir = out_dir
+        self.messages: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def deliver(self, mail_from: str, rcpt_to: List[str], data: str) -> None:
+        with self._lock:
+            self.messages.append({'from': mail_from, 'to': rcpt_to, 'data': data})
+            count = len(self.messages)
+        subject = next((l[9:].strip() for l in data.splitlines() if l.startswith("Subject: ")), "")
+        print(f"[sink] #{count} {mail_from} -> {', '.join(rcpt_to)}: {subject}", flush=True)
+        if self.out_dir:
+            os.makedirs(self.out_dir, exist_ok=True)
+            with open(os.path.join(self.out_dir, f"{count:05d}.eml"), "w") as f:
+                f.write(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Email notifier utilities")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sink = sub.add_parser("sink", help="Run a local SMTP sink that accepts and prints all mail")
+    sink.add_argument("--host", default="127.0.0.1")
+    sink.add_argument("--port", type=int, default=1025)
+    sink.add_argument("--out-dir", help="Also write each message to <out-dir>/<n>.eml")
+
+    test = sub.add_parser("test", help="Queue N fake failures through the configured SMTP server")
+    test.add_argument("-n", type=int, default=3)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.command == "sink":
+        server = SmtpSink((args.host, args.port), args.out_dir)
+        print(f"SMTP sink listening on {args.host}:{args.port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+    elif args.command == "test":
+        for i in range(args.n):
+            queue_failure_notification('test', f'failure {i + 1}/{args.n}', 'Synthetic failure from email_notifier.py test')
+        flush_failure_notifications()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -8,12 +8,6 @@ echo "Timezone: $(cat /etc/timezone)"
 echo "Current time: $(date)"
 echo ""
 
-# Export environment variables for cron
-# Cron runs in a minimal environment and doesn't inherit Docker env vars
-echo "Exporting environment variables for cron..."
-printenv | grep -E '^(AF_|PG_|SMTP_|DATABASE_|TZ)' > /etc/environment
-echo "Environment variables exported."
-
 # Wait for PostgreSQL to be ready
 echo ""
 echo "Waiting for PostgreSQL..."
@@ -42,24 +36,25 @@ else
     echo "WARNING: Could not verify database connection, but proceeding anyway."
 fi
 
-# Display cron schedule
+# Display job schedule
 echo ""
 echo "============================================"
-echo "Cron Schedule (UTC):"
+echo "Job Schedule (UTC):"
 echo "============================================"
-echo "Daily sync:    0 2 * * *  (2:00 AM UTC daily)"
-echo "Baseline:      0 3 1 * *  (3:00 AM UTC, 1st of month)"
+python /app/scheduler.py list
 echo ""
 
-# Display next scheduled runs
-echo "Container is ready and cron daemon will start."
 echo "Logs available at:"
+echo "  - docker logs appsflyer-etl (all jobs)"
 echo "  - /var/log/appsflyer/daily-sync.log"
 echo "  - /var/log/appsflyer/baseline-update.log"
 echo ""
+echo "Trigger a job manually:"
+echo "  docker exec appsflyer-etl python scheduler.py trigger daily_sync"
+echo ""
 echo "============================================"
-echo "Starting cron daemon in foreground..."
+echo "Starting job scheduler in foreground..."
 echo "============================================"
 
-# Start cron in foreground mode
-exec cron -f
+# Start the long-running scheduler (keeps DB pool and HTTP session warm between jobs)
+exec python /app/scheduler.py daemon
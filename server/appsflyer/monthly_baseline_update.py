@@ -10,25 +10,49 @@ This refreshes historical cohort KPI data because:
 2. Ensures data completeness for baseline safety calculations
 3. Catches any missed daily syncs
 
+Retention D1/D3/D5/D7 stops changing about a week after install, so the update
+is planned per install date instead of re-fetching the whole window:
+- maturing: still inside the settle horizon, values may change
+- finalize: matured, but last written before it matured (final values not captured yet)
+- missing:  no rows at all (missed daily sync)
+- audit:    a small deterministic sample of settled dates, to catch late restatements
+Everything else is skipped. Use --full for the old behaviour.
+
+After the refresh, baseline_metrics percentiles are recomputed from the cohort
+data (baseline_metrics.py); --no-baseline-metrics skips that step.
+
 Usage:
-    python monthly_baseline_update.py              # Full 180-day refresh
+    python monthly_baseline_update.py              # Planned refresh of the 180-day window
     python monthly_baseline_update.py --days 30   # Custom day range
+    python monthly_baseline_update.py --full      # Re-fetch every install date
+    python monthly_baseline_update.py --dry-run   # Show the plan only
+    python monthly_baseline_update.py --no-baseline-metrics  # Cohort refresh only
 """
 
 import os
+import random
 import argparse
 import logging
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta, date
+from typing import Dict, List
 
 from dotenv import load_dotenv
 
 # Import sync functions from main module
 from sync_af_data import (
+    AF_APP_ID,
+    AF_MEDIA_SOURCE_DEFAULT,
+    AF_GEO_DEFAULT,
     sync_cohort_kpi,
     create_sync_log,
     update_sync_log,
+    get_pg_connection,
+    release_pg_connection,
+    daterange,
     logger,
 )
+from baseline_metrics import compute_baseline_metrics
 
 # Email notification (optional - import with fallback)
 try:
@@ -54,19 +78,170 @@ logging.basicConfig(
 # Load environment variables
 load_dotenv()
 
+# Days after install until D1/D3/D5/D7 retention is final (D7 + AppsFlyer processing lag)
+SETTLE_DAYS_DEFAULT = int(os.getenv("AF_COHORT_SETTLE_DAYS", "10"))
+# Share of settled install dates re-fetched anyway to catch late restatements
+AUDIT_FRACTION_DEFAULT = float(os.getenv("AF_COHORT_AUDIT_FRACTION", "0.05"))
+
+
+# -----------------------------------------------------------------------------
+# Refresh Planner
+# -----------------------------------------------------------------------------
+
+@dataclass
+class RefreshPlan:
+    maturing: List[date] = field(default_factory=list)
+    finalize: List[date] = field(default_factory=list)
+    missing: List[date] = field(default_factory=list)
+    audit: List[date] = field(default_factory=list)
+    skipped: int = 0
 
-def run_baseline_update(days: int = 180) -> int:
+    @property
+    def dates(self) -> List[date]:
+        return sorted(set(self.maturing + self.finalize + self.missing + self.audit))
+
+    def summary(self) -> Dict[str, int]:
+        return {
+            "maturing": len(self.maturing),
+            "finalize": len(self.finalize),
+            "missing": len(self.missing),
+            "audit": len(self.audit),
+            "skipped": self.skipped,
+        }
+
+
+def load_cohort_refresh_state(
+    start_date: date,
+    end_date: date,
+    media_source: str = AF_MEDIA_SOURCE_DEFAULT,
+    geo: str = AF_GEO_DEFAULT,
+) -> Dict[date, datetime]:
+    """
+    Latest time each install date in af_cohort_kpi_daily was known to be fetched:
+    last_refreshed_at (values last changed) or settled_at, whichever is later.
+    """
+    conn = get_pg_connection()
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT install_date, MAX(GREATEST(last_refreshed_at, settled_at))
+                    FROM af_cohort_kpi_daily
+                    WHERE app_id = %s AND geo = %s AND media_source = %s
+                      AND install_date BETWEEN %s AND %s
+                    GROUP BY install_date
+                """, (AF_APP_ID, geo, media_source, start_date, end_date))
+                return {row[0]: row[1] for row in cur.fetchall()}
+    finally:
+        release_pg_connection(conn)
+
+
+def plan_cohort_refresh(
+    start_date: date,
+    end_date: date,
+    refresh_state: Dict[date, datetime],
+    today: date,
+    settle_days: int = SETTLE_DAYS_DEFAULT,
+    audit_fraction: float = AUDIT_FRACTION_DEFAULT,
+) -> RefreshPlan:
+    """
+    Decide which install dates need re-fetching (see module docstring).
+
+    The audit sample is seeded by `today`, so re-running the same day yields the same plan.
+    """
+    plan = RefreshPlan()
+    settled: List[date] = []
+
+    for d in daterange(start_date, end_date):
+        last_refreshed = refresh_state.get(d)
+        settle_date = d + timedelta(days=settle_days)
+        if last_refreshed is None:
+            plan.missing.append(d)
+        elif today <= settle_date:
+            plan.maturing.append(d)
+        elif last_refreshed.date() < settle_date:
+            plan.finalize.append(d)
+        else:
+            settled.append(d)
+
+    if settled and audit_fraction > 0:
+        sample_size = min(len(settled), max(1, round(len(settled) * audit_fraction)))
+        plan.audit = sorted(random.Random(today.toordinal()).sample(settled, sample_size))
+    plan.skipped = len(settled) - len(plan.audit)
+    return plan
+
+
+def mark_cohorts_settled(
+    install_dates: List[date],
+    settle_days: int,
+    media_source: str = AF_MEDIA_SOURCE_DEFAULT,
+    geo: str = AF_GEO_DEFAULT,
+) -> int:
+    """
+    Record that matured install dates were fetched after their settle date.
+
+    The change-aware upsert leaves unchanged rows untouched, so without this a cohort
+    whose final values equal its early values would be planned for 'finalize' forever.
+    Stamps settled_at rather than last_refreshed_at, which keeps meaning "values last
+    changed"; each row is stamped at most once in its lifetime.
+    """
+    if not install_dates:
+        return 0
+    conn = get_pg_connection()
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE af_cohort_kpi_daily
+                    SET settled_at = NOW()
+                    WHERE app_id = %s AND geo = %s AND media_source = %s
+                      AND install_date = ANY(%s)
+                      AND settled_at IS NULL
+                      AND last_refreshed_at < install_date + %s
+                """, (AF_APP_ID, geo, media_source, list(install_dates), settle_days))
+                return cur.rowcount
+    finally:
+        release_pg_connection(conn)
+
+
+def contiguous_ranges(dates: List[date]) -> List[tuple]:
+    """
+    [d1, d2, d3, d7] -> [(d1, d3), (d7, d7)]
+    """
+    ranges = []
+    for d in sorted(dates):
+        if ranges and d == ranges[-1][1] + timedelta(days=1):
+            ranges[-1] = (ranges[-1][0], d)
+        else:
+            ranges.append((d, d))
+    return ranges
+
+
+def run_baseline_update(
+    days: int = 180,
+    full: bool = False,
+    settle_days: int = SETTLE_DAYS_DEFAULT,
+    audit_fraction: float = AUDIT_FRACTION_DEFAULT,
+    dry_run: bool = False,
+    compute_metrics: bool = True,
+) -> int:
     """
     Run the baseline update for the specified number of days.
 
     Args:
         days: Number of days to refresh (default 180)
+        full: Re-fetch every install date instead of following the refresh plan
+        settle_days: Days after install until cohort retention is considered final
+        audit_fraction: Share of settled install dates re-fetched as an audit
+        dry_run: Log the refresh plan without fetching anything
+        compute_metrics: Recompute baseline_metrics percentiles after the refresh
 
     Returns:
         Total number of records processed
     """
     # Calculate date range
-    end_date = date.today() - timedelta(days=1)  # Yesterday
+    today = date.today()
+    end_date = today - timedelta(days=1)  # Yesterday
     start_date = end_date - timedelta(days=days - 1)  # N days back
 
     from_date = start_date.strftime('%Y-%m-%d')
@@ -79,12 +254,38 @@ def run_baseline_update(days: int = 180) -> int:
     logger.info(f"Date range: {date_range}")
     logger.info("=" * 60)
 
+    if full:
+        plan = RefreshPlan(maturing=list(daterange(start_date, end_date)))
+        logger.info("Mode: full refresh")
+    else:
+        plan = plan_cohort_refresh(
+            start_date, end_date, load_cohort_refresh_state(start_date, end_date),
+            today=today, settle_days=settle_days, audit_fraction=audit_fraction,
+        )
+        logger.info(f"Refresh plan (settle horizon {settle_days}d): {plan.summary()}")
+        logger.info(f"Install dates to fetch: {len(plan.dates)} of {days}")
+
+    if dry_run:
+        for range_start, range_end in contiguous_ranges(plan.dates):
+            logger.info(f"  would fetch {range_start} ~ {range_end}")
+        return 0
+
     # Create sync log entry
     log_id = create_sync_log("baseline_update", start_date, end_date)
 
     try:
-        # Sync cohort KPI data for the full range
-        records = sync_cohort_kpi(from_date, to_date)
+        records = 0
+        for range_start, range_end in contiguous_ranges(plan.dates):
+            records += sync_cohort_kpi(range_start.strftime('%Y-%m-%d'), range_end.strftime('%Y-%m-%d'))
+
+        # Fetched dates that are past their settle date now hold final values
+        settled_now = [d for d in plan.dates if today > d + timedelta(days=settle_days)]
+        touched = mark_cohorts_settled(settled_now, settle_days)
+        if touched:
+            logger.info(f"Marked {touched} unchanged rows as settled")
+
+        if compute_metrics:
+            compute_baseline_metrics(as_of=today)
 
         # Update sync log with success
         update_sync_log(
@@ -128,7 +329,9 @@ def main():
         formatter_class=argparse.RawDescriptionHelpFormatter,
         epilog="""
 Examples:
-  python monthly_baseline_update.py            # Full 180-day refresh
+  python monthly_baseline_update.py            # Planned 180-day refresh
+  python monthly_baseline_update.py --full     # Re-fetch all 180 days
+  python monthly_baseline_update.py --dry-run  # Show which install dates would be fetched
   python monthly_baseline_update.py --days 30  # Last 30 days only
   python monthly_baseline_update.py --days 90  # Last 90 days
         """
@@ -139,11 +342,45 @@ Examples:
         default=180,
         help='Number of days to refresh (default: 180)'
     )
+    parser.add_argument(
+        '--full',
+        action='store_true',
+        help='Re-fetch every install date in the window (skip the refresh planner)'
+    )
+    parser.add_argument(
+        '--settle-days',
+        type=int,
+        default=SETTLE_DAYS_DEFAULT,
+        help=f'Days after install until retention is final (default: {SETTLE_DAYS_DEFAULT})'
+    )
+    parser.add_argument(
+        '--audit-fraction',
+        type=float,
+        default=AUDIT_FRACTION_DEFAULT,
+        help=f'Share of settled install dates re-fetched as audit (default: {AUDIT_FRACTION_DEFAULT})'
+    )
+    parser.add_argument(
+        '--dry-run',
+        action='store_true',
+        help='Show the refresh plan without fetching'
+    )
+    parser.add_argument(
+        '--no-baseline-metrics',
+        action='store_true',
+        help='Skip recomputing baseline_metrics percentiles after the refresh'
+    )
 
     args = parser.parse_args()
 
     try:
-        run_baseline_update(days=args.days)
+        run_baseline_update(
+            days=args.days,
+            full=args.full,
+            settle_days=args.settle_days,
+            audit_fraction=args.audit_fraction,
+            dry_run=args.dry_run,
+            compute_metrics=not args.no_baseline_metrics,
+        )
     except Exception as e:
         logger.error(f"Baseline update failed with error: {e}")
         exit(1)
@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+# scheduler.py
+"""
+AppsFlyer ETL Job Scheduler
+
+Long-running job daemon for the appsflyer-etl container. Replaces the cron
+daemon that spawned a fresh Python process per job: pandas, env, the PostgreSQL
+connection pool and the AppsFlyer HTTP session are loaded once and stay warm
+between runs.
+
+- Cron-style schedules (UTC), overridable via AF_SCHEDULE_<JOB> env vars
+- One run at a time per job, enforced with a PostgreSQL advisory lock
+  (also protects against manual runs and other containers)
+- On-demand triggers via PostgreSQL NOTIFY on channel 'af_scheduler'
+
+Usage:
+    python scheduler.py daemon                     # Run the scheduler (container entrypoint)
+    python scheduler.py trigger daily_sync         # Ask a running daemon to run a job now
+    python scheduler.py run baseline_update        # Run a job in this process (with lock)
+    python scheduler.py list                       # Show jobs and next run times
+"""
+
+import os
+import sys
+import select
+import signal
+import hashlib
+import argparse
+import logging
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta, date
+from typing import Callable, Dict, Iterator, Set
+
+import psycopg2
+import psycopg2.extensions
+
+# Ensure we can import from the same directory
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sync_af_data import (
+    PG_CONN_INFO,
+    init_pg_pool,
+    close_pg_pool,
+    sync_events_with_logging,
+    sync_cohort_kpi_with_logging,
+)
+from monthly_baseline_update import run_baseline_update
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S'
+)
+logger = logging.getLogger(__name__)
+
+TRIGGER_CHANNEL = "af_scheduler"
+LOG_DIR = os.getenv("AF_LOG_DIR", "/var/log/appsflyer")
+
+# Advisory lock keys live in a shared bigint space; namespace ours so they cannot
+# collide with locks taken by other tools against the same database.
+LOCK_NAMESPACE = "appsflyer-etl"
+
+
+# -----------------------------------------------------------------------------
+# Cron Expressions
+# -----------------------------------------------------------------------------
+
+class CronSchedule:
+    """
+    Minimal 5-field cron expression: minute hour day-of-month month day-of-week.
+
+    Supports '*', 'a', 'a-b', 'a,b,c' and '/step' on any of those.
+    Day of week uses Sunday=0 (7 is also accepted). As in cron, when both
+    day-of-month and day-of-week are restricted a day matches if either does.
+    """
+
+    FIELD_RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+    def __init__(self, expr: str):
+        self.expr = expr
+        parts = expr.split()
+        if len(parts) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expr!r}")
+
+        fields = [self._parse_field(p, lo, hi) for p, (lo, hi) in zip(parts, self.FIELD_RANGES)]
+        self.minutes, self.hours, self.days, self.months, weekdays = fields
+        self.weekdays = {d % 7 for d in weekdays}
+        self.dom_restricted = parts[2] != "*"
+        self.dow_restricted = parts[4] != "*"
+
+    @staticmethod
+    def _parse_field(field: str, lo: int, hi: int) -> Set[int]:
+        values: Set[int] = set()
+        for item in field.split(","):
+            step = 1
+            if "/" in item:
+                item, step_str = item.split("/", 1)
+                step = int(step_str)
+            if item == "*":
+                start, end = lo, hi
+            elif "-" in item:
+                start_str, end_str = item.split("-", 1)
+                start, end = int(start_str), int(end_str)
+            else:
+                start = int(item)
+                end = hi if step > 1 else start
+            if start < lo or end > hi or start > end or step < 1:
+                raise ValueError(f"Invalid cron field {field!r} (allowed {lo}-{hi})")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, d: date) -> bool:
+        if d.month not in self.months:
+            return False
+        dom_ok = d.day in self.days
+        dow_ok = (d.isoweekday() % 7) in self.weekdays
+        if self.dom_restricted and self.dow_restricted:
+            return dom_ok or dow_ok
+        return dom_ok and dow_ok
+
+    def next_after(self, after: datetime) -> datetime:
+        """
+        First matching minute strictly after `after` (naive UTC datetimes).
+        """
+        t = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = t + timedelta(days=366 * 4)
+        while t < limit:
+            if not self._day_matches(t.date()):
+                t = datetime.combine(t.date() + timedelta(days=1), datetime.min.time())
+                continue
+            if t.hour not in self.hours:
+                t = t.replace(minute=0) + timedelta(hours=1)
+                continue
+            if t.minute not in self.minutes:
+                t += timedelta(minutes=1)
+                continue
+            return t
+        raise ValueError(f"Cron expression never fires: {self.expr!r}")
+
+
+# -----------------------------------------------------------------------------
+# Jobs
+# -----------------------------------------------------------------------------
+
+def run_daily_sync() -> None:
+    """
+    Same work as `sync_af_data.py --yesterday`: events + cohort KPI for yesterday.
+    """
+    yesterday = (date.today() - timedelta(days=1)).strftime('%Y-%m-%d')
+    total_events = sync_events_with_logging(yesterday, yesterday)
+    total_kpi = sync_cohort_kpi_with_logging(yesterday, yesterday)
+    logger.info(f"Daily sync complete: {total_events} events, {total_kpi} KPI records")
+
+
+def run_monthly_baseline_update() -> None:
+    run_baseline_update(days=int(os.getenv("AF_BASELINE_DAYS", "180")))
+
+
+@dataclass
+class Job:
+    name: str
+    schedule: CronSchedule
+    func: Callable[[], None]
+    log_file: str
+
+
+def _schedule(job_name: str, default: str) -> CronSchedule:
+    return CronSchedule(os.getenv(f"AF_SCHEDULE_{job_name.upper()}", default))
+
+
+def build_jobs() -> Dict[str, Job]:
+    jobs = [
+        # Daily AppsFlyer Sync - 2 AM UTC
+        Job("daily_sync", _schedule("daily_sync", "0 2 * * *"), run_daily_sync, "daily-sync.log"),
+        # Monthly Baseline Update - 1st of month, 3 AM UTC
+        Job("baseline_update", _schedule("baseline_update", "0 3 1 * *"), run_monthly_baseline_update,
+            "baseline-update.log"),
+    ]
+    return {job.name: job for job in jobs}
+
+
+# -----------------------------------------------------------------------------
+# Advisory Lock
+# -----------------------------------------------------------------------------
+
+def advisory_lock_key(job_name: str) -> int:
+    """
+    Stable signed 64-bit key for pg_try_advisory_lock, derived from the job name.
+    """
+    digest = hashlib.sha1(f"{LOCK_NAMESPACE}:{job_name}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big", signed=True)
+
+
+@contextmanager
+def job_lock(job_name: str) -> Iterator[bool]:
+    """
+    Hold a session-level advisory lock for the duration of a job.
+    Yields False (without blocking) if another session already holds it.
+
+    The lock lives on its own connection, outside the pool: jobs running in
+    parallel would otherwise each pin a pooled connection for their whole run
+    and exhaust AF_PG_POOL_SIZE (getconn raises instead of waiting).
+    """
+    key = advisory_lock_key(job_name)
+    conn = psycopg2.connect(**PG_CONN_INFO)
+    acquired = False
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_lock(%s)", (key,))
+            acquired = cur.fetchone()[0]
+        yield acquired
+    finally:
+        try:
+            if acquired and not conn.closed:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT pg_advisory_unlock(%s)", (key,))
+        finally:
+            conn.close()
+
+
+@contextmanager
+def job_log_file(job: Job) -> Iterator[None]:
+    """
+    Mirror log output of a job into its own file under LOG_DIR (kept from the cron layout).
+
+    Jobs run concurrently in their own threads and share the root logger, so the
+    handler only accepts records emitted by the thread running this job.
+    """
+    handler = None
+    if os.path.isdir(LOG_DIR):
+        job_thread = threading.get_ident()
+        handler = logging.FileHandler(os.path.join(LOG_DIR, job.log_file))
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s', '%Y-%m-%d %H:%M:%S'))
+        handler.addFilter(lambda record: record.thread == job_thread)
+        logging.getLogger().addHandler(handler)
+    try:
+        yield
+    finally:
+        if handler:
+            logging.getLogger().removeHandler(handler)
+            handler.close()
+
+
+def run_job(job: Job) -> bool:
+    """
+    Run a job under its advisory lock. Returns False if it was skipped or failed.
+    """
+    with job_lock(job.name) as acquired:
+        if not acquired:
+            logger.warning(f"Job '{job.name}' is already running elsewhere, skipping this run")
+            return False
+        with job_log_file(job):
+            logger.info(f"Job '{job.name}' started")
+            started = datetime.utcnow()
+            try:
+                job.func()
+            except Exception as e:
+                # Failures are already recorded in af_sync_log (and emailed) by the job itself
+                logger.error(f"Job '{job.name}' failed: {e}")
+                return False
+            duration = (datetime.utcnow() - started).total_seconds()
+            logger.info(f"Job '{job.name}' finished in {duration:.1f}s")
+            return True
+
+
+# -----------------------------------------------------------------------------
+# Daemon
+# -----------------------------------------------------------------------------
+
+class Scheduler:
+    """
+    Fires jobs on their cron schedules and on NOTIFY triggers.
+    Each run executes in its own thread so a long baseline update does not delay the daily sync.
+    """
+
+    def __init__(self, jobs: Dict[str, Job]):
+        self.jobs = jobs
+        self.running: Dict[str, threading.Thread] = {}
+        self.stop_event = threading.Event()
+        self.listen_conn = None
+
+    def _connect_listener(self) -> None:
+        self.listen_conn = psycopg2.connect(**PG_CONN_INFO)
+        self.listen_conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with self.listen_conn.cursor() as cur:
+            cur.execute(f"LISTEN {TRIGGER_CHANNEL}")
+        logger.info(f"Listening for triggers on channel '{TRIGGER_CHANNEL}'")
+
+    def start_job(self, name: str, reason: str) -> None:
+        job = self.jobs.get(name)
+        if job is None:
+            logger.warning(f"Ignoring trigger for unknown job '{name}'")
+            return
+        current = self.running.get(name)
+        if current is not None and current.is_alive():
+            logger.warning(f"Job '{name}' is still running in this process, ignoring {reason}")
+            return
+        logger.info(f"Starting job '{name}' ({reason})")
+        thread = threading.Thread(target=run_job, args=(job,), name=f"job-{name}", daemon=True)
+        self.running[name] = thread
+        thread.start()
+
+    def _drain_notifications(self) -> None:
+        self.listen_conn.poll()
+        while self.listen_conn.notifies:
+            notify = self.listen_conn.notifies.pop(0)
+            self.start_job(notify.payload.strip(), "manual trigger")
+
+    def run_forever(self) -> None:
+        self._connect_listener()
+        now = datetime.utcnow()
+        next_runs = {name: job.schedule.next_after(now) for name, job in self.jobs.items()}
+        for name, when in next_runs.items():
+            logger.info(f"Job '{name}' ({self.jobs[name].schedule.expr}) next run: {when} UTC")
+
+        while not self.stop_event.is_set():
+            now = datetime.utcnow()
+            for name, when in next_runs.items():
+                if when <= now:
+                    self.start_job(name, "schedule")
+                    next_runs[name] = self.jobs[name].schedule.next_after(now)
+                    logger.info(f"Job '{name}' next run: {next_runs[name]} UTC")
+
+            timeout = (min(next_runs.values()) - datetime.utcnow()).total_seconds()
+            # Short cap keeps SIGTERM handling (docker stop) responsive
+            timeout = max(0.0, min(timeout, 5.0))
+            try:
+                readable, _, _ = select.select([self.listen_conn], [], [], timeout)
+                if readable:
+                    self._drain_notifications()
+            except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                logger.warning(f"Trigger listener connection lost ({e}), reconnecting...")
+                self.stop_event.wait(5)
+                try:
+                    self._connect_listener()
+                except psycopg2.Error as reconnect_error:
+                    logger.error(f"Listener reconnect failed: {reconnect_error}")
+
+        self.shutdown()
+
+    def shutdown(self) -> None:
+        for name, thread in self.running.items():
+            if thread.is_alive():
+                logger.info(f"Waiting for job '{name}' to finish...")
+                thread.join()
+        if self.listen_conn is not None and not self.listen_conn.closed:
+            self.listen_conn.close()
+        close_pg_pool()
+
+
+def run_daemon() -> None:
+    jobs = build_jobs()
+    init_pg_pool(minconn=1, maxconn=int(os.getenv("AF_PG_POOL_SIZE", "4")))
+    scheduler = Scheduler(jobs)
+
+    def handle_signal(signum, frame):
+        logger.info(f"Received signal {signum}, shutting down after running jobs finish")
+        scheduler.stop_event.set()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    logger.info("=" * 60)
+    logger.info("AppsFlyer ETL Scheduler Starting")
+    logger.info("=" * 60)
+    scheduler.run_forever()
+
+
+def send_trigger(job_name: str) -> None:
+    conn = psycopg2.connect(**PG_CONN_INFO)
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_notify(%s, %s)", (TRIGGER_CHANNEL, job_name))
+        logger.info(f"Trigger sent for job '{job_name}'")
+    finally:
+        conn.close()
+
+
+def main():
+    jobs = build_jobs()
+
+    parser = argparse.ArgumentParser(
+        description='AppsFlyer ETL Scheduler - long-running job daemon',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  python scheduler.py daemon                  # Start the scheduler (container entrypoint)
+  python scheduler.py trigger daily_sync      # Run daily sync now in the running daemon
+  python scheduler.py run baseline_update     # Run baseline update in this process
+  python scheduler.py list                    # Show schedules
+        """
+    )
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('daemon', help='Run the scheduler in the foreground')
+    trigger_parser = sub.add_parser('trigger', help='Ask the running daemon to run a job now')
+    trigger_parser.add_argument('job', choices=sorted(jobs))
+    run_parser = sub.add_parser('run', help='Run a job once in this process (advisory lock enforced)')
+    run_parser.add_argument('job', choices=sorted(jobs))
+    sub.add_parser('list', help='Show jobs and their next run times')
+
+    args = parser.parse_args()
+
+    if args.command == 'daemon':
+        run_daemon()
+    elif args.command == 'trigger':
+        send_trigger(args.job)
+    elif args.command == 'run':
+        if not run_job(jobs[args.job]):
+            sys.exit(1)
+    elif args.command == 'list':
+        now = datetime.utcnow()
+        for job in jobs.values():
+            print(f"{job.name:<18} {job.schedule.expr:<14} next: {job.schedule.next_after(now)} UTC")
+
+
+if __name__ == "__main__":
+    main()
@@ -14,28 +14,30 @@ Usage:
 
 import os
 import io
+import json
 import hashlib
 import argparse
 import time
 import logging
 from datetime import datetime, timedelta, date
-from typing import List, Dict, Any, Optional, Iterable
+from typing import List, Dict, Any, Optional, Iterable, Set
 
 import requests
 import pandas as pd
 import psycopg2
 import psycopg2.extras
+import psycopg2.pool
 from dotenv import load_dotenv
 
 # Email notification (optional - import with fallback)
 try:
-    from email_notifier import send_failure_notification, is_email_configured
+    from email_notifier import queue_failure_notification, is_email_configured
     EMAIL_AVAILABLE = True
 except ImportError:
     EMAIL_AVAILABLE = False
     def is_email_configured():
         return False
-    def send_failure_notification(*args, **kwargs):
+    def queue_failure_notification(*args, **kwargs):
         return False
 
 # -----------------------------------------------------------------------------
@@ -58,7 +60,7 @@ load_dotenv()
 AF_API_TOKEN = os.environ["AF_API_TOKEN"]
 AF_APP_ID = os.environ["AF_APP_ID"]
 
-AF_BASE_URL = "https://hq1.appsflyer.com/api"
+AF_BASE_URL = os.getenv("AF_BASE_URL", "https://hq1.appsflyer.com/api")
 AF_MEDIA_SOURCE_DEFAULT = os.getenv("AF_DEFAULT_MEDIA_SOURCE", "googleadwords_int")
 AF_GEO_DEFAULT = os.getenv("AF_DEFAULT_GEO", "US")
 
@@ -71,14 +73,60 @@ PG_CONN_INFO = {
 }
 
 
+# Long-running processes (scheduler.py) call init_pg_pool() once so every job
+# reuses warm connections; one-shot CLI runs keep the plain connect/close path.
+_PG_POOL: Optional[psycopg2.pool.ThreadedConnectionPool] = None
+
+
+def init_pg_pool(minconn: int = 1, maxconn: int = 4) -> None:
+    """
+    Create the process-wide connection pool used by get_pg_connection().
+    """
+    global _PG_POOL
+    if _PG_POOL is None:
+        _PG_POOL = psycopg2.pool.ThreadedConnectionPool(minconn, maxconn, **PG_CONN_INFO)
+        logger.info(f"PostgreSQL connection pool ready (min={minconn}, max={maxconn})")
+
+
+def close_pg_pool() -> None:
+    global _PG_POOL
+    if _PG_POOL is not None:
+        _PG_POOL.closeall()
+        _PG_POOL = None
+
+
 def get_pg_connection():
+    if _PG_POOL is not None:
+        return _PG_POOL.getconn()
     return psycopg2.connect(**PG_CONN_INFO)
 
 
+def release_pg_connection(conn) -> None:
+    """
+    Return a connection from get_pg_connection(): back to the pool if pooled, closed otherwise.
+    """
+    if _PG_POOL is not None:
+        _PG_POOL.putconn(conn, close=bool(conn.closed))
+    else:
+        conn.close()
+
+
 COMMON_HEADERS = {
     "authorization": f"Bearer {AF_API_TOKEN}",
 }
 
+_HTTP_SESSION: Optional[requests.Session] = None
+
+
+def get_http_session() -> requests.Session:
+    """
+    Shared requests.Session so consecutive AppsFlyer calls reuse TCP/TLS connections.
+    """
+    global _HTTP_SESSION
+    if _HTTP_SESSION is None:
+        _HTTP_SESSION = requests.Session()
+    return _HTTP_SESSION
+
 
 # -----------------------------------------------------------------------------
 # Sync Log Functions (writes to af_sync_log table)
@@ -102,7 +150,7 @@ def create_sync_log(sync_type: str, date_start: date, date_end: date) -> int:
                 logger.info(f"Created sync log #{log_id} for {sync_type}: {date_start} to {date_end}")
                 return log_id
     finally:
-        conn.close()
+        release_pg_connection(conn)
 
 
 def update_sync_log(
@@ -136,22 +184,72 @@ def update_sync_log(
                 """, (status, records_processed, error_message, log_id))
                 logger.info(f"Updated sync log #{log_id}: status={status}, records={records_processed}")
     finally:
-        conn.close()
+        release_pg_connection(conn)
 
-    # Send email notification on failure
+    # Queue email notification on failure (coalesced into a digest, sent off the sync path)
     if status == 'failed' and EMAIL_AVAILABLE and is_email_configured():
         try:
-            send_failure_notification(
+            queue_failure_notification(
                 sync_type=sync_type or 'unknown',
                 date_range=date_range or 'unknown',
                 error_message=error_message or 'No error message provided',
                 records_processed=records_processed or 0
             )
-            logger.info("Failure notification email sent")
+            logger.info("Failure notification queued")
         except Exception as e:
             logger.warning(f"Failed to send email notification: {e}")
 
 
+# -----------------------------------------------------------------------------
+# Sync Notifications (LISTEN/NOTIFY)
+# -----------------------------------------------------------------------------
+
+# Listened to by server/evaluation/python/evaluation_listener.py
+SYNC_NOTIFY_CHANNEL = "af_data_synced"
+# NOTIFY payloads must stay below 8000 bytes
+NOTIFY_PAYLOAD_LIMIT = 7000
+
+
+def publish_synced_keys(cur, source: str, keys: Dict[date, Set[str]]) -> int:
+    """
+    NOTIFY the (install_date -> campaigns) a write touched, on the writer's cursor:
+    listeners hear about it only once that transaction commits, never on rollback.
+
+    Payload: {"source": ..., "app_id": ..., "keys": {"YYYY-MM-DD": [campaign, ...]}},
+    split over several notifications when large. Returns the number sent.
+    """
+    payloads = []
+    chunk: Dict[str, List[str]] = {}
+    size = 0
+    for d in sorted(keys):
+        for campaign in sorted(keys[d]):
+            entry = len(json.dumps(campaign)) + 16
+            if chunk and size + entry > NOTIFY_PAYLOAD_LIMIT:
+                payloads.append(chunk)
+                chunk, size = {}, 0
+            chunk.setdefault(d.strftime("%Y-%m-%d"), []).append(campaign)
+            size += entry
+    if chunk:
+        payloads.append(chunk)
+
+    for chunk in payloads:
+        cur.execute(
+            "SELECT pg_notify(%s, %s)",
+            (SYNC_NOTIFY_CHANNEL, json.dumps({"source": source, "app_id": AF_APP_ID, "keys": chunk})),
+        )
+    return len(payloads)
+
+
+def refresh_synced_sketches(cur, install_dates: Iterable[date]) -> int:
+    """
+    Rebuild the af_cohort_sketch rows of the install dates a write touched, on
+    the writer's cursor (see cohort_sketches.refresh_cohort_sketches).
+    """
+    # Imported lazily: cohort_sketches builds on this module
+    from cohort_sketches import refresh_cohort_sketches
+    return refresh_cohort_sketches(cur, install_dates)
+
+
 # -----------------------------------------------------------------------------
 # Retry Logic with Exponential Backoff
 # -----------------------------------------------------------------------------
@@ -264,7 +362,7 @@ def fetch_raw_events_csv(
         "accept": "text/csv",
     }
 
-    resp = requests.get(url, headers=headers, params=params, timeout=120)
+    resp = get_http_session().get(url, headers=headers, params=params, timeout=120)
     resp.raise_for_status()
 
     csv_text = resp.text
@@ -356,80 +454,112 @@ def normalize_events_df(df: pd.DataFrame, event_type: str) -> pd.DataFrame:
     return normalized
 
 
+EVENT_COLUMNS = [
+    "event_id",
+    "app_id",
+    "app_name",
+    "bundle_id",
+    "appsflyer_id",
+    "event_name",
+    "event_time",
+    "event_date",
+    "install_time",
+    "install_date",
+    "days_since_install",
+    "event_revenue",
+    "event_revenue_usd",
+    "event_revenue_currency",
+    "geo",  # Changed from country_code to geo for consistency
+    "media_source",
+    "channel",
+    "campaign",
+    "campaign_id",
+    "adset",
+    "adset_id",
+    "ad",
+    "is_primary_attribution",
+]
+
+
+def build_event_rows(df: pd.DataFrame) -> List[List[Any]]:
+    """
+    normalize_events_df 的结果 -> execute_values 用的行列表（按 EVENT_COLUMNS 顺序）。
+    """
+    rows = []
+    for _, r in df.iterrows():
+        row = [r.get(c) for c in EVENT_COLUMNS]
+        rows.append(row)
+    return rows
+
+
 def upsert_events(df: pd.DataFrame):
     """
     将标准化后的 df 写入 af_events 表。
     使用 ON CONFLICT(event_id) DO NOTHING 保持幂等。
+    新插入事件的 (install_date, campaign) 在提交时通过 SYNC_NOTIFY_CHANNEL 发布。
+    受影响 install_date 的 af_cohort_sketch 在同一事务内重建。
     """
     if df.empty:
         logger.info("No events to upsert.")
         return 0
 
-    cols = [
-        "event_id",
-        "app_id",
-        "app_name",
-        "bundle_id",
-        "appsflyer_id",
-        "event_name",
-        "event_time",
-        "event_date",
-        "install_time",
-        "install_date",
-        "days_since_install",
-        "event_revenue",
-        "event_revenue_usd",
-        "event_revenue_currency",
-        "geo",  # Changed from country_code to geo for consistency
-        "media_source",
-        "channel",
-        "campaign",
-        "campaign_id",
-        "adset",
-        "adset_id",
-        "ad",
-        "is_primary_attribution",
-    ]
-
-    rows = []
-    for _, r in df.iterrows():
-        row = [r.get(c) for c in cols]
-        rows.append(row)
+    rows = build_event_rows(df)
 
-    placeholders = "(" + ",".join(["%s"] * len(cols)) + ")"
+    placeholders = "(" + ",".join(["%s"] * len(EVENT_COLUMNS)) + ")"
 
     insert_sql = f"""
     INSERT INTO af_events (
-      {", ".join(cols)}
+      {", ".join(EVENT_COLUMNS)}
     ) VALUES %s
-    ON CONFLICT (event_id) DO NOTHING;
+    ON CONFLICT (event_id) DO NOTHING
+    RETURNING install_date, campaign;
     """
 
     conn = get_pg_connection()
     try:
         with conn:
             with conn.cursor() as cur:
-                psycopg2.extras.execute_values(
+                inserted = psycopg2.extras.execute_values(
                     cur,
                     insert_sql,
                     rows,
                     template=placeholders,
+                    fetch=True,
                 )
-        logger.info(f"Upserted {len(rows)} rows into af_events.")
+                synced: Dict[date, Set[str]] = {}
+                for install_date, campaign in inserted:
+                    if campaign:
+                        synced.setdefault(install_date, set()).add(campaign)
+                publish_synced_keys(cur, "events", synced)
+                refresh_synced_sketches(cur, {install_date for install_date, _ in inserted if install_date})
+        logger.info(f"Upserted {len(rows)} rows into af_events ({len(inserted)} new).")
         return len(rows)
     finally:
-        conn.close()
+        release_pg_connection(conn)
 
 
 # -----------------------------------------------------------------------------
 # 2. Master Agg API：Cohort Cost + Retention
 # -----------------------------------------------------------------------------
 
+MASTER_AGG_COLUMN_MAPPING = {
+    "Media Source": "pid",
+    "Campaign": "c",
+    "GEO": "geo",
+    "Cost": "cost",
+    "Installs": "installs",
+    "Retention Rate Day 1": "retention_rate_day_1",
+    "Retention Rate Day 3": "retention_rate_day_3",
+    "Retention Rate Day 5": "retention_rate_day_5",
+    "Retention Rate Day 7": "retention_rate_day_7",
+}
+
+
 def fetch_master_agg_for_install_date(
     install_date: date,
     media_source: str,
     geo: str,
-) -> List[Dict[str, Any]]:
+) -> pd.DataFrame:
     """
     调用 master-agg-data/v4，每次只拉某一天的 cohort：
     from=to=install_date
@@ -438,6 +568,7 @@ def fetch_master_agg_for_install_date(
     Media Source, Campaign, GEO, Cost, Installs, Retention Rate Day 1, etc.
 
     We filter client-side to only keep the specified media_source.
+    Returns one row per (pid, c, geo); an empty frame when there is no data.
     """
     from_str = install_date.strftime("%Y-%m-%d")
     to_str = from_str
@@ -455,38 +586,27 @@ def fetch_master_agg_for_install_date(
         "accept": "text/csv",  # Request CSV format
     }
 
-    resp = requests.get(url, headers=headers, timeout=120)
+    resp = get_http_session().get(url, headers=headers, timeout=120)
     resp.raise_for_status()
 
     # Handle empty response
     if not resp.text or resp.text.strip() == "":
         logger.debug(f"No cohort data for {install_date} (empty response)")
-        return []
+        return pd.DataFrame()
 
     # Parse CSV response
     try:
         df = pd.read_csv(io.StringIO(resp.text))
     except Exception as e:
         logger.warning(f"Failed to parse CSV for {install_date}: {e}")
-        return []
+        return pd.DataFrame()
 
     if df.empty:
         logger.debug(f"No cohort data for {install_date} (empty CSV)")
-        return []
+        return pd.DataFrame()
 
     # Normalize column names to match expected format
-    column_mapping = {
-        "Media Source": "pid",
-        "Campaign": "c",
-        "GEO": "geo",
-        "Cost": "cost",
-        "Installs": "installs",
-        "Retention Rate Day 1": "retention_rate_day_1",
-        "Retention Rate Day 3": "retention_rate_day_3",
-        "Retention Rate Day 5": "retention_rate_day_5",
-        "Retention Rate Day 7": "retention_rate_day_7",
-    }
-    df = df.rename(columns=column_mapping)
+    df = df.rename(columns=MASTER_AGG_COLUMN_MAPPING)
 
     # Filter to specified media_source only
     if media_source and "pid" in df.columns:
@@ -494,7 +614,7 @@ def fetch_master_agg_for_install_date(
 
     if df.empty:
         logger.debug(f"No cohort data for {install_date} with media_source={media_source}")
-        return []
+        return pd.DataFrame()
 
     # Aggregate duplicates (same pid, campaign, geo) by summing numeric columns
     # This handles cases where the API returns duplicate rows
@@ -511,130 +631,201 @@ def fetch_master_agg_for_install_date(
         }
         df = df.groupby(key_cols, as_index=False).agg(agg_dict)
 
-    # Convert to list of dicts
-    rows = df.to_dict(orient="records")
-    return rows
+    return df.reset_index(drop=True)
+
+
+COHORT_KPI_COLUMNS = [
+    "app_id",
+    "media_source",
+    "campaign",
+    "geo",
+    "install_date",
+    "days_since_install",
+    "installs",
+    "cost_usd",
+    "retention_rate",
+]
+
+# master-agg 列 -> days_since_install
+RETENTION_DAY_COLUMNS = {
+    "retention_rate_day_1": 1,
+    "retention_rate_day_3": 3,
+    "retention_rate_day_5": 5,
+    "retention_rate_day_7": 7,
+}
 
 
-def build_cohort_kpi_rows(
-    raw_rows: List[Dict[str, Any]],
+def build_cohort_kpi_frame(
+    agg: pd.DataFrame,
     install_date: date,
-) -> List[Dict[str, Any]]:
+) -> pd.DataFrame:
     """
-    将 master-agg 的一批 rows 展开为多条 days_since_install 记录。
+    将 master-agg 的一批 rows 展开为多条 days_since_install 记录（向量化，不逐行循环）。
 
     对于每个 row（pid,c,geo 组合）：
     - days_since_install=0：记 installs + cost
-    - days_since_install=1/3/5/7：记 retention_rate
-    """
-    out: List[Dict[str, Any]] = []
-
-    for r in raw_rows:
-        pid = r.get("pid") or r.get("media_source")
-        campaign = r.get("c") or r.get("campaign")
-        geo = r.get("geo") or r.get("country_code")
-
-        installs = int(r.get("installs") or 0)
-        cost = float(r.get("cost") or 0.0)
-
-        # D0 行：cost + installs
-        out.append(
-            {
-                "app_id": AF_APP_ID,
-                "media_source": pid,
-                "campaign": campaign,
-                "geo": geo,
-                "install_date": install_date,
-                "days_since_install": 0,
-                "installs": installs,
-                "cost_usd": cost,
-                "retention_rate": None,
-            }
+    - days_since_install=1/3/5/7：记 retention_rate（缺失值不产生行）
+
+    Returns a long-form frame with COHORT_KPI_COLUMNS.
+    """
+    if agg.empty:
+        return pd.DataFrame(columns=COHORT_KPI_COLUMNS)
+
+    # Accept the API-normalized names as well as the table names
+    agg = agg.rename(columns={k: v for k, v in {
+        "media_source": "pid",
+        "campaign": "c",
+        "country_code": "geo",
+    }.items() if v not in agg.columns})
+
+    def numeric(col: str) -> pd.Series:
+        if col not in agg.columns:
+            return pd.Series(float("nan"), index=agg.index)
+        return pd.to_numeric(agg[col], errors="coerce")
+
+    base = pd.DataFrame({
+        "app_id": AF_APP_ID,
+        "media_source": agg["pid"],
+        "campaign": agg["c"],
+        "geo": agg["geo"],
+        "install_date": install_date,
+        "installs": numeric("installs").fillna(0).astype("int64"),
+    })
+
+    # D0 行：cost + installs
+    d0 = base.assign(
+        days_since_install=0,
+        cost_usd=numeric("cost").fillna(0.0),
+        retention_rate=float("nan"),
+    )
+
+    # D1/3/5/7 行：retention rate
+    retention_cols = [c for c in RETENTION_DAY_COLUMNS if c in agg.columns]
+    retention = (
+        pd.concat([base, *(numeric(c).rename(c) for c in retention_cols)], axis=1)
+        .melt(
+            id_vars=list(base.columns),
+            value_vars=retention_cols,
+            var_name="days_since_install",
+            value_name="retention_rate",
         )
+        .dropna(subset=["retention_rate"])
+    )
+    retention["days_since_install"] = retention["days_since_install"].map(RETENTION_DAY_COLUMNS)
+    retention["cost_usd"] = float("nan")
 
-        # D1/3/5/7 行：retention rate
-        mapping = {
-            1: r.get("retention_rate_day_1"),
-            3: r.get("retention_rate_day_3"),
-            5: r.get("retention_rate_day_5"),
-            7: r.get("retention_rate_day_7"),
-        }
+    return pd.concat([d0, retention], ignore_index=True)[COHORT_KPI_COLUMNS]
 
-        for d, val in mapping.items():
-            if val is None:
-                continue
-            out.append(
-                {
-                    "app_id": AF_APP_ID,
-                    "media_source": pid,
-                    "campaign": campaign,
-                    "geo": geo,
-                    "install_date": install_date,
-                    "days_since_install": d,
-                    "installs": installs,
-                    "cost_usd": None,
-                    "retention_rate": float(val),
-                }
-            )
 
-    return out
+def build_cohort_kpi_copy_buffer(frame: pd.DataFrame) -> io.StringIO:
+    """
+    COPY ... FROM STDIN WITH (FORMAT csv, NULL '\\N') 的输入。
+    \\N marks NULL so that empty strings (e.g. blank campaign names) stay empty strings.
+    """
+    buf = io.StringIO()
+    frame[COHORT_KPI_COLUMNS].to_csv(buf, index=False, header=False, na_rep="\\N")
+    buf.seek(0)
+    return buf
+
 
+def new_cohort_upsert_stats() -> Dict[str, int]:
+    return {"inserted": 0, "updated": 0, "unchanged": 0}
 
-def upsert_cohort_kpi(rows: List[Dict[str, Any]]) -> int:
+
+def upsert_cohort_kpi(frame: pd.DataFrame, stats: Optional[Dict[str, int]] = None) -> int:
     """
     写入 af_cohort_kpi_daily。
-    使用 ON CONFLICT (app_id, media_source, campaign, geo, install_date, days_since_install)
+    COPY 到临时表，再 INSERT ... SELECT ... ON CONFLICT
+    (app_id, media_source, campaign, geo, install_date, days_since_install)
     DO UPDATE 保持幂等。
-    Returns the number of rows upserted.
-    """
-    if not rows:
-        logger.info("No cohort KPI rows to upsert.")
-        return 0
 
-    cols = [
-        "app_id",
-        "media_source",
-        "campaign",
-        "geo",
-        "install_date",
-        "days_since_install",
-        "installs",
-        "cost_usd",
-        "retention_rate",
-    ]
+    Change-aware: the DO UPDATE only fires when a stored value would actually change
+    (IS DISTINCT FROM guards), so re-syncing unchanged cohorts writes no new tuples
+    and leaves last_refreshed_at at the time the values last changed.
+    The (install_date, campaign) keys that did change are published on
+    SYNC_NOTIFY_CHANNEL when the transaction commits, and the af_cohort_sketch
+    rows of those install dates are rebuilt in the same transaction.
 
-    values = []
-    for r in rows:
-        values.append([r.get(c) for c in cols])
+    Args:
+        frame: Long-form cohort KPI frame from build_cohort_kpi_frame
+        stats: Optional dict (see new_cohort_upsert_stats) accumulating
+               inserted / updated / unchanged counts
 
-    placeholders = "(" + ",".join(["%s"] * len(cols)) + ")"
+    Returns the number of rows processed.
+    """
+    if frame.empty:
+        logger.info("No cohort KPI rows to upsert.")
+        return 0
 
-    insert_sql = f"""
-    INSERT INTO af_cohort_kpi_daily (
-      {", ".join(cols)}
-    ) VALUES %s
-    ON CONFLICT (app_id, media_source, campaign, geo, install_date, days_since_install)
-    DO UPDATE SET
-      installs = EXCLUDED.installs,
-      cost_usd = COALESCE(EXCLUDED.cost_usd, af_cohort_kpi_daily.cost_usd),
-      retention_rate = COALESCE(EXCLUDED.retention_rate, af_cohort_kpi_daily.retention_rate),
-      last_refreshed_at = NOW();
+    cols = ", ".join(COHORT_KPI_COLUMNS)
+    buf = build_cohort_kpi_copy_buffer(frame)
+
+    # RETURNING only reports rows that were written; xmax = 0 marks a fresh insert.
+    merge_sql = f"""
+    WITH written AS (
+      INSERT INTO af_cohort_kpi_daily AS t (
+        {cols}
+      )
+      SELECT {cols} FROM af_cohort_kpi_stage
+      ON CONFLICT (app_id, media_source, campaign, geo, install_date, days_since_install)
+      DO UPDATE SET
+        installs = EXCLUDED.installs,
+        cost_usd = COALESCE(EXCLUDED.cost_usd, t.cost_usd),
+        retention_rate = COALESCE(EXCLUDED.retention_rate, t.retention_rate),
+        last_refreshed_at = NOW()
+      WHERE t.installs IS DISTINCT FROM EXCLUDED.installs
+         OR t.cost_usd IS DISTINCT FROM COALESCE(EXCLUDED.cost_usd, t.cost_usd)
+         OR t.retention_rate IS DISTINCT FROM COALESCE(EXCLUDED.retention_rate, t.retention_rate)
+      RETURNING (xmax = 0) AS inserted, install_date, campaign
+    )
+    SELECT install_date, campaign, COUNT(*) FILTER (WHERE inserted), COUNT(*)
+    FROM written
+    GROUP BY install_date, campaign;
     """
 
     conn = get_pg_connection()
     try:
         with conn:
             with conn.cursor() as cur:
-                psycopg2.extras.execute_values(
-                    cur,
-                    insert_sql,
-                    values,
-                    template=placeholders,
+                cur.execute("""
+                    CREATE TEMP TABLE af_cohort_kpi_stage (
+                      app_id text,
+                      media_source text,
+                      campaign text,
+                      geo text,
+                      install_date date,
+                      days_since_install integer,
+                      installs integer,
+                      cost_usd numeric(18,6),
+                      retention_rate numeric(8,4)
+                    ) ON COMMIT DROP
+                """)
+                cur.copy_expert(
+                    f"COPY af_cohort_kpi_stage ({cols}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+                    buf,
                 )
-        logger.info(f"Upserted {len(values)} rows into af_cohort_kpi_daily.")
-        return len(values)
+                cur.execute(merge_sql)
+                inserted = written = 0
+                synced: Dict[date, Set[str]] = {}
+                for install_date, campaign, n_inserted, n_written in cur.fetchall():
+                    inserted += n_inserted
+                    written += n_written
+                    synced.setdefault(install_date, set()).add(campaign)
+                publish_synced_keys(cur, "cohort_kpi", synced)
+                refresh_synced_sketches(cur, synced.keys())
+        updated = written - inserted
+        unchanged = len(frame) - written
+        if stats is not None:
+            stats["inserted"] += inserted
+            stats["updated"] += updated
+            stats["unchanged"] += unchanged
+        logger.info(
+            f"Upserted {len(frame)} rows into af_cohort_kpi_daily "
+            f"(new={inserted}, changed={updated}, unchanged={unchanged})."
+        )
+        return len(frame)
     finally:
-        conn.close()
+        release_pg_connection(conn)
 
 
 # -----------------------------------------------------------------------------
@@ -651,42 +842,46 @@ def daterange(start_date: date, end_date: date) -> Iterable[date]:
         cur += timedelta(days=1)
 
 
-def sync_events(
+EVENT_STREAMS = ("iap_purchase", "af_ad_revenue")
+
+
+def sync_event_stream(
+    event_type: str,
     from_date: str,
     to_date: str,
     media_source: str = AF_MEDIA_SOURCE_DEFAULT,
     geo: str = AF_GEO_DEFAULT,
 ) -> int:
     """
-    Sync IAP and Ad Revenue events for a date range.
-    Returns total number of records processed.
+    Sync one raw event stream ('iap_purchase' or 'af_ad_revenue') for a date range.
+    Returns number of records processed.
     """
-    total_records = 0
-
-    logger.info(f"Fetching IAP events {from_date} ~ {to_date}")
-    df_iap = fetch_with_retry(
+    logger.info(f"Fetching {event_type} events {from_date} ~ {to_date}")
+    df = fetch_with_retry(
         fetch_raw_events_csv,
-        event_type="iap_purchase",
+        event_type=event_type,
         from_date=from_date,
         to_date=to_date,
         media_source=media_source,
         geo=geo,
     )
-    norm_iap = normalize_events_df(df_iap, "iap_purchase")
-    total_records += upsert_events(norm_iap) or 0
+    norm = normalize_events_df(df, event_type)
+    return upsert_events(norm) or 0
 
-    logger.info(f"Fetching Ad Revenue events {from_date} ~ {to_date}")
-    df_ad = fetch_with_retry(
-        fetch_raw_events_csv,
-        event_type="af_ad_revenue",
-        from_date=from_date,
-        to_date=to_date,
-        media_source=media_source,
-        geo=geo,
-    )
-    norm_ad = normalize_events_df(df_ad, "af_ad_revenue")
-    total_records += upsert_events(norm_ad) or 0
 
+def sync_events(
+    from_date: str,
+    to_date: str,
+    media_source: str = AF_MEDIA_SOURCE_DEFAULT,
+    geo: str = AF_GEO_DEFAULT,
+) -> int:
+    """
+    Sync IAP and Ad Revenue events for a date range.
+    Returns total number of records processed.
+    """
+    total_records = 0
+    for event_type in EVENT_STREAMS:
+        total_records += sync_event_stream(event_type, from_date, to_date, media_source=media_source, geo=geo)
     return total_records
 
 
@@ -704,12 +899,17 @@ def sync_cohort_kpi(
     end = datetime.strptime(end_install_date, "%Y-%m-%d").date()
 
     total_records = 0
+    stats = new_cohort_upsert_stats()
     for d in daterange(start, end):
         logger.info(f"Fetching master-agg for install_date={d}")
-        raw_rows = fetch_with_retry(fetch_master_agg_for_install_date, d, media_source=media_source, geo=geo)
-        rows = build_cohort_kpi_rows(raw_rows, d)
-        total_records += upsert_cohort_kpi(rows) or 0
+        agg = fetch_with_retry(fetch_master_agg_for_install_date, d, media_source=media_source, geo=geo)
+        frame = build_cohort_kpi_frame(agg, d)
+        total_records += upsert_cohort_kpi(frame, stats) or 0
 
+    logger.info(
+        f"Cohort KPI {start_install_date} ~ {end_install_date}: {total_records} rows "
+        f"(new={stats['inserted']}, changed={stats['updated']}, unchanged={stats['unchanged']})"
+    )
     return total_records
 
 
@@ -768,6 +968,7 @@ Examples:
   python sync_af_data.py --from-date 2025-01-01 --to-date 2025-01-31
   python sync_af_data.py --from-date 2025-01-01 --to-date 2025-01-07 --events-only
   python sync_af_data.py --from-date 2025-01-01 --to-date 2025-01-07 --kpi-only
+  python sync_af_data.py --yesterday --sharded           # Split work with other replicas
         """
     )
     parser.add_argument('--yesterday', action='store_true',
@@ -780,6 +981,11 @@ Examples:
                         help='Only sync events (skip cohort KPI)')
     parser.add_argument('--kpi-only', action='store_true',
                         help='Only sync cohort KPI (skip events)')
+    parser.add_argument('--sharded', action='store_true',
+                        help='Split the sync into leased work units shared with other replicas')
+    parser.add_argument('--batch-key', dest='batch_key',
+                        help='Work unit batch key for --sharded (default: sync:<from>:<to>); '
+                             'use a new key to re-run a range that already completed')
 
     args = parser.parse_args()
 
@@ -805,6 +1011,24 @@ Examples:
     logger.info(f"Cohort KPI: {'Yes' if not args.events_only else 'Skip'}")
     logger.info("=" * 60)
 
+    if args.sharded:
+        # Imported lazily: work_units builds on this module
+        from work_units import run_sharded_sync_with_logging, stream_groups
+
+        batch_key = args.batch_key or f"sync:{from_date}:{to_date}"
+        try:
+            records = run_sharded_sync_with_logging(
+                batch_key,
+                datetime.strptime(from_date, "%Y-%m-%d").date(),
+                datetime.strptime(to_date, "%Y-%m-%d").date(),
+                stream_groups(events=not args.kpi_only, kpi=not args.events_only),
+            )
+            logger.info(f"Sharded sync complete: {records} records processed by this replica")
+        except Exception as e:
+            logger.error(f"Sync failed: {e}")
+            raise
+        return
+
     total_events = 0
     total_kpi = 0
 
@@ -0,0 +1,391 @@
+# work_units.py
+"""
+Lease-based Work Sharding for AppsFlyer Sync
+
+Splits a sync into (stream, app, geo, media source, date) work units stored in
+af_sync_work_unit so several ETL replicas can drain the same sync without
+duplicating AppsFlyer calls or contending on the same ON CONFLICT rows.
+
+- Every replica enqueues the same units (idempotent, keyed by batch_key)
+- Units are claimed with SELECT ... FOR UPDATE SKIP LOCKED and held by a lease
+- A heartbeat thread extends the lease while the unit is being processed
+- Leases of crashed replicas expire and are reclaimed by the next claim
+
+Usage:
+    from work_units import enqueue_work_units, drain_work_units
+
+    enqueue_work_units("backfill:2025-01-01:2025-01-31", start, end)
+    stats = drain_work_units("backfill:2025-01-01:2025-01-31")
+"""
+
+import os
+import socket
+import logging
+import threading
+from dataclasses import dataclass
+from datetime import date
+from typing import Callable, Dict, List, Optional, Sequence
+
+import psycopg2.extras
+
+from sync_af_data import (
+    AF_APP_ID,
+    AF_MEDIA_SOURCE_DEFAULT,
+    AF_GEO_DEFAULT,
+    EVENT_STREAMS,
+    get_pg_connection,
+    release_pg_connection,
+    sync_event_stream,
+    sync_cohort_kpi,
+    daterange,
+    create_sync_log,
+    update_sync_log,
+)
+
+logger = logging.getLogger(__name__)
+
+COHORT_STREAM = "cohort_kpi"
+ALL_STREAMS = EVENT_STREAMS + (COHORT_STREAM,)
+
+LEASE_SECONDS = int(os.getenv("AF_WORK_LEASE_SECONDS", "300"))
+MAX_ATTEMPTS = int(os.getenv("AF_WORK_MAX_ATTEMPTS", "3"))
+
+
+@dataclass
+class WorkUnit:
+    id: int
+    batch_key: str
+    stream: str
+    app_id: str
+    geo: str
+    media_source: str
+    unit_date: date
+    attempts: int
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+# -----------------------------------------------------------------------------
+# Queue Operations
+# -----------------------------------------------------------------------------
+
+def enqueue_work_units(
+    batch_key: str,
+    start_date: date,
+    end_date: date,
+    streams: Sequence[str] = ALL_STREAMS,
+    media_source: str = AF_MEDIA_SOURCE_DEFAULT,
+    geo: str = AF_GEO_DEFAULT,
+) -> int:
+    """
+    Create one unit per (stream, date) for the batch. Safe to call from every replica:
+    existing units are left untouched. Returns the number of newly created units.
+    """
+    rows = [
+        (batch_key, stream, AF_APP_ID, geo, media_source, d)
+        for d in daterange(start_date, end_date)
+        for stream in streams
+    ]
+    if not rows:
+        return 0
+
+    conn = get_pg_connection()
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                inserted = psycopg2.extras.execute_values(
+                    cur,
+                    """
+                    INSERT INTO af_sync_work_unit (batch_key, stream, app_id, geo, media_source, unit_date)
+                    VALUES %s
+                    ON CONFLICT (batch_key, stream, app_id, geo, media_source, unit_date) DO NOTHING
+                    RETURNING id
+                    """,
+                    rows,
+                    fetch=True,
+                )
+        logger.info(f"Batch {batch_key}: {len(inserted)} new work units ({len(rows)} requested)")
+        return len(inserted)
+    finally:
+        release_pg_connection(conn)
+
+
+def claim_work_unit(
+    batch_key: str,
+    worker_id: str,
+    lease_seconds: int = LEASE_SECONDS,
+    max_attempts: int = MAX_ATTEMPTS,
+) -> Optional[WorkUnit]:
+    """
+    Lease the next pending unit, or a unit whose lease has expired (crashed replica).
+    SKIP LOCKED lets concurrent replicas claim different units without blocking.
+    Expired units that already used max_attempts are marked failed instead of re-run.
+    """
+    conn = get_pg_connection()
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    UPDATE af_sync_work_unit
+                    SET status = 'failed', last_error = 'Lease expired after ' || attempts || ' attempts',
+                        lease_owner = NULL, lease_expires_at = NULL
+                    WHERE batch_key = %s AND status = 'leased' AND lease_expires_at < NOW() AND attempts >= %s
+                    """,
+                    (batch_key, max_attempts),
+                )
+                cur.execute(
+                    """
+                    UPDATE af_sync_work_unit u
+                    SET status = 'leased',
+                        lease_owner = %s,
+                        lease_expires_at = NOW() + make_interval(secs => %s),
+                        heartbeat_at = NOW(),
+                        attempts = u.attempts + 1
+                    WHERE u.id = (
+                        SELECT id
+                        FROM af_sync_work_unit
+                        WHERE batch_key = %s
+                          AND (status = 'pending' OR (status = 'leased' AND lease_expires_at < NOW()))
+                        ORDER BY unit_date, stream, id
+                        FOR UPDATE SKIP LOCKED
+                        LIMIT 1
+                    )
+                    RETURNING u.id, u.batch_key, u.stream, u.app_id, u.geo, u.media_source, u.unit_date, u.attempts
+                    """,
+                    (worker_id, lease_seconds, batch_key),
+                )
+                row = cur.fetchone()
+        return WorkUnit(*row) if row else None
+    finally:
+        release_pg_connection(conn)
+
+
+def heartbeat_work_unit(unit_id: int, worker_id: str, lease_seconds: int = LEASE_SECONDS) -> bool:
+    """
+    Extend the lease. Returns False if the unit is no longer ours (lease expired and reclaimed).
+    """
+    conn = get_pg_connection()
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    UPDATE af_sync_work_unit
+                    SET lease_expires_at = NOW() + make_interval(secs => %s), heartbeat_at = NOW()
+                    WHERE id = %s AND lease_owner = %s AND status = 'leased'
+                    """,
+                    (lease_seconds, unit_id, worker_id),
+                )
+                return cur.rowcount == 1
+    finally:
+        release_pg_connection(conn)
+
+
+def complete_work_unit(unit_id: int, worker_id: str, records_processed: int) -> bool:
+    """
+    Mark a leased unit done. Returns False if the unit is no longer ours (lease expired and reclaimed).
+    """
+    conn = get_pg_connection()
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    UPDATE af_sync_work_unit
+                    SET status = 'done', records_processed = %s, last_error = NULL,
+                        lease_expires_at = NULL, completed_at = NOW()
+                    WHERE id = %s AND lease_owner = %s AND status = 'leased'
+                    """,
+                    (records_processed, unit_id, worker_id),
+                )
+                return cur.rowcount == 1
+    finally:
+        release_pg_connection(conn)
+
+
+def fail_work_unit(unit: WorkUnit, worker_id: str, error_message: str, max_attempts: int = MAX_ATTEMPTS) -> None:
+    """
+    Release a failed unit back to 'pending' for another try, or mark it 'failed' after max_attempts.
+    """
+    status = "failed" if unit.attempts >= max_attempts else "pending"
+    conn = get_pg_connection()
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    UPDATE af_sync_work_unit
+                    SET status = %s, last_error = %s, lease_owner = NULL, lease_expires_at = NULL
+                    WHERE id = %s AND lease_owner = %s
+                    """,
+                    (status, error_message, unit.id, worker_id),
+                )
+    finally:
+        release_pg_connection(conn)
+
+
+def get_batch_status(batch_key: str) -> Dict[str, int]:
+    """
+    Unit counts per status for a batch, e.g. {'done': 540, 'leased': 3, 'pending': 0}.
+    """
+    conn = get_pg_connection()
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT status, COUNT(*) FROM af_sync_work_unit WHERE batch_key = %s GROUP BY status",
+                    (batch_key,),
+                )
+                return {status: count for status, count in cur.fetchall()}
+    finally:
+        release_pg_connection(conn)
+
+
+# -----------------------------------------------------------------------------
+# Worker Loop
+# -----------------------------------------------------------------------------
+
+def process_work_unit(unit: WorkUnit) -> int:
+    """
+    Sync exactly one unit. Event streams are keyed by event date, cohort KPI by install date.
+    """
+    day = unit.unit_date.strftime("%Y-%m-%d")
+    if unit.stream in EVENT_STREAMS:
+        return sync_event_stream(unit.stream, day, day, media_source=unit.media_source, geo=unit.geo)
+    if unit.stream == COHORT_STREAM:
+        return sync_cohort_kpi(day, day, media_source=unit.media_source, geo=unit.geo)
+    raise ValueError(f"Unknown work unit stream: {unit.stream}")
+
+
+class _LeaseHeartbeat:
+    """
+    Background thread that keeps a unit's lease alive while it is processed.
+    """
+
+    def __init__(self, unit: WorkUnit, worker_id: str, lease_seconds: int):
+        self.unit = unit
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.stop_event = threading.Event()
+        self.lost = False
+        self.thread = threading.Thread(target=self._run, name=f"lease-{unit.id}", daemon=True)
+
+    def _run(self):
+        interval = max(1.0, self.lease_seconds / 3)
+        while not self.stop_event.wait(interval):
+            try:
+                if not heartbeat_work_unit(self.unit.id, self.worker_id, self.lease_seconds):
+                    self.lost = True
+                    logger.warning(f"Lost lease on work unit #{self.unit.id}; another replica reclaimed it")
+                    return
+            except Exception as e:
+                logger.warning(f"Heartbeat failed for work unit #{self.unit.id}: {e}")
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop_event.set()
+        self.thread.join()
+
+
+def drain_work_units(
+    batch_key: str,
+    worker_id: Optional[str] = None,
+    lease_seconds: int = LEASE_SECONDS,
+    processor: Callable[[WorkUnit], int] = process_work_unit,
+) -> Dict[str, int]:
+    """
+    Claim and process units until none are claimable. Other replicas may still be
+    working on their leased units when this returns.
+
+    Returns:
+        dict with units_done, units_failed, units_lost (lease reclaimed by another
+        replica mid-run; that replica reports the unit), records_processed for this worker
+    """
+    worker_id = worker_id or default_worker_id()
+    stats = {"units_done": 0, "units_failed": 0, "units_lost": 0, "records_processed": 0}
+
+    while True:
+        unit = claim_work_unit(batch_key, worker_id, lease_seconds)
+        if unit is None:
+            break
+
+        logger.info(
+            f"[{worker_id}] Work unit #{unit.id}: {unit.stream} {unit.geo}/{unit.media_source} "
+            f"{unit.unit_date} (attempt {unit.attempts})"
+        )
+        try:
+            with _LeaseHeartbeat(unit, worker_id, lease_seconds) as heartbeat:
+                records = processor(unit)
+        except Exception as e:
+            logger.error(f"Work unit #{unit.id} failed: {e}")
+            fail_work_unit(unit, worker_id, str(e))
+            stats["units_failed"] += 1
+            continue
+
+        if heartbeat.lost or not complete_work_unit(unit.id, worker_id, records):
+            logger.warning(f"Work unit #{unit.id} was reclaimed by another replica; not counting it as done")
+            stats["units_lost"] += 1
+            continue
+        stats["units_done"] += 1
+        stats["records_processed"] += records
+
+    logger.info(f"[{worker_id}] Batch {batch_key} drained: {stats}")
+    return stats
+
+
+def run_sharded_sync(
+    batch_key: str,
+    start_date: date,
+    end_date: date,
+    streams: Sequence[str] = ALL_STREAMS,
+    media_source: str = AF_MEDIA_SOURCE_DEFAULT,
+    geo: str = AF_GEO_DEFAULT,
+) -> Dict[str, int]:
+    """
+    Enqueue the batch (idempotent) and drain it with this replica.
+    Raises if any unit of the batch ended up permanently failed.
+    """
+    enqueue_work_units(batch_key, start_date, end_date, streams, media_source=media_source, geo=geo)
+    stats = drain_work_units(batch_key)
+
+    batch_status = get_batch_status(batch_key)
+    logger.info(f"Batch {batch_key} status: {batch_status}")
+    if batch_status.get("failed"):
+        raise RuntimeError(f"{batch_status['failed']} work units failed in batch {batch_key}")
+    return stats
+
+
+def run_sharded_sync_with_logging(
+    batch_key: str,
+    start_date: date,
+    end_date: date,
+    streams: Sequence[str] = ALL_STREAMS,
+) -> int:
+    """
+    run_sharded_sync with an af_sync_log entry per replica.
+    Returns the number of records processed by this replica.
+    """
+    date_range = f"{start_date} to {end_date}"
+    log_id = create_sync_log("sharded", start_date, end_date)
+    try:
+        stats = run_sharded_sync(batch_key, start_date, end_date, streams)
+        update_sync_log(log_id, "success", stats["records_processed"], sync_type="sharded", date_range=date_range)
+        return stats["records_processed"]
+    except Exception as e:
+        update_sync_log(log_id, "failed", error_message=str(e), sync_type="sharded", date_range=date_range)
+        raise
+
+
+def stream_groups(events: bool = True, kpi: bool = True) -> List[str]:
+    streams: List[str] = []
+    if events:
+        streams.extend(EVENT_STREAMS)
+    if kpi:
+        streams.append(COHORT_STREAM)
+    return streams
@@ -824,6 +824,8 @@ async function upsertBaselineMetricsRow(params: {
         baselineMetrics.platform,
       ],
       set: updateValues,
+      // Manually maintained rows are never overwritten (same rule as baseline_metrics.py)
+      where: sql`${baselineMetrics.manualOverride} IS NOT TRUE`,
     })
 
   return {
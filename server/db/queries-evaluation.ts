@@ -31,6 +31,7 @@ import {
   type NewActionRecommendation,
   afCohortKpiDaily,
   afEvents,
+  optimizerDailyStats,
 } from './schema'
 import { and, desc, eq, inArray, sql, gte, lte, sum } from 'drizzle-orm'
 
@@ -310,7 +311,18 @@ export async function getCampaignEvaluationsByStatus(status: string) {
  * Create campaign evaluation
  */
 export async function createCampaignEvaluation(evaluation: NewCampaignEvaluation) {
-  const result = await db.insert(campaignEvaluation).values(evaluation).returning()
+  // One row per (campaign, date). Rows written here carry no input fingerprint,
+  // which marks them as TS-written: the Python evaluators never overwrite them.
+  const { createdAt, ...updatable } = { inputFingerprint: null, ...evaluation } as Record<string, unknown>
+
+  const result = await db
+    .insert(campaignEvaluation)
+    .values(evaluation)
+    .onConflictDoUpdate({
+      target: [campaignEvaluation.campaignId, campaignEvaluation.evaluationDate],
+      set: updatable,
+    })
+    .returning()
 
   return result[0]
 }
@@ -429,7 +441,17 @@ export async function getCreativeEvaluation(params: {
  * Create creative evaluation
  */
 export async function createCreativeEvaluation(evaluation: NewCreativeEvaluation) {
-  const result = await db.insert(creativeEvaluation).values(evaluation).returning()
+  // One row per (campaign, creative, stage); see createCampaignEvaluation
+  const { createdAt, ...updatable } = { inputFingerprint: null, ...evaluation } as Record<string, unknown>
+
+  const result = await db
+    .insert(creativeEvaluation)
+    .values(evaluation)
+    .onConflictDoUpdate({
+      target: [creativeEvaluation.campaignId, creativeEvaluation.creativeId, creativeEvaluation.evaluationDay],
+      set: updatable,
+    })
+    .returning()
 
   return result[0]
 }
@@ -600,7 +622,9 @@ export async function getOperationScores(params: {
  * Create operation score
  */
 export async function createOperationScore(score: NewOperationScore) {
-  const { createdAt, ...updatable } = score as Record<string, unknown>
+  // A TS-side rescore clears the Python input fingerprint unless one is given, so
+  // the Python re-scores leave this row alone (see createCampaignEvaluation)
+  const { createdAt, ...updatable } = { inputFingerprint: null, ...score } as Record<string, unknown>
 
   const result = await db
     .insert(operationScore)
@@ -611,25 +635,93 @@ export async function createOperationScore(score: NewOperationScore) {
     })
     .returning()
 
-  return result[0]
+  const saved = result[0]
+  if (saved?.optimizerEmail) {
+    await refreshOptimizerDailyStats([
+      { optimizerEmail: saved.optimizerEmail, operationDate: saved.operationDate },
+    ])
+  }
+
+  return saved
+}
+
+/**
+ * Operation score buckets on min(roas, ret) achievement rate, in percent.
+ * Must match scoring.OPERATION_THRESHOLDS (Python).
+ */
+export const OPERATION_SCORE_THRESHOLDS = { qualifiedRate: 85, excellentRate: 110 }
+
+/**
+ * Recompute optimizer_daily_stats for the touched (optimizer, operation date)
+ * buckets from operation_score; buckets without rows left are deleted.
+ *
+ * The statement is the refresh_optimizer_daily_stats SQL function (created by
+ * the add-optimizer-daily-stats migration), shared with the Python
+ * OperationEvaluator.refresh_optimizer_stats.
+ */
+export async function refreshOptimizerDailyStats(
+  keys: Array<{ optimizerEmail: string; operationDate: string }>,
+  thresholds: { qualifiedRate: number; excellentRate: number } = OPERATION_SCORE_THRESHOLDS
+) {
+  if (keys.length === 0) return
+
+  // sql.param binds each array as one parameter (a bare array would expand to a list)
+  const emails = keys.map((k) => k.optimizerEmail)
+  const dates = keys.map((k) => k.operationDate)
+  const { qualifiedRate, excellentRate } = thresholds
+
+  await db.execute(sql`
+    SELECT refresh_optimizer_daily_stats(
+      ${sql.param(emails)}::text[], ${sql.param(dates)}::date[], ${qualifiedRate}, ${excellentRate}
+    )
+  `)
+}
+
+export interface OptimizerLeaderboardFilters {
+  days?: number // look back window on operation date; omit for all time
+  operationType?: string
+  accountId?: number
+  scoreStage?: string
 }
 
 /**
  * Get optimizer leaderboard
+ *
+ * Reads the pre-aggregated optimizer_daily_stats (kept current on every
+ * operation_score write), so any window / filter is a small sum.
  */
-export async function getOptimizerLeaderboard() {
+export async function getOptimizerLeaderboard(filters: OptimizerLeaderboardFilters = {}) {
+  const { days, operationType, accountId, scoreStage } = filters
+
+  const conditions = []
+  if (days !== undefined) {
+    conditions.push(gte(optimizerDailyStats.operationDate, sql`CURRENT_DATE - ${days}::int`))
+  }
+  if (operationType) {
+    conditions.push(eq(optimizerDailyStats.operationType, operationType))
+  }
+  if (accountId !== undefined) {
+    conditions.push(eq(optimizerDailyStats.accountId, accountId))
+  }
+  if (scoreStage) {
+    conditions.push(eq(optimizerDailyStats.scoreStage, scoreStage))
+  }
+
+  const avgRoas = sql<number>`sum(${optimizerDailyStats.roasAchievementSum}) / nullif(sum(${optimizerDailyStats.roasAchievementCount}), 0)`
+
   const result = await db
     .select({
-      optimizerEmail: operationScore.optimizerEmail,
-      totalOperations: sql<number>`count(*)`,
-      avgRoasAchievementRate: sql<number>`avg(${operationScore.roasAchievementRate})`,
-      avgRetAchievementRate: sql<number>`avg(${operationScore.retAchievementRate})`,
-      excellentCount: sql<number>`count(*) filter (where ${operationScore.roasAchievementRate} >= 110 and ${operationScore.retAchievementRate} >= 110)`,
-      failureCount: sql<number>`count(*) filter (where ${operationScore.roasAchievementRate} < 85 or ${operationScore.retAchievementRate} < 85)`,
+      optimizerEmail: optimizerDailyStats.optimizerEmail,
+      totalOperations: sql<number>`sum(${optimizerDailyStats.totalOperations})`,
+      avgRoasAchievementRate: avgRoas,
+      avgRetAchievementRate: sql<number>`sum(${optimizerDailyStats.retAchievementSum}) / nullif(sum(${optimizerDailyStats.retAchievementCount}), 0)`,
+      excellentCount: sql<number>`sum(${optimizerDailyStats.excellentCount})`,
+      failureCount: sql<number>`sum(${optimizerDailyStats.failedCount})`,
     })
-    .from(operationScore)
-    .groupBy(operationScore.optimizerEmail)
-    .orderBy(desc(sql`avg(${operationScore.roasAchievementRate})`))
+    .from(optimizerDailyStats)
+    .where(conditions.length > 0 ? and(...conditions) : undefined)
+    .groupBy(optimizerDailyStats.optimizerEmail)
+    .orderBy(sql`${avgRoas} DESC NULLS LAST`)
 
   return result.map((row) => ({
     optimizerEmail: row.optimizerEmail || 'unknown',
@@ -647,6 +739,19 @@ export async function getOptimizerLeaderboard() {
   }))
 }
 
+/**
+ * Rolling leaderboards (default 7 / 30 / 90 days) keyed by window
+ */
+export async function getOptimizerLeaderboards(
+  windows: number[] = [7, 30, 90],
+  filters: Omit<OptimizerLeaderboardFilters, 'days'> = {}
+) {
+  const boards = await Promise.all(
+    windows.map((days) => getOptimizerLeaderboard({ ...filters, days }))
+  )
+  return Object.fromEntries(windows.map((days, i) => [days, boards[i]]))
+}
+
 // ============================================
 // ACTION RECOMMENDATION FUNCTIONS
 // ============================================
@@ -12,6 +12,7 @@ import {
   date,
   varchar,
   bigint,
+  doublePrecision,
 } from 'drizzle-orm/pg-core'
 
 // ============================================
@@ -413,12 +414,16 @@ export const campaignEvaluation = pgTable(
     recommendationType: varchar('recommendation_type', { length: 50 }), // 观察/保守扩量/激进扩量/保守缩量/激进缩量/关停
     status: varchar('status', { length: 20 }), // 正常/预警/危险
 
+    // Hash of the evaluation inputs (performance row, baseline, thresholds);
+    // re-evaluations with the same fingerprint skip the write
+    inputFingerprint: varchar('input_fingerprint', { length: 64 }),
+
     // Tracking
     createdAt: timestamp('created_at').defaultNow().notNull(),
   },
   (table) => ({
-    // Composite index for time-series queries
-    campaignDateIdx: index('campaign_date_idx').on(table.campaignId, table.evaluationDate),
+    // One evaluation per campaign per date (upsert target)
+    campaignDateIdx: uniqueIndex('campaign_date_uidx').on(table.campaignId, table.evaluationDate),
 
     // Status filter index
     statusIdx: index('status_idx').on(table.status),
@@ -465,12 +470,15 @@ export const creativeEvaluation = pgTable(
     // Status: 测试中/不及格/及格/出量好素材/待确认/已同步
     creativeStatus: varchar('creative_status', { length: 30 }),
 
+    // Hash of the evaluation inputs (performance row, baseline thresholds)
+    inputFingerprint: varchar('input_fingerprint', { length: 64 }),
+
     // Tracking
     createdAt: timestamp('created_at').defaultNow().notNull(),
   },
   (table) => ({
-    // Composite index for creative lookup
-    creativeIdx: index('creative_idx').on(table.campaignId, table.creativeId, table.evaluationDay),
+    // One evaluation per creative per stage (upsert target)
+    creativeIdx: uniqueIndex('creative_stage_uidx').on(table.campaignId, table.creativeId, table.evaluationDay),
 
     // Status filter index
     creativeStatusIdx: index('creative_status_idx').on(table.creativeStatus),
@@ -544,6 +552,9 @@ export const operationScore = pgTable(
     suggestionType: varchar('suggestion_type', { length: 50 }), // expand/shrink/observe/stop
     suggestionDetail: text('suggestion_detail'),
 
+    // Hash of the scoring inputs (performance row, baseline, thresholds)
+    inputFingerprint: varchar('input_fingerprint', { length: 64 }),
+
     // Tracking
     createdAt: timestamp('created_at').defaultNow().notNull(),
   },
@@ -595,6 +606,59 @@ export const optimizerLeaderboard = pgTable(
 export type OptimizerLeaderboard = typeof optimizerLeaderboard.$inferSelect
 export type NewOptimizerLeaderboard = typeof optimizerLeaderboard.$inferInsert
 
+// ============================================
+// OPTIMIZER DAILY STATS TABLE - 优化师每日评分聚合
+// ============================================
+// Per optimizer / operation date / account / operation type / stage
+// aggregates of operation_score, recomputed for the touched (optimizer, date)
+// buckets whenever operation_score rows are written. Leaderboards for any
+// window are sums over this table.
+export const optimizerDailyStats = pgTable(
+  'optimizer_daily_stats',
+  {
+    // Primary key
+    id: serial('id').primaryKey(),
+
+    // Dimensions
+    optimizerEmail: varchar('optimizer_email', { length: 100 }).notNull(),
+    operationDate: date('operation_date').notNull(),
+    accountId: integer('account_id').default(0).notNull(), // 0 = operation not linked to change_events
+    operationType: varchar('operation_type', { length: 50 }).default('OTHER').notNull(),
+    scoreStage: varchar('score_stage', { length: 10 }).default('T+7').notNull(),
+
+    // Counts per score bucket (min(roas, ret) achievement rate)
+    totalOperations: integer('total_operations').default(0).notNull(),
+    excellentCount: integer('excellent_count').default(0).notNull(), // ≥110%
+    qualifiedCount: integer('qualified_count').default(0).notNull(), // 85-110%
+    failedCount: integer('failed_count').default(0).notNull(), // <85%
+
+    // Sums / counts for averages (null rates are excluded)
+    roasAchievementSum: decimal('roas_achievement_sum', { precision: 14, scale: 2 }).default('0').notNull(),
+    roasAchievementCount: integer('roas_achievement_count').default(0).notNull(),
+    retAchievementSum: decimal('ret_achievement_sum', { precision: 14, scale: 2 }).default('0').notNull(),
+    retAchievementCount: integer('ret_achievement_count').default(0).notNull(),
+    minAchievementSum: decimal('min_achievement_sum', { precision: 14, scale: 2 }).default('0').notNull(),
+    minAchievementCount: integer('min_achievement_count').default(0).notNull(),
+
+    // Tracking
+    lastUpdated: timestamp('last_updated').defaultNow().notNull(),
+  },
+  (table) => ({
+    uniqueOptimizerDailyStats: uniqueIndex('unique_optimizer_daily_stats').on(
+      table.optimizerEmail,
+      table.operationDate,
+      table.accountId,
+      table.operationType,
+      table.scoreStage
+    ),
+    // Window scans
+    optimizerDailyStatsDateIdx: index('optimizer_daily_stats_date_idx').on(table.operationDate),
+  })
+)
+
+export type OptimizerDailyStats = typeof optimizerDailyStats.$inferSelect
+export type NewOptimizerDailyStats = typeof optimizerDailyStats.$inferInsert
+
 // ============================================
 // ACTION RECOMMENDATION TABLE - 建议动作表
 // ============================================
@@ -822,6 +886,7 @@ export const afCohortKpiDaily = pgTable(
 
     // Tracking
     lastRefreshedAt: timestamp('last_refreshed_at', { withTimezone: true }).notNull().defaultNow(),
+    settledAt: timestamp('settled_at', { withTimezone: true }), // Re-fetched unchanged after maturing
   },
   (table) => ({
     // Unique constraint on cohort dimensions (acts as logical primary key)
@@ -846,3 +911,88 @@ export const afCohortKpiDaily = pgTable(
 
 export type AfCohortKpiDaily = typeof afCohortKpiDaily.$inferSelect
 export type NewAfCohortKpiDaily = typeof afCohortKpiDaily.$inferInsert
+
+// AppsFlyer Cohort Sketch Table - 每日 cohort 分位数草图 (mergeable t-digest, server/appsflyer/cohort_sketches.py)
+export const afCohortSketch = pgTable(
+  'af_cohort_sketch',
+  {
+    id: serial('id').primaryKey(),
+
+    // Cohort dimensions (one sketch per install date and metric)
+    appId: text('app_id').notNull(),
+    geo: text('geo').notNull(),
+    mediaSource: text('media_source').notNull(),
+    installDate: date('install_date').notNull(),
+    metric: varchar('metric', { length: 20 }).notNull(), // 'roas_d3' | 'roas_d7' | 'ret_d3' | 'ret_d7'
+
+    // t-digest: centroid means / weights sorted by mean, plus exact extremes
+    centroidMeans: doublePrecision('centroid_means').array().notNull(),
+    centroidWeights: doublePrecision('centroid_weights').array().notNull(),
+    minValue: doublePrecision('min_value').notNull(),
+    maxValue: doublePrecision('max_value').notNull(),
+    sampleCount: integer('sample_count').notNull(), // campaigns with a value that day
+
+    updatedAt: timestamp('updated_at', { withTimezone: true }).notNull().defaultNow(),
+  },
+  (table) => ({
+    uniqueSketch: uniqueIndex('unique_af_cohort_sketch').on(
+      table.appId,
+      table.geo,
+      table.mediaSource,
+      table.metric,
+      table.installDate
+    ),
+    installDateIdx: index('idx_af_cohort_sketch_install_date').on(table.installDate),
+  })
+)
+
+export type AfCohortSketch = typeof afCohortSketch.$inferSelect
+export type NewAfCohortSketch = typeof afCohortSketch.$inferInsert
+
+// AppsFlyer Sync Work Unit Table - 同步分片任务表 (lease-based sharding across ETL replicas)
+export const afSyncWorkUnit = pgTable(
+  'af_sync_work_unit',
+  {
+    id: serial('id').primaryKey(),
+
+    // Batch identity: replicas running the same sync share one batch_key
+    batchKey: text('batch_key').notNull(), // e.g. 'backfill:2025-06-01:2025-11-27'
+
+    // Unit dimensions
+    stream: varchar('stream', { length: 30 }).notNull(), // 'iap_purchase' | 'af_ad_revenue' | 'cohort_kpi'
+    appId: text('app_id').notNull(),
+    geo: text('geo').notNull(),
+    mediaSource: text('media_source').notNull(),
+    unitDate: date('unit_date').notNull(), // event date (events) or install date (cohort_kpi)
+
+    // Lease state
+    status: varchar('status', { length: 20 }).notNull().default('pending'), // 'pending' | 'leased' | 'done' | 'failed'
+    leaseOwner: text('lease_owner'),
+    leaseExpiresAt: timestamp('lease_expires_at', { withTimezone: true }),
+    heartbeatAt: timestamp('heartbeat_at', { withTimezone: true }),
+    attempts: integer('attempts').notNull().default(0),
+
+    // Result
+    recordsProcessed: integer('records_processed'),
+    lastError: text('last_error'),
+
+    // Timestamps
+    createdAt: timestamp('created_at', { withTimezone: true }).notNull().defaultNow(),
+    completedAt: timestamp('completed_at', { withTimezone: true }),
+  },
+  (table) => ({
+    uniqueUnit: uniqueIndex('unique_af_sync_work_unit').on(
+      table.batchKey,
+      table.stream,
+      table.appId,
+      table.geo,
+      table.mediaSource,
+      table.unitDate
+    ),
+    // Claim scan: pending or expired leases within a batch
+    claimIdx: index('idx_af_sync_work_unit_claim').on(table.batchKey, table.status, table.leaseExpiresAt),
+  })
+)
+
+export type AfSyncWorkUnit = typeof afSyncWorkUnit.$inferSelect
+export type NewAfSyncWorkUnit = typeof afSyncWorkUnit.$inferInsert
@@ -0,0 +1,183 @@
+"""
+Process-wide baseline cache
+
+safety_baseline and creative_test_baseline only hold a few dozen
+(product, country, platform, channel) keys, but every evaluation used to look
+its row up with a separate query. BaselineCache loads both tables with one
+query and serves lookups from memory.
+
+Freshness:
+- TTL: a full reload after `ttl` seconds (BASELINE_CACHE_TTL, default 300)
+- last_updated: every `check_interval` seconds (BASELINE_CACHE_CHECK_INTERVAL,
+  default 30) one cheap query compares max(last_updated) / row counts of both
+  tables and reloads when they moved
+- NOTIFY (optional, BASELINE_CACHE_LISTEN=true): LISTEN on `baseline_updated`,
+  which BaselineCalculator publishes after writing; a notification invalidates
+  immediately without waiting for the next check
+
+Usage:
+    from baseline_cache import get_baseline_cache
+
+    baseline = get_baseline_cache().safety(self.db, product, country, platform, channel)
+"""
+
+import os
+import sys
+import time
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import psycopg2
+import psycopg2.extensions
+
+BASELINE_NOTIFY_CHANNEL = "baseline_updated"
+
+BaselineKey = Tuple[str, str, str, str]
+
+LOAD_QUERY = """
+    SELECT
+        'safety' AS kind,
+        product_name, country_code, platform, channel,
+        baseline_roas7, baseline_ret7, reference_period,
+        NULL::numeric AS max_cpi, NULL::numeric AS min_roas_d3,
+        NULL::numeric AS min_roas_d7, NULL::numeric AS excellent_cvr,
+        last_updated
+    FROM safety_baseline
+    UNION ALL
+    SELECT
+        'creative' AS kind,
+        product_name, country_code, platform, channel,
+        NULL, NULL, NULL,
+        max_cpi, min_roas_d3, min_roas_d7, excellent_cvr,
+        last_updated
+    FROM creative_test_baseline
+"""
+
+VERSION_QUERY = """
+    SELECT
+        (SELECT MAX(last_updated) FROM safety_baseline) AS safety_updated,
+        (SELECT COUNT(*) FROM safety_baseline) AS safety_count,
+        (SELECT MAX(last_updated) FROM creative_test_baseline) AS creative_updated,
+        (SELECT COUNT(*) FROM creative_test_baseline) AS creative_count
+"""
+
+SAFETY_FIELDS = ('baseline_roas7', 'baseline_ret7', 'reference_period', 'last_updated')
+CREATIVE_FIELDS = ('max_cpi', 'min_roas_d3', 'min_roas_d7', 'excellent_cvr', 'last_updated')
+
+
+class BaselineCache:
+    """In-memory safety / creative test baselines keyed by (product, country, platform, channel)"""
+
+    def __init__(self, ttl: float = 300.0, check_interval: float = 30.0, listen: bool = False):
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self.listen = listen
+        self._lock = threading.Lock()
+        self._safety: Dict[BaselineKey, Dict[str, Any]] = {}
+        self._creative: Dict[BaselineKey, Dict[str, Any]] = {}
+        self._version: Optional[Tuple] = None
+        self._loaded_at = 0.0
+        self._checked_at = 0.0
+        self._listen_conn = None
+        self.loads = 0
+
+    def safety(self, db, product_name: str, country_code: str, platform: str, channel: str) -> Optional[Dict[str, Any]]:
+        """safety_baseline row (baseline_roas7, baseline_ret7, reference_period) or None"""
+        self._ensure_fresh(db)
+        return self._safety.get((product_name, country_code, platform, channel))
+
+    def creative(self, db, product_name: str, country_code: str, platform: str, channel: str) -> Optional[Dict[str, Any]]:
+        """creative_test_baseline row (max_cpi, min_roas_d3, min_roas_d7, excellent_cvr) or None"""
+        self._ensure_fresh(db)
+        return self._creative.get((product_name, country_code, platform, channel))
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._loaded_at = 0.0
+
+    # -- freshness --------------------------------------------------------------
+
+    def _ensure_fresh(self, db) -> None:
+        with self._lock:
+            now = time.monotonic()
+            if self.listen and self._notified():
+                self._loaded_at = 0.0
+            if not self._loaded_at or now - self._loaded_at >= self.ttl:
+                self._load(db, now)
+            elif now - self._checked_at >= self.check_interval:
+                self._checked_at = now
+                if self._read_version(db) != self._version:
+                    self._load(db, now)
+
+    def _read_version(self, db) -> Tuple:
+        rows = db.execute_query(VERSION_QUERY)
+        row = rows[0] if rows else {}
+        return (row.get('safety_updated'), row.get('safety_count'),
+                row.get('creative_updated'), row.get('creative_count'))
+
+    def _load(self, db, now: float) -> None:
+        safety: Dict[BaselineKey, Dict[str, Any]] = {}
+        creative: Dict[BaselineKey, Dict[str, Any]] = {}
+        try:
+            # iter_query raises where execute_query would return [] on error:
+            # a failed load must not look like two empty tables
+            for row in db.iter_query(LOAD_QUERY):
+                key = (row['product_name'], row['country_code'], row['platform'], row['channel'])
+                if row['kind'] == 'safety':
+                    safety[key] = {f: row[f] for f in SAFETY_FIELDS}
+                else:
+                    creative[key] = {f: row[f] for f in CREATIVE_FIELDS}
+        except Exception as e:
+            # Keep serving the previous baselines; not marked fresh, so the next lookup retries
+            print(f"Baseline cache load failed, keeping previous baselines: {e}", file=sys.stderr, flush=True)
+            if db.conn is not None and not db.conn.closed:
+                db.conn.rollback()
+            return
+        self._safety, self._creative = safety, creative
+        # Same shape as VERSION_QUERY, derived from the loaded rows
+        self._version = (
+            max((r['last_updated'] for r in safety.values()), default=None), len(safety),
+            max((r['last_updated'] for r in creative.values()), default=None), len(creative),
+        )
+        self._loaded_at = self._checked_at = now
+        self.loads += 1
+
+    def _notified(self) -> bool:
+        """Non-blocking check for baseline_updated notifications"""
+        try:
+            if self._listen_conn is None:
+                url = os.getenv('DATABASE_URL')
+                if not url:
+                    return False
+                self._listen_conn = psycopg2.connect(url)
+                self._listen_conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with self._listen_conn.cursor() as cur:
+                    cur.execute(f"LISTEN {BASELINE_NOTIFY_CHANNEL}")
+                return False
+            self._listen_conn.poll()
+            if self._listen_conn.notifies:
+                self._listen_conn.notifies.clear()
+                return True
+            return False
+        except psycopg2.Error as e:
+            print(f"Baseline cache listen error: {e}", file=sys.stderr, flush=True)
+            self._listen_conn = None
+            # Connection trouble: fall back to reloading rather than serving possibly stale data
+            return True
+
+
+_CACHE: Optional[BaselineCache] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_baseline_cache() -> BaselineCache:
+    """Process-wide BaselineCache configured from BASELINE_CACHE_* env vars"""
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = BaselineCache(
+                ttl=float(os.getenv('BASELINE_CACHE_TTL', '300')),
+                check_interval=float(os.getenv('BASELINE_CACHE_CHECK_INTERVAL', '30')),
+                listen=os.getenv('BASELINE_CACHE_LISTEN', '').lower() in ('true', '1', 'yes'),
+            )
+        return _CACHE
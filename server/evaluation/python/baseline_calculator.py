@@ -9,7 +9,8 @@ This baseline represents the "passing grade" for campaign performance.
 import sys
 from datetime import datetime, timedelta
 from typing import Dict, Any, List, Optional
-from db_utils import get_db, format_output, read_input
+from db_utils import get_db, format_output, read_input, output_stream, BatchResults, NdjsonStream
+from baseline_cache import BASELINE_NOTIFY_CHANNEL
 
 
 class BaselineCalculator:
@@ -153,31 +154,42 @@ class BaselineCalculator:
         """
         try:
             with self.db:
+                # NOTIFY in the same statement: delivered on commit, lets
+                # listening BaselineCache instances reload immediately
                 query = """
-                    INSERT INTO safety_baseline (
-                        product_name, country_code, platform, channel,
-                        baseline_roas7, baseline_ret7, reference_period, last_updated
+                    WITH upserted AS (
+                        INSERT INTO safety_baseline (
+                            product_name, country_code, platform, channel,
+                            baseline_roas7, baseline_ret7, reference_period, last_updated
+                        )
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, NOW())
+                        ON CONFLICT (product_name, country_code, platform, channel)
+                        DO UPDATE SET
+                            baseline_roas7 = EXCLUDED.baseline_roas7,
+                            baseline_ret7 = EXCLUDED.baseline_ret7,
+                            reference_period = EXCLUDED.reference_period,
+                            last_updated = NOW()
+                        RETURNING 1
                     )
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, NOW())
-                    ON CONFLICT (product_name, country_code, platform, channel)
-                    DO UPDATE SET
-                        baseline_roas7 = EXCLUDED.baseline_roas7,
-                        baseline_ret7 = EXCLUDED.baseline_ret7,
-                        reference_period = EXCLUDED.reference_period,
-                        last_updated = NOW()
+                    SELECT pg_notify(%s, %s) FROM upserted
                 """
 
                 return self.db.execute_update(
                     query,
                     (product_name, country_code, platform, channel,
-                     baseline_roas7, baseline_ret7, reference_period)
+                     baseline_roas7, baseline_ret7, reference_period,
+                     BASELINE_NOTIFY_CHANNEL, f"safety:{product_name}/{country_code}/{platform}/{channel}")
                 )
 
         except Exception as e:
             print(f"Upsert baseline error: {e}", file=sys.stderr, flush=True)
             return False
 
-    def update_all_baselines(self, current_date: Optional[str] = None) -> Dict[str, Any]:
+    def update_all_baselines(
+        self,
+        current_date: Optional[str] = None,
+        stream: Optional[NdjsonStream] = None
+    ) -> Dict[str, Any]:
         """
         Batch update baselines for all product/country/platform/channel combinations
 
@@ -185,6 +197,8 @@ class BaselineCalculator:
 
         Args:
             current_date: Current date in ISO format (default: today)
+            stream: Write each combination's result as it is upserted instead
+                of collecting "results"
 
         Returns:
             Dictionary containing:
@@ -210,7 +224,7 @@ class BaselineCalculator:
 
                 updated_count = 0
                 failed_count = 0
-                results = []
+                results = BatchResults(stream)
 
                 for combo in combinations:
                     # Calculate baseline for this combination
@@ -266,7 +280,7 @@ class BaselineCalculator:
                     "updated_count": updated_count,
                     "failed_count": failed_count,
                     "total_count": len(combinations),
-                    "results": results
+                    "results": results.items
                 }
 
         except Exception as e:
@@ -284,6 +298,7 @@ def main():
     input_data = read_input()
 
     calculator = BaselineCalculator()
+    stream = output_stream(input_data)
 
     action = input_data.get('action', 'calculate')
 
@@ -299,13 +314,14 @@ def main():
     elif action == 'update_all':
         # Batch update all baselines
         result = calculator.update_all_baselines(
-            current_date=input_data.get('currentDate')
+            current_date=input_data.get('currentDate'),
+            stream=stream
         )
     else:
         result = {"error": f"Unknown action: {action}"}
 
     # Output result as JSON to stdout
-    format_output(result)
+    format_output(result, stream)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""
+Evaluation benchmark over synthetic data (bench/synthetic_data.py).
+
+Batch actions run warm in-process, with evaluation rows of the benchmark
+data cleared before each repeat so every run does the full work:
+    campaign.evaluate_all, operation.evaluate_batch, operation.evaluate_7days_ago,
+    operation.evaluate_due_stages, creative.evaluate_all_due,
+    creative.check_closure_all, baseline.update_all
+Per action: items, seconds, items/s, p50 / p99 per item (time between
+consecutive results handed to the NDJSON stream, the first one including
+the initial query) and DB round trips (counted at the psycopg2 cursor /
+connection, including BEGIN, COMMIT and named-cursor FETCHes).
+
+Single-item actions (campaign evaluate, operation evaluate, creative
+evaluate_d3, baseline calculate) compare, over --calls sampled keys:
+    spawn   - one `python3 <script>` per call, as the TypeScript wrappers do
+    warm    - in-process method call (connects per call)
+    shared  - in-process calls inside one `with db:` (one connection and its
+              prepared statements)
+
+Use a scratch database: update_all and check_closure_all cover every
+combination / test campaign in the tables, not only the benchmark rows.
+The evaluators read mock_campaign_performance, which migration 20251129085803
+drops; on a database migrated to head, add --create-table to --generate to
+recreate it (see bench/synthetic_data.py), otherwise the benchmark exits
+with an explanation.
+
+Usage:
+    python bench/evaluation_benchmark.py --generate 10000
+    python bench/evaluation_benchmark.py --generate 10000 --create-table   # database migrated to head
+    python bench/evaluation_benchmark.py --generate 100000 --days 8 --repeat 1 --calls 10
+    python bench/evaluation_benchmark.py --actions campaign.evaluate_all,creative.evaluate_all_due --json out.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+from datetime import date, timedelta
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+EVALUATION_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, EVALUATION_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import numpy as np
+import psycopg2
+import psycopg2.extensions
+
+from db_utils import get_db, NdjsonStream
+from campaign_evaluator import CampaignEvaluator
+from operation_evaluator import OperationEvaluator
+from creative_evaluator import CreativeEvaluator
+from baseline_calculator import BaselineCalculator
+from synthetic_data import (
+    PREFIX, ACCOUNT_CUSTOMER_ID, PERFORMANCE_TABLE, MISSING_TABLE_MESSAGE, generate, reset, table_exists,
+)
+
+
+# ============================================
+# Round-trip counting
+# ============================================
+
+class RoundTrips:
+    count = 0
+
+
+def _counting_cursor(factory: type) -> type:
+    counting = _COUNTING_CURSORS.get(factory)
+    if counting is not None:
+        return counting
+
+    class CountingCursor(factory):
+        def _begin(self):
+            # psycopg2 sends BEGIN as its own round trip before the first statement
+            if not self.connection.autocommit and self.connection.status == psycopg2.extensions.STATUS_READY:
+                RoundTrips.count += 1
+
+        def execute(self, query, vars=None):
+            self._begin()
+            RoundTrips.count += 1
+            return super().execute(query, vars)
+
+        def executemany(self, query, vars_list):
+            self._begin()
+            RoundTrips.count += len(vars_list) if hasattr(vars_list, '__len__') else 1
+            return super().executemany(query, vars_list)
+
+        def copy_expert(self, sql, file, size=8192):
+            self._begin()
+            RoundTrips.count += 1
+            return super().copy_expert(sql, file, size)
+
+        def fetchmany(self, size=None):
+            if self.name:
+                RoundTrips.count += 1
+            return super().fetchmany(size) if size is not None else super().fetchmany()
+
+        def fetchall(self):
+            if self.name:
+                RoundTrips.count += 1
+            return super().fetchall()
+
+    _COUNTING_CURSORS[factory] = CountingCursor
+    return CountingCursor
+
+
+_COUNTING_CURSORS: Dict[type, type] = {}
+
+
+class CountingConnection(psycopg2.extensions.connection):
+    def cursor(self, *args, **kwargs):
+        factory = kwargs.get('cursor_factory') or self.cursor_factory or psycopg2.extensions.cursor
+        kwargs['cursor_factory'] = _counting_cursor(factory)
+        return super().cursor(*args, **kwargs)
+
+    def commit(self):
+        if self.status != psycopg2.extensions.STATUS_READY:
+            RoundTrips.count += 1
+        return super().commit()
+
+    def rollback(self):
+        if self.status != psycopg2.extensions.STATUS_READY:
+            RoundTrips.count += 1
+        return super().rollback()
+
+
+def count_round_trips() -> None:
+    """Make every psycopg2.connect in this process (Database.connect) count round trips"""
+    if not getattr(psycopg2.connect, 'counting', False):
+        connect = partial(psycopg2.connect, connection_factory=CountingConnection)
+        connect.counting = True
+        psycopg2.connect = connect
+
+
+# ============================================
+# Batch actions
+# ============================================
+
+class _NullOut:
+    def write(self, data):
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+class TimingStream(NdjsonStream):
+    """NdjsonStream that encodes each item as usual but keeps only its timestamp"""
+
+    def __init__(self):
+        super().__init__(out=_NullOut())
+        self.times: List[float] = []
+
+    def item(self, data: Any) -> None:
+        super().item(data)
+        self.times.append(time.perf_counter())
+
+
+def batch_actions(window: Dict[str, date]) -> Dict[str, Callable[[NdjsonStream], Dict[str, Any]]]:
+    end, start = window["end"], window["start"]
+    return {
+        "campaign.evaluate_all": lambda stream: CampaignEvaluator().evaluate_all_campaigns(
+            evaluation_date=end.isoformat(), stream=stream),
+        "operation.evaluate_batch": lambda stream: OperationEvaluator().evaluate_operations_batch(
+            target_date=start.isoformat(), stream=stream),
+        "operation.evaluate_7days_ago": lambda stream: OperationEvaluator().evaluate_operations_7days_ago(
+            stream=stream),
+        "operation.evaluate_due_stages": lambda stream: OperationEvaluator().evaluate_due_stages(
+            as_of=end.isoformat(), lookback_days=(end - start).days, stream=stream),
+        "creative.evaluate_all_due": lambda stream: CreativeEvaluator().evaluate_due_creatives(
+            evaluation_date=end.isoformat(), stream=stream),
+        "creative.check_closure_all": lambda stream: CreativeEvaluator().check_campaign_closures(
+            stream=stream),
+        # Reference month = month of the benchmark window (calculate_baseline looks 180 days back)
+        "baseline.update_all": lambda stream: BaselineCalculator().update_all_baselines(
+            current_date=(end + timedelta(days=180)).isoformat(), stream=stream),
+    }
+
+
+def percentiles_ms(seconds: List[float]) -> Dict[str, Optional[float]]:
+    if not seconds:
+        return {"p50_ms": None, "p99_ms": None}
+    values = np.asarray(seconds) * 1000
+    return {"p50_ms": round(float(np.percentile(values, 50)), 3), "p99_ms": round(float(np.percentile(values, 99)), 3)}
+
+
+def run_batch(name: str, action: Callable[[NdjsonStream], Dict[str, Any]], repeat: int) -> Dict[str, Any]:
+    runs = []
+    for _ in range(repeat):
+        db = get_db()
+        with db:
+            reset(db, evaluations_only=True)
+        stream = TimingStream()
+        RoundTrips.count = 0
+        started = time.perf_counter()
+        result = action(stream)
+        seconds = time.perf_counter() - started
+        gaps = np.diff([started] + stream.times).tolist()
+        runs.append({
+            "items": stream.count,
+            "seconds": round(seconds, 3),
+            "items_per_s": round(stream.count / seconds, 1) if seconds else None,
+            **percentiles_ms(gaps),
+            "round_trips": RoundTrips.count,
+            "success": result.get("success", "error" not in result),
+        })
+    best = min(runs, key=lambda r: r["seconds"])
+    print(f"  {name:<32} {best['items']:>9} items {best['seconds']:>9.3f} s {best['items_per_s'] or 0:>10.1f}/s "
+          f"p50 {best['p50_ms'] or 0:>8.3f} ms  p99 {best['p99_ms'] or 0:>8.3f} ms  {best['round_trips']:>8} round trips"
+          + ("" if best["success"] else "  (FAILED)"), flush=True)
+    return {"best": best, "runs": runs}
+
+
+# ============================================
+# Single-item actions: spawn vs warm
+# ============================================
+
+def sample_keys(window: Dict[str, date], calls: int, seed: int) -> Dict[str, List[Dict[str, Any]]]:
+    pattern = PREFIX.replace("_", r"\_") + "%"
+    db = get_db()
+    with db:
+        db.execute_query("SELECT setseed(%s)", (seed / 1000,))
+        campaigns = db.execute_query(
+            "SELECT campaign_id FROM mock_campaign_performance WHERE campaign_id LIKE %s AND date = %s "
+            "ORDER BY random() LIMIT %s", (pattern, window["end"], calls))
+        operations = db.execute_query(
+            "SELECT ce.id FROM change_events ce JOIN accounts a ON a.id = ce.account_id "
+            "WHERE a.customer_id = %s ORDER BY random() LIMIT %s", (ACCOUNT_CUSTOMER_ID, calls))
+        creatives = db.execute_query(
+            "SELECT creative_id, campaign_id FROM mock_creative_performance WHERE campaign_id LIKE %s "
+            "ORDER BY random() LIMIT %s", (pattern, calls))
+        combos = db.execute_query(
+            "SELECT product_name, country_code, platform, channel FROM safety_baseline WHERE product_name LIKE %s "
+            "ORDER BY random() LIMIT %s", (pattern, calls))
+    current_date = (window["end"] + timedelta(days=180)).isoformat()
+    return {
+        "campaign.evaluate": [
+            {"campaignId": r["campaign_id"], "evaluationDate": window["end"].isoformat()} for r in campaigns],
+        "operation.evaluate": [{"operationId": r["id"]} for r in operations],
+        "creative.evaluate_d3": [
+            {"creativeId": r["creative_id"], "campaignId": r["campaign_id"]} for r in creatives],
+        "baseline.calculate": [
+            {"productName": r["product_name"], "countryCode": r["country_code"], "platform": r["platform"],
+             "channel": r["channel"], "currentDate": current_date} for r in combos],
+    }
+
+
+SINGLE_ACTIONS = {
+    # name: (script, stdin action, evaluator class, in-process call)
+    "campaign.evaluate": ("campaign_evaluator.py", "evaluate", CampaignEvaluator,
+                          lambda ev, k: ev.evaluate_campaign(k["campaignId"], k["evaluationDate"])),
+    "operation.evaluate": ("operation_evaluator.py", "evaluate", OperationEvaluator,
+                           lambda ev, k: ev.evaluate_operation(k["operationId"])),
+    "creative.evaluate_d3": ("creative_evaluator.py", "evaluate_d3", CreativeEvaluator,
+                             lambda ev, k: ev.evaluate_creative_d3(k["creativeId"], k["campaignId"])),
+    "baseline.calculate": ("baseline_calculator.py", "calculate", BaselineCalculator,
+                           lambda ev, k: ev.calculate_baseline(k["productName"], k["countryCode"], k["platform"],
+                                                               k["channel"], k["currentDate"])),
+}
+
+
+def run_single(name: str, keys: List[Dict[str, Any]]) -> Dict[str, Any]:
+    script, action, evaluator_class, call = SINGLE_ACTIONS[name]
+    if not keys:
+        print(f"  {name:<32} no keys in the benchmark data", flush=True)
+        return {}
+
+    spawn = []
+    for key in keys:
+        started = time.perf_counter()
+        subprocess.run(
+            [sys.executable, os.path.join(EVALUATION_DIR, script)],
+            input=json.dumps({"action": action, **key}), capture_output=True, text=True, check=True,
+        )
+        spawn.append(time.perf_counter() - started)
+
+    evaluator = evaluator_class()
+    warm = []
+    RoundTrips.count = 0
+    for key in keys:
+        started = time.perf_counter()
+        call(evaluator, key)
+        warm.append(time.perf_counter() - started)
+    warm_round_trips = RoundTrips.count / len(keys)
+
+    shared = []
+    RoundTrips.count = 0
+    with evaluator.db:
+        for key in keys:
+            started = time.perf_counter()
+            call(evaluator, key)
+            shared.append(time.perf_counter() - started)
+    shared_round_trips = RoundTrips.count / len(keys)
+
+    result = {
+        "calls": len(keys),
+        "spawn": percentiles_ms(spawn),
+        "warm": {**percentiles_ms(warm), "round_trips_per_call": round(warm_round_trips, 1)},
+        "shared": {**percentiles_ms(shared), "round_trips_per_call": round(shared_round_trips, 1)},
+    }
+    print(f"  {name:<32} spawn p50 {result['spawn']['p50_ms']:>8.1f} ms p99 {result['spawn']['p99_ms']:>8.1f} | "
+          f"warm p50 {result['warm']['p50_ms']:>7.2f} ms p99 {result['warm']['p99_ms']:>7.2f} "
+          f"({warm_round_trips:.1f} rt) | shared p50 {result['shared']['p50_ms']:>7.2f} ms "
+          f"p99 {result['shared']['p99_ms']:>7.2f} ({shared_round_trips:.1f} rt)", flush=True)
+    return result
+
+
+def data_window() -> Optional[Dict[str, date]]:
+    db = get_db()
+    with db:
+        with db.conn.cursor() as cur:
+            if not table_exists(cur, PERFORMANCE_TABLE):
+                sys.exit(MISSING_TABLE_MESSAGE)
+        rows = db.execute_query(
+            "SELECT MIN(date) AS start, MAX(date) AS end, COUNT(DISTINCT campaign_id) AS campaigns "
+            "FROM mock_campaign_performance WHERE campaign_id LIKE %s",
+            (PREFIX.replace("_", r"\_") + "%",)
+        )
+    if not rows or rows[0]["start"] is None:
+        return None
+    return {"start": rows[0]["start"], "end": rows[0]["end"], "campaigns": rows[0]["campaigns"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch and single-item evaluator benchmark on synthetic data")
+    parser.add_argument("--generate", type=int, metavar="CAMPAIGNS",
+                        help="Reset and generate this many synthetic campaigns first")
+    parser.add_argument("--days", type=int, default=8, help="Days per campaign when generating (default: 8)")
+    parser.add_argument("--create-table", action="store_true",
+                        help="With --generate: recreate mock_campaign_performance (dropped at migration head) if missing")
+    parser.add_argument("--actions", help="Comma-separated batch / single actions (default: all)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per batch action, best is reported (default: 3)")
+    parser.add_argument("--calls", type=int, default=20, help="Calls per single-item action (default: 20)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    if args.generate:
+        print(f"Generating {args.generate} campaigns x {args.days} days", flush=True)
+        loaded = generate(campaigns=args.generate, days=args.days, seed=args.seed, do_reset=True,
+                          create_table=args.create_table)
+        print(f"  loaded {loaded['rows']} in {loaded['total_seconds']} s", flush=True)
+
+    window = data_window()
+    if window is None:
+        sys.exit("No benchmark data: run bench/synthetic_data.py or pass --generate N")
+
+    count_round_trips()
+    selected = set(args.actions.split(",")) if args.actions else None
+    print(f"Benchmark data: {window['campaigns']} campaigns, {window['start']} ~ {window['end']} "
+          f"(python {platform.python_version()})", flush=True)
+
+    results: Dict[str, Any] = {"window": {k: str(v) for k, v in window.items()}, "batch": {}, "single": {}}
+    print("Batch actions (warm, best of repeats):")
+    for name, action in batch_actions(window).items():
+        if selected is None or name in selected:
+            results["batch"][name] = run_batch(name, action, args.repeat)
+
+    print(f"Single-item actions ({args.calls} calls): spawn vs warm in-process")
+    keys = sample_keys(window, args.calls, args.seed)
+    for name in SINGLE_ACTIONS:
+        if selected is None or name in selected:
+            results["single"][name] = run_single(name, keys[name])
+
+    db = get_db()
+    with db:
+        reset(db, evaluations_only=True)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2, default=str)
+        print(f"Wrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
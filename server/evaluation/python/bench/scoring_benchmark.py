@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark for the scoring kernel (scoring.py).
+
+Runs offline (no Postgres): random actual / baseline ROAS7 and RET7 arrays with
+a share of non-positive baselines and missing actuals, seeded so runs are
+comparable. Each case reports best-of-repeats seconds and rows per second.
+
+Cases (each at several sizes):
+    achievement_rates, campaign (rates + status / recommendation labels),
+    operation (rates + A5 score), stage (fraction rates + base score / risk)
+    and the legacy scalar ladder for reference (capped, it is slow)
+
+Usage:
+    python bench/scoring_benchmark.py
+    python bench/scoring_benchmark.py --sizes 1000000,10000000 --repeat 3 --json out.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+from typing import Any, Callable, Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import numpy as np
+
+from scoring import (
+    CAMPAIGN_STATUSES, RECOMMENDATION_TYPES, OPERATION_SCORES,
+    STAGE_BASE_SCORES, STAGE_RISK_LEVELS,
+    achievement_rates, campaign_codes, operation_codes, stage_codes, labels,
+)
+
+DEFAULT_SIZES = (100_000, 1_000_000, 10_000_000)
+# The scalar reference loops in Python; larger sizes only add waiting
+SCALAR_MAX_SIZE = 200_000
+
+
+def make_inputs(size: int, seed: int = 7) -> Dict[str, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    baseline_roas = rng.choice([0.5, 0.45, 0.3, 0.0], size, p=[0.4, 0.3, 0.25, 0.05])
+    baseline_ret = rng.choice([0.2, 0.15, 0.0], size, p=[0.6, 0.35, 0.05])
+    actual_roas = baseline_roas * rng.uniform(0.3, 1.6, size)
+    actual_roas[rng.random(size) < 0.01] = np.nan
+    actual_ret = baseline_ret * rng.uniform(0.3, 1.6, size)
+    return {
+        "actual_roas": actual_roas,
+        "actual_ret": actual_ret,
+        "baseline_roas": baseline_roas,
+        "baseline_ret": baseline_ret,
+    }
+
+
+def run_rates(x: Dict[str, np.ndarray]) -> Any:
+    return achievement_rates(x["actual_roas"], x["actual_ret"], x["baseline_roas"], x["baseline_ret"])
+
+
+def run_campaign(x: Dict[str, np.ndarray]) -> Any:
+    _, _, min_rate = run_rates(x)
+    codes = campaign_codes(min_rate)
+    return labels(CAMPAIGN_STATUSES, codes), labels(RECOMMENDATION_TYPES, codes)
+
+
+def run_operation(x: Dict[str, np.ndarray]) -> Any:
+    _, _, min_rate = run_rates(x)
+    return labels(OPERATION_SCORES, operation_codes(min_rate), OPERATION_SCORES[0])
+
+
+def run_stage(x: Dict[str, np.ndarray]) -> Any:
+    _, _, min_rate = achievement_rates(
+        x["actual_roas"], x["actual_ret"], x["baseline_roas"], x["baseline_ret"],
+        missing_baseline=np.nan, scale=1.0
+    )
+    codes = stage_codes(min_rate)
+    return labels(STAGE_BASE_SCORES.astype(float), codes, np.nan), labels(STAGE_RISK_LEVELS, codes)
+
+
+def run_scalar(x: Dict[str, np.ndarray]) -> Any:
+    """The pre-kernel per-row if/elif ladder, for comparison"""
+    out = []
+    for ar, at, br, bt in zip(x["actual_roas"].tolist(), x["actual_ret"].tolist(),
+                              x["baseline_roas"].tolist(), x["baseline_ret"].tolist()):
+        roas_rate = (ar / br * 100) if br > 0 else 0.0
+        ret_rate = (at / bt * 100) if bt > 0 else 0.0
+        rate = min(roas_rate, ret_rate)
+        if rate < 60:
+            out.append("danger")
+        elif rate < 85:
+            out.append("warning")
+        elif rate < 100:
+            out.append("observation")
+        elif rate < 110:
+            out.append("healthy")
+        else:
+            out.append("excellent")
+    return out
+
+
+CASES: Dict[str, Callable[[Dict[str, np.ndarray]], Any]] = {
+    "achievement_rates": run_rates,
+    "campaign": run_campaign,
+    "operation": run_operation,
+    "stage": run_stage,
+    "scalar_campaign": run_scalar,
+}
+
+
+def time_case(func: Callable[[Any], Any], arg: Any, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(arg)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_suite(sizes: List[int], repeat: int, only: str = None) -> Dict[str, Dict[str, Any]]:
+    results = {}
+    for size in sizes:
+        inputs = make_inputs(size)
+        for name, func in CASES.items():
+            if only and only not in name:
+                continue
+            if name.startswith("scalar") and size > SCALAR_MAX_SIZE:
+                continue
+            best = time_case(func, inputs, repeat)
+            key = f"{name}[{size}]"
+            results[key] = {"size": size, "best_s": best, "rows_per_s": size / best if best else float("inf")}
+            print(f"  {key:<32} {best * 1e3:>10.2f} ms  {size / best / 1e6:>9.2f} M rows/s")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput of the scoring kernel")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="Comma-separated row counts")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed repeats per case (default: 5)")
+    parser.add_argument("--only", help="Run only cases whose name contains this string")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    print(f"Scoring kernel throughput (numpy {np.__version__}, python {platform.python_version()})")
+    results = run_suite(sizes, args.repeat, args.only)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"numpy": np.__version__, "python": platform.python_version(), "results": results}, f, indent=2)
+        print(f"Wrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
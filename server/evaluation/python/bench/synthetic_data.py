@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+"""
+Synthetic evaluation data for benchmarks (local Postgres, DATABASE_URL).
+
+Generates with NumPy and COPY-loads, in chunks of campaigns:
+- safety_baseline / creative_test_baseline: one row per product / country /
+  platform / channel combination
+- mock_campaign_performance: every campaign x day of the window; actual
+  ROAS7 / RET7 scatter around the combination's baseline, spend is
+  lognormal (a share of campaigns stays under the test-campaign threshold)
+- mock_creative_performance: --creatives per test campaign, created on
+  random days of the window
+- change_events: --operations budget changes per campaign on random days,
+  by --optimizers optimizers of one benchmark account
+
+Everything is namespaced so it never mixes with real rows: campaign /
+creative / product ids start with "bench_", optimizers are
+optN@bench.local and events belong to the account with customer_id
+"bench". --reset deletes those rows and the evaluations written for them.
+
+Requires mock_campaign_performance, which the legacy Python evaluators read
+but migration 20251129085803 (remove-mock-campaign-performance) drops: on a
+database migrated to head, pass --create-table to recreate it from the
+baseline migration's DDL (scratch databases only); without it the script
+exits with an explanation.
+
+Usage:
+    python bench/synthetic_data.py --campaigns 10000 --reset
+    python bench/synthetic_data.py --campaigns 10000 --create-table   # database migrated to head
+    python bench/synthetic_data.py --campaigns 1000000 --days 8 --creatives 5 --operations 0.5
+    python bench/synthetic_data.py --reset-only
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import numpy as np
+import pandas as pd
+
+from db_utils import get_db
+
+PREFIX = "bench_"
+ACCOUNT_CUSTOMER_ID = "bench"
+OPTIMIZER_DOMAIN = "bench.local"
+
+COUNTRIES = ("US", "GB", "DE", "JP", "BR", "IN", "FR", "CA", "KR", "AU", "MX", "ID")
+PLATFORMS = ("Android", "iOS")
+CHANNELS = ("Google", "Meta")
+
+# Campaigns per COPY chunk (x days rows for mock_campaign_performance)
+CHUNK_CAMPAIGNS = 50_000
+
+RESET_STATEMENTS = (
+    ("action_recommendation", "DELETE FROM action_recommendation WHERE campaign_id LIKE %(pattern)s"),
+    ("campaign_evaluation", "DELETE FROM campaign_evaluation WHERE campaign_id LIKE %(pattern)s"),
+    ("creative_evaluation", "DELETE FROM creative_evaluation WHERE campaign_id LIKE %(pattern)s"),
+    ("operation_score", "DELETE FROM operation_score WHERE campaign_id LIKE %(pattern)s"),
+    ("optimizer_daily_stats", "DELETE FROM optimizer_daily_stats WHERE optimizer_email LIKE %(optimizers)s"),
+    ("change_events", """
+        DELETE FROM change_events
+        WHERE account_id IN (SELECT id FROM accounts WHERE customer_id = %(customer_id)s)
+    """),
+    ("mock_creative_performance", "DELETE FROM mock_creative_performance WHERE campaign_id LIKE %(pattern)s"),
+    ("mock_campaign_performance", "DELETE FROM mock_campaign_performance WHERE campaign_id LIKE %(pattern)s"),
+    ("safety_baseline", "DELETE FROM safety_baseline WHERE product_name LIKE %(pattern)s"),
+    ("creative_test_baseline", "DELETE FROM creative_test_baseline WHERE product_name LIKE %(pattern)s"),
+)
+
+
+# Legacy table read by the Python evaluators; DDL of atlas/migrations/20251125073456_baseline.sql,
+# dropped again by 20251129085803_remove-mock-campaign-performance.sql
+PERFORMANCE_TABLE = "mock_campaign_performance"
+PERFORMANCE_TABLE_DDL = """
+    CREATE TABLE IF NOT EXISTS mock_campaign_performance (
+        id serial NOT NULL,
+        campaign_id character varying(100) NOT NULL,
+        campaign_name character varying(200) NOT NULL,
+        product_name character varying(100) NOT NULL,
+        country_code character varying(10) NOT NULL,
+        platform character varying(20) NOT NULL DEFAULT 'Android',
+        channel character varying(20) NOT NULL DEFAULT 'Google',
+        date date NOT NULL,
+        total_spend numeric(15,2) NOT NULL,
+        total_revenue numeric(15,2) NOT NULL,
+        total_installs integer NOT NULL,
+        d7_active_users integer NOT NULL,
+        actual_roas7 numeric(10,4) NOT NULL,
+        actual_ret7 numeric(10,4) NOT NULL,
+        created_at timestamp NOT NULL DEFAULT now(),
+        PRIMARY KEY (id)
+    );
+    CREATE INDEX IF NOT EXISTS mock_campaign_date_idx ON mock_campaign_performance (date);
+    CREATE INDEX IF NOT EXISTS mock_campaign_product_country_idx
+        ON mock_campaign_performance (product_name, country_code, platform, channel);
+    CREATE UNIQUE INDEX IF NOT EXISTS unique_campaign_date ON mock_campaign_performance (campaign_id, date);
+"""
+
+MISSING_TABLE_MESSAGE = (
+    "mock_campaign_performance does not exist: migration 20251129085803 (remove-mock-campaign-performance) "
+    "drops it, but the legacy Python evaluators and this benchmark read it. On a scratch database, "
+    "pass --create-table to recreate it from the baseline migration's DDL."
+)
+
+
+def table_exists(cursor, table: str) -> bool:
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (table,))
+    return cursor.fetchone()[0]
+
+
+def ensure_performance_table(db, create: bool = False) -> None:
+    """Exit with MISSING_TABLE_MESSAGE when mock_campaign_performance is missing, unless `create`"""
+    with db.conn.cursor() as cur:
+        if table_exists(cur, PERFORMANCE_TABLE):
+            return
+        if not create:
+            sys.exit(MISSING_TABLE_MESSAGE)
+        cur.execute(PERFORMANCE_TABLE_DDL)
+    db.conn.commit()
+    print("Created mock_campaign_performance (baseline migration DDL)", flush=True)
+
+
+def copy_frame(cursor, table: str, frame: pd.DataFrame) -> int:
+    """COPY a DataFrame (columns = table columns) into `table`"""
+    buffer = io.StringIO()
+    frame.to_csv(buffer, index=False, header=False, na_rep="")
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {table} ({', '.join(frame.columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    return len(frame)
+
+
+# Evaluations written for benchmark rows; cleared between benchmark repeats
+EVALUATION_TABLES = (
+    "action_recommendation", "campaign_evaluation", "creative_evaluation", "operation_score", "optimizer_daily_stats",
+)
+
+
+def reset(db, evaluations_only: bool = False) -> Dict[str, int]:
+    """Delete benchmark rows (or only the evaluations written for them)"""
+    params = {
+        "pattern": PREFIX.replace("_", r"\_") + "%",
+        "optimizers": f"%@{OPTIMIZER_DOMAIN}",
+        "customer_id": ACCOUNT_CUSTOMER_ID,
+    }
+    deleted = {}
+    with db.conn.cursor() as cur:
+        for table, statement in RESET_STATEMENTS:
+            if evaluations_only and table not in EVALUATION_TABLES:
+                continue
+            if table == PERFORMANCE_TABLE and not table_exists(cur, table):
+                continue
+            cur.execute(statement, params)
+            deleted[table] = cur.rowcount
+    db.conn.commit()
+    return deleted
+
+
+def bench_account_id(cursor) -> int:
+    cursor.execute(
+        """
+        INSERT INTO accounts (customer_id, name, currency, time_zone)
+        VALUES (%s, 'Benchmark', 'USD', 'UTC')
+        ON CONFLICT (customer_id) DO UPDATE SET name = EXCLUDED.name
+        RETURNING id
+        """,
+        (ACCOUNT_CUSTOMER_ID,)
+    )
+    return cursor.fetchone()[0]
+
+
+def make_combinations(products: int, countries: int, rng: np.random.Generator) -> pd.DataFrame:
+    index = pd.MultiIndex.from_product(
+        [[f"{PREFIX}p{i}" for i in range(products)], COUNTRIES[:countries], PLATFORMS, CHANNELS],
+        names=["product_name", "country_code", "platform", "channel"]
+    )
+    combos = index.to_frame(index=False)
+    n = len(combos)
+    combos["baseline_roas7"] = rng.uniform(0.3, 0.6, n).round(4)
+    combos["baseline_ret7"] = rng.uniform(0.12, 0.3, n).round(4)
+    combos["max_cpi"] = rng.uniform(1.0, 4.0, n).round(2)
+    combos["min_roas_d3"] = rng.uniform(0.05, 0.15, n).round(4)
+    combos["min_roas_d7"] = rng.uniform(0.15, 0.3, n).round(4)
+    combos["excellent_cvr"] = rng.uniform(0.02, 0.06, n).round(6)
+    return combos
+
+
+def campaign_chunk(
+    start: int,
+    stop: int,
+    days: List[date],
+    combos: pd.DataFrame,
+    test_share: float,
+    rng: np.random.Generator
+) -> Dict[str, Any]:
+    """Campaign attributes and campaign x day performance rows for ids [start, stop)"""
+    n = stop - start
+    ids = np.arange(start, stop)
+    combo = rng.integers(0, len(combos), n)
+    is_test = rng.random(n) < test_share
+    # Daily spend: test campaigns stay under the 1000 test threshold
+    daily_spend = np.where(is_test, rng.uniform(50, 900, n), rng.lognormal(7.5, 0.8, n) + 1000)
+    # Per-campaign quality around the baseline; some are far below (danger) or above
+    roas_factor = rng.lognormal(0.0, 0.35, n)
+    ret_factor = rng.lognormal(0.0, 0.25, n)
+    cpi = rng.uniform(0.8, 5.0, n)
+
+    campaign_ids = np.char.add(PREFIX + "c", ids.astype(str))
+    d = len(days)
+    rows = n * d
+    repeat = np.repeat(np.arange(n), d)
+    noise = rng.lognormal(0.0, 0.1, rows)
+    spend = (daily_spend[repeat] * noise).round(2)
+    roas7 = (combos["baseline_roas7"].to_numpy()[combo][repeat] * roas_factor[repeat] * rng.lognormal(0.0, 0.08, rows))
+    ret7 = np.minimum(combos["baseline_ret7"].to_numpy()[combo][repeat] * ret_factor[repeat]
+                      * rng.lognormal(0.0, 0.08, rows), 0.95)
+    installs = np.maximum((spend / cpi[repeat]).astype(np.int64), 1)
+
+    performance = pd.DataFrame({
+        "campaign_id": campaign_ids[repeat],
+        "campaign_name": np.char.add("Bench Campaign ", ids.astype(str))[repeat],
+        "product_name": combos["product_name"].to_numpy()[combo][repeat],
+        "country_code": combos["country_code"].to_numpy()[combo][repeat],
+        "platform": combos["platform"].to_numpy()[combo][repeat],
+        "channel": combos["channel"].to_numpy()[combo][repeat],
+        "date": np.tile(np.array([day.isoformat() for day in days]), n),
+        "total_spend": spend,
+        "total_revenue": (spend * roas7).round(2),
+        "total_installs": installs,
+        "d7_active_users": (installs * ret7).astype(np.int64),
+        "actual_roas7": roas7.round(4),
+        "actual_ret7": ret7.round(4),
+    })
+    return {
+        "campaign_ids": campaign_ids,
+        "combo": combo,
+        "is_test": is_test,
+        "cpi": cpi,
+        "roas_factor": roas_factor,
+        "performance": performance,
+    }
+
+
+def creative_frame(chunk: Dict[str, Any], combos: pd.DataFrame, creatives: int, days: List[date],
+                   rng: np.random.Generator) -> pd.DataFrame:
+    test = np.flatnonzero(chunk["is_test"])
+    if creatives <= 0 or len(test) == 0:
+        return pd.DataFrame()
+    owner = np.repeat(test, creatives)
+    number = np.tile(np.arange(creatives), len(test))
+    n = len(owner)
+    combo = chunk["combo"][owner]
+    impressions = rng.integers(2_000, 200_000, n)
+    cvr = combos["excellent_cvr"].to_numpy()[combo] * rng.lognormal(-0.3, 0.5, n)
+    installs = np.maximum((impressions * cvr).astype(np.int64), 1)
+    cpi = combos["max_cpi"].to_numpy()[combo] * rng.lognormal(-0.1, 0.35, n)
+    roas_d7 = combos["min_roas_d7"].to_numpy()[combo] * chunk["roas_factor"][owner] * rng.lognormal(0.0, 0.4, n)
+    created = np.array([datetime.combine(day, datetime.min.time()).isoformat() for day in days])
+    campaign_ids = chunk["campaign_ids"][owner]
+    return pd.DataFrame({
+        "creative_id": np.char.add(np.char.add(campaign_ids, "_cr"), number.astype(str)),
+        "creative_name": np.char.add("Bench Creative ", number.astype(str)),
+        "campaign_id": campaign_ids,
+        "product_name": combos["product_name"].to_numpy()[combo],
+        "country_code": combos["country_code"].to_numpy()[combo],
+        "platform": combos["platform"].to_numpy()[combo],
+        "channel": combos["channel"].to_numpy()[combo],
+        "impressions": impressions,
+        "installs": installs,
+        "cvr": (installs / impressions).round(6),
+        "cpi": cpi.round(2),
+        "roas_d3": (roas_d7 * rng.uniform(0.3, 0.6, n)).round(4),
+        "roas_d7": roas_d7.round(4),
+        "spend": (installs * cpi).round(2),
+        "created_at": created[rng.integers(0, len(created), n)],
+    })
+
+
+def change_event_frame(chunk: Dict[str, Any], account_id: int, operations: float, optimizers: int,
+                       days: List[date], first_id: int, rng: np.random.Generator) -> pd.DataFrame:
+    campaigns = len(chunk["campaign_ids"])
+    n = rng.poisson(operations * campaigns)
+    if n == 0:
+        return pd.DataFrame()
+    owner = rng.integers(0, campaigns, n)
+    day = rng.integers(0, len(days), n)
+    # Unique (account, timestamp, resource_name, user_email): offset by the running event number
+    seconds = (np.arange(first_id, first_id + n) % 86_000) + 60
+    midnight = np.array([np.datetime64(d.isoformat()) for d in days], dtype="datetime64[s]")
+    timestamps = midnight[day] + seconds.astype("timedelta64[s]")
+    # Budget in currency units: micros would overflow operation_score.value_before (numeric(12, 4))
+    before = rng.integers(50, 5_000, n).astype(float)
+    after = (before * rng.uniform(0.6, 1.5, n)).round(2)
+    campaign_ids = chunk["campaign_ids"][owner]
+    return pd.DataFrame({
+        "account_id": account_id,
+        "timestamp": np.char.add(np.datetime_as_string(timestamps, unit="s"), "+00:00"),
+        "user_email": np.char.add(np.char.add("opt", rng.integers(0, optimizers, n).astype(str)), f"@{OPTIMIZER_DOMAIN}"),
+        "resource_type": "CAMPAIGN_BUDGET",
+        "operation_type": "UPDATE",
+        "resource_name": np.char.add(f"customers/{ACCOUNT_CUSTOMER_ID}/campaignBudgets/", campaign_ids),
+        "campaign": campaign_ids,
+        "summary": "Budget changed",
+        "field_changes": [
+            json.dumps({"amount": {"old": f"{b:.2f}", "new": f"{a:.2f}"}}) for b, a in zip(before.tolist(), after.tolist())
+        ],
+    })
+
+
+def generate(
+    campaigns: int,
+    days: int = 8,
+    end_date: date = None,
+    products: int = 20,
+    countries: int = 10,
+    test_share: float = 0.3,
+    creatives: int = 5,
+    operations: float = 1.0,
+    optimizers: int = 50,
+    seed: int = 7,
+    do_reset: bool = False,
+    create_table: bool = False,
+) -> Dict[str, Any]:
+    """
+    Generate and COPY-load a synthetic data set; returns row counts, seconds
+    per table and the date window
+
+    Exits when mock_campaign_performance is missing, unless create_table
+    (see ensure_performance_table).
+    """
+    end_date = end_date or date.today()
+    window = [end_date - timedelta(days=offset) for offset in range(days - 1, -1, -1)]
+    rng = np.random.default_rng(seed)
+    combos = make_combinations(products, countries, rng)
+    counts = {"mock_campaign_performance": 0, "mock_creative_performance": 0, "change_events": 0}
+    seconds = {table: 0.0 for table in counts}
+    started = time.perf_counter()
+
+    db = get_db()
+    with db:
+        ensure_performance_table(db, create_table)
+        if do_reset:
+            deleted = reset(db)
+            print(f"Reset: {sum(deleted.values())} rows deleted", flush=True)
+        with db.conn.cursor() as cur:
+            account_id = bench_account_id(cur)
+            copy_frame(cur, "safety_baseline", combos.assign(reference_period="bench")[
+                ["product_name", "country_code", "platform", "channel", "baseline_roas7", "baseline_ret7", "reference_period"]
+            ])
+            copy_frame(cur, "creative_test_baseline", combos[
+                ["product_name", "country_code", "platform", "channel", "max_cpi", "min_roas_d3", "min_roas_d7", "excellent_cvr"]
+            ])
+            db.conn.commit()
+
+            for start in range(0, campaigns, CHUNK_CAMPAIGNS):
+                stop = min(start + CHUNK_CAMPAIGNS, campaigns)
+                chunk = campaign_chunk(start, stop, window, combos, test_share, rng)
+                frames = {
+                    "mock_campaign_performance": chunk["performance"],
+                    "mock_creative_performance": creative_frame(chunk, combos, creatives, window, rng),
+                    "change_events": change_event_frame(
+                        chunk, account_id, operations, optimizers, window, counts["change_events"], rng
+                    ),
+                }
+                for table, frame in frames.items():
+                    if frame.empty:
+                        continue
+                    copy_started = time.perf_counter()
+                    counts[table] += copy_frame(cur, table, frame)
+                    seconds[table] += time.perf_counter() - copy_started
+                db.conn.commit()
+                print(f"  campaigns {stop}/{campaigns}", flush=True)
+
+            cur.execute("ANALYZE mock_campaign_performance, mock_creative_performance, change_events, "
+                        "safety_baseline, creative_test_baseline")
+        db.conn.commit()
+
+    result = {
+        "campaigns": campaigns,
+        "start_date": window[0].isoformat(),
+        "end_date": window[-1].isoformat(),
+        "combinations": len(combos),
+        "rows": counts,
+        "copy_seconds": {table: round(s, 3) for table, s in seconds.items()},
+        "total_seconds": round(time.perf_counter() - started, 3),
+    }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="COPY-load synthetic evaluation data into the local Postgres")
+    parser.add_argument("--campaigns", type=int, default=10_000, help="Campaigns (default: 10000)")
+    parser.add_argument("--days", type=int, default=8, help="Days of performance per campaign (default: 8)")
+    parser.add_argument("--end-date", help="Last day YYYY-MM-DD (default: today)")
+    parser.add_argument("--products", type=int, default=20)
+    parser.add_argument("--countries", type=int, default=10, help=f"Countries, up to {len(COUNTRIES)}")
+    parser.add_argument("--test-share", type=float, default=0.3, help="Share of test campaigns (default: 0.3)")
+    parser.add_argument("--creatives", type=int, default=5, help="Creatives per test campaign (default: 5)")
+    parser.add_argument("--operations", type=float, default=1.0,
+                        help="Budget changes per campaign over the window (default: 1.0)")
+    parser.add_argument("--optimizers", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--reset", action="store_true", help="Delete previous benchmark rows first")
+    parser.add_argument("--reset-only", action="store_true", help="Only delete benchmark rows")
+    parser.add_argument("--create-table", action="store_true",
+                        help="Recreate mock_campaign_performance (dropped at migration head) if missing")
+    args = parser.parse_args()
+
+    if args.reset_only:
+        db = get_db()
+        with db:
+            print(json.dumps(reset(db)))
+        return
+
+    result = generate(
+        campaigns=args.campaigns,
+        days=args.days,
+        end_date=datetime.strptime(args.end_date, "%Y-%m-%d").date() if args.end_date else None,
+        products=args.products,
+        countries=min(args.countries, len(COUNTRIES)),
+        test_share=args.test_share,
+        creatives=args.creatives,
+        operations=args.operations,
+        optimizers=args.optimizers,
+        seed=args.seed,
+        do_reset=args.reset,
+        create_table=args.create_table,
+    )
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -9,7 +9,34 @@ Generates recommendations and action options for optimizers.
 import sys
 from datetime import datetime
 from typing import Dict, Any, List, Optional
-from db_utils import get_db, format_output, read_input
+
+import numpy as np
+
+from db_utils import (
+    get_db, format_output, read_input, input_fingerprint, output_stream, BatchResults, NdjsonStream,
+)
+from baseline_cache import get_baseline_cache
+from scoring import (
+    CAMPAIGN_THRESHOLDS, CAMPAIGN_STATUSES, RECOMMENDATION_TYPES, RECOMMENDATION_DESCRIPTIONS,
+    achievement_rates, ladder_codes,
+)
+
+CAMPAIGN_EVALUATION_COLUMNS = (
+    'campaign_id', 'campaign_name', 'evaluation_date', 'campaign_type',
+    'total_spend', 'actual_roas7', 'actual_ret7',
+    'baseline_roas7', 'baseline_ret7',
+    'roas_achievement_rate', 'ret_achievement_rate', 'min_achievement_rate',
+    'recommendation_type', 'status',
+)
+
+# One row per (campaign, date); unchanged inputs leave the stored row alone,
+# and so do rows written by the TS evaluators (NULL fingerprint)
+CAMPAIGN_EVALUATION_CONFLICT = "ON CONFLICT (campaign_id, evaluation_date) DO UPDATE SET " + ", ".join(
+    f"{column} = EXCLUDED.{column}"
+    for column in CAMPAIGN_EVALUATION_COLUMNS + ('input_fingerprint',)
+    if column not in ('campaign_id', 'evaluation_date')
+) + (" WHERE campaign_evaluation.input_fingerprint IS NOT NULL"
+       " AND campaign_evaluation.input_fingerprint IS DISTINCT FROM EXCLUDED.input_fingerprint")
 
 
 class CampaignEvaluator:
@@ -18,15 +45,33 @@ class CampaignEvaluator:
     # Campaign type thresholds
     TEST_CAMPAIGN_THRESHOLD = 1000.0  # Total spend < $1000 = test campaign
 
-    # Achievement rate thresholds
-    DANGER_THRESHOLD = 60.0  # < 60% = danger
-    WARNING_THRESHOLD = 85.0  # 60-85% = warning
-    OBSERVATION_THRESHOLD = 100.0  # 85-100% = observation
-    HEALTHY_THRESHOLD = 110.0  # 100-110% = healthy, >= 110% = excellent
+    # Achievement rate thresholds (defaults from scoring.CAMPAIGN_THRESHOLDS);
+    # status / recommendation / fingerprint all read the ladder from these
+    DANGER_THRESHOLD = float(CAMPAIGN_THRESHOLDS[0])  # < 60% = danger
+    WARNING_THRESHOLD = float(CAMPAIGN_THRESHOLDS[1])  # 60-85% = warning
+    OBSERVATION_THRESHOLD = float(CAMPAIGN_THRESHOLDS[2])  # 85-100% = observation
+    HEALTHY_THRESHOLD = float(CAMPAIGN_THRESHOLDS[3])  # 100-110% = healthy, >= 110% = excellent
 
     def __init__(self):
         self.db = get_db()
 
+    @classmethod
+    def status_ladder(cls) -> np.ndarray:
+        """Achievement rate cut points, lowest first"""
+        return np.array([
+            cls.DANGER_THRESHOLD, cls.WARNING_THRESHOLD, cls.OBSERVATION_THRESHOLD, cls.HEALTHY_THRESHOLD,
+        ])
+
+    @classmethod
+    def status_code(cls, min_achievement_rate: float) -> int:
+        """
+        Index into CAMPAIGN_STATUSES / RECOMMENDATION_TYPES / RECOMMENDATION_DESCRIPTIONS
+
+        A NaN rate falls in the top bucket, as the original if/elif chain did.
+        """
+        code = int(ladder_codes(min_achievement_rate, cls.status_ladder()))
+        return len(CAMPAIGN_STATUSES) - 1 if code < 0 else code
+
     def evaluate_campaign(
         self,
         campaign_id: str,
@@ -98,30 +143,18 @@ class CampaignEvaluator:
                 total_spend = float(campaign['total_spend'])
                 campaign_type = "test" if total_spend < self.TEST_CAMPAIGN_THRESHOLD else "mature"
 
-                # 3. Get safety baseline
-                baseline_query = """
-                    SELECT baseline_roas7, baseline_ret7, reference_period
-                    FROM safety_baseline
-                    WHERE product_name = %s
-                      AND country_code = %s
-                      AND platform = %s
-                      AND channel = %s
-                    LIMIT 1
-                """
-
-                baseline_results = self.db.execute_query(
-                    baseline_query,
-                    (campaign['product_name'], campaign['country_code'],
-                     campaign['platform'], campaign['channel'])
+                # 3. Get safety baseline (cached, one load per process)
+                baseline = get_baseline_cache().safety(
+                    self.db, campaign['product_name'], campaign['country_code'],
+                    campaign['platform'], campaign['channel']
                 )
 
-                if not baseline_results or len(baseline_results) == 0:
+                if baseline is None:
                     return {
                         "error": f"No baseline found for {campaign['product_name']}/{campaign['country_code']}",
                         "campaign_id": campaign_id
                     }
 
-                baseline = baseline_results[0]
                 baseline_roas7 = float(baseline['baseline_roas7'])
                 baseline_ret7 = float(baseline['baseline_ret7'])
 
@@ -129,11 +162,13 @@ class CampaignEvaluator:
                 actual_roas7 = float(campaign['actual_roas7'])
                 actual_ret7 = float(campaign['actual_ret7'])
 
-                roas_achievement_rate = (actual_roas7 / baseline_roas7 * 100) if baseline_roas7 > 0 else 0.0
-                ret_achievement_rate = (actual_ret7 / baseline_ret7 * 100) if baseline_ret7 > 0 else 0.0
-
-                # Use minimum achievement rate (bucket effect - weakest link determines overall health)
-                min_achievement_rate = min(roas_achievement_rate, ret_achievement_rate)
+                # Minimum achievement rate (bucket effect - weakest link determines overall health)
+                roas_rates, ret_rates, min_rates = achievement_rates(
+                    actual_roas7, actual_ret7, baseline_roas7, baseline_ret7
+                )
+                roas_achievement_rate = float(roas_rates)
+                ret_achievement_rate = float(ret_rates)
+                min_achievement_rate = float(min_rates)
 
                 # 5. Generate recommendation
                 recommendation = self.generate_recommendation(min_achievement_rate)
@@ -195,44 +230,15 @@ class CampaignEvaluator:
         Returns:
             Dictionary with type and description
         """
-        if min_achievement_rate < self.DANGER_THRESHOLD:
-            return {
-                "type": "关停",
-                "description": "达成率低于60%，严重亏损，建议立即关停campaign"
-            }
-        elif min_achievement_rate < self.WARNING_THRESHOLD:
-            return {
-                "type": "保守缩量",
-                "description": "达成率60-85%，表现不佳，建议减少投入观察变化"
-            }
-        elif min_achievement_rate < self.OBSERVATION_THRESHOLD:
-            return {
-                "type": "继续观察",
-                "description": "达成率85-100%，接近及格线，保持现状等待更多数据"
-            }
-        elif min_achievement_rate < self.HEALTHY_THRESHOLD:
-            return {
-                "type": "保守扩量或观察",
-                "description": "达成率100-110%，表现达标，可小幅增加投入测试"
-            }
-        else:
-            return {
-                "type": "激进扩量",
-                "description": "达成率≥110%，表现优异，建议大幅增加投入"
-            }
+        code = self.status_code(min_achievement_rate)
+        return {
+            "type": RECOMMENDATION_TYPES[code],
+            "description": RECOMMENDATION_DESCRIPTIONS[code]
+        }
 
     def get_status(self, min_achievement_rate: float) -> str:
         """Get status label based on achievement rate"""
-        if min_achievement_rate < self.DANGER_THRESHOLD:
-            return "danger"
-        elif min_achievement_rate < self.WARNING_THRESHOLD:
-            return "warning"
-        elif min_achievement_rate < self.OBSERVATION_THRESHOLD:
-            return "observation"
-        elif min_achievement_rate < self.HEALTHY_THRESHOLD:
-            return "healthy"
-        else:
-            return "excellent"
+        return CAMPAIGN_STATUSES[self.status_code(min_achievement_rate)]
 
     def generate_action_options(self, recommendation_type: str) -> List[Dict[str, Any]]:
         """
@@ -338,17 +344,23 @@ class CampaignEvaluator:
         recommendation_type: str,
         status: str
     ) -> bool:
-        """Save evaluation result to database"""
+        """
+        Upsert the evaluation for (campaign_id, evaluation_date)
+
+        The row is only rewritten when the input fingerprint (performance,
+        baseline, thresholds) differs from the stored one, so re-running a
+        date is a no-op.
+        """
         try:
-            query = """
-                INSERT INTO campaign_evaluation (
-                    campaign_id, campaign_name, evaluation_date, campaign_type,
-                    total_spend, actual_roas7, actual_ret7,
-                    baseline_roas7, baseline_ret7,
-                    roas_achievement_rate, ret_achievement_rate, min_achievement_rate,
-                    recommendation_type, status, created_at
-                )
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW())
+            fingerprint = input_fingerprint(
+                campaign_name, total_spend, actual_roas7, actual_ret7,
+                baseline_roas7, baseline_ret7,
+                self.status_ladder(), self.TEST_CAMPAIGN_THRESHOLD
+            )
+            query = f"""
+                INSERT INTO campaign_evaluation ({', '.join(CAMPAIGN_EVALUATION_COLUMNS)}, input_fingerprint, created_at)
+                VALUES ({', '.join(['%s'] * len(CAMPAIGN_EVALUATION_COLUMNS))}, %s, NOW())
+                {CAMPAIGN_EVALUATION_CONFLICT}
             """
 
             return self.db.execute_update(
@@ -357,19 +369,25 @@ class CampaignEvaluator:
                  total_spend, actual_roas7, actual_ret7,
                  baseline_roas7, baseline_ret7,
                  roas_achievement_rate, ret_achievement_rate, min_achievement_rate,
-                 recommendation_type, status)
+                 recommendation_type, status, fingerprint)
             )
 
         except Exception as e:
             print(f"Save evaluation error: {e}", file=sys.stderr, flush=True)
             return False
 
-    def evaluate_all_campaigns(self, evaluation_date: Optional[str] = None) -> Dict[str, Any]:
+    def evaluate_all_campaigns(
+        self,
+        evaluation_date: Optional[str] = None,
+        stream: Optional[NdjsonStream] = None
+    ) -> Dict[str, Any]:
         """
         Batch evaluate all campaigns
 
         Args:
             evaluation_date: Evaluation date (default: today)
+            stream: Write each per-campaign result as it is produced instead
+                of collecting "results"
 
         Returns:
             Summary of evaluation results
@@ -394,9 +412,10 @@ class CampaignEvaluator:
 
                 campaigns = self.db.execute_query(campaigns_query, (eval_date_str,))
 
-                results = []
+                results = BatchResults(stream)
                 success_count = 0
                 failed_count = 0
+                status_summary = {status: 0 for status in CAMPAIGN_STATUSES}
 
                 for campaign in campaigns:
                     campaign_id = campaign['campaign_id']
@@ -404,6 +423,7 @@ class CampaignEvaluator:
 
                     if 'error' not in evaluation:
                         success_count += 1
+                        status_summary[evaluation['status']] += 1
                         results.append({
                             "campaign_id": campaign_id,
                             "status": evaluation['status'],
@@ -417,15 +437,6 @@ class CampaignEvaluator:
                             "error": evaluation['error']
                         })
 
-                # Group by status
-                status_summary = {
-                    "danger": len([r for r in results if r.get('status') == 'danger']),
-                    "warning": len([r for r in results if r.get('status') == 'warning']),
-                    "observation": len([r for r in results if r.get('status') == 'observation']),
-                    "healthy": len([r for r in results if r.get('status') == 'healthy']),
-                    "excellent": len([r for r in results if r.get('status') == 'excellent'])
-                }
-
                 return {
                     "success": True,
                     "evaluation_date": eval_date_str,
@@ -433,7 +444,7 @@ class CampaignEvaluator:
                     "success_count": success_count,
                     "failed_count": failed_count,
                     "status_summary": status_summary,
-                    "results": results
+                    "results": results.items
                 }
 
         except Exception as e:
@@ -449,6 +460,7 @@ def main():
     input_data = read_input()
 
     evaluator = CampaignEvaluator()
+    stream = output_stream(input_data)
 
     action = input_data.get('action', 'evaluate')
 
@@ -461,12 +473,13 @@ def main():
     elif action == 'evaluate_all':
         # Batch evaluate all campaigns
         result = evaluator.evaluate_all_campaigns(
-            evaluation_date=input_data.get('evaluationDate')
+            evaluation_date=input_data.get('evaluationDate'),
+            stream=stream
         )
     else:
         result = {"error": f"Unknown action: {action}"}
 
-    format_output(result)
+    format_output(result, stream)
 
 
 if __name__ == "__main__":
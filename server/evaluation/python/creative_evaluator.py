@@ -7,9 +7,221 @@ Identifies high-performing creatives for scaling.
 """
 
 import sys
-from datetime import datetime
+from datetime import date, datetime
 from typing import Dict, Any, List, Optional
-from db_utils import get_db, format_output, read_input
+
+import numpy as np
+import pandas as pd
+
+from db_utils import (
+    get_db, format_output, read_input, input_fingerprint, output_stream, BatchResults, NdjsonStream,
+)
+from baseline_cache import get_baseline_cache
+
+
+# Creatives become due for D3 / D7 evaluation this many days after they started
+D3_DUE_DAYS = 3
+D7_DUE_DAYS = 7
+
+PASSED_STATUSES = ('及格', '出量好素材')
+
+# One row per creative with its thresholds; evaluation_day is the stage the
+# creative is due for at the evaluation date (D7 supersedes a missed D3).
+DUE_CREATIVES_QUERY = """
+    WITH candidates AS (
+        SELECT
+            p.creative_id,
+            p.creative_name,
+            p.campaign_id,
+            p.impressions,
+            p.installs,
+            p.cvr,
+            p.cpi,
+            p.roas_d3,
+            p.roas_d7,
+            b.max_cpi,
+            b.min_roas_d3,
+            b.min_roas_d7,
+            b.excellent_cvr,
+            COALESCE(
+                %(evaluation_day)s,
+                CASE WHEN p.created_at::date <= %(evaluation_date)s::date - %(d7_days)s
+                     THEN 'D7' ELSE 'D3' END
+            ) AS evaluation_day
+        FROM mock_creative_performance p
+        LEFT JOIN creative_test_baseline b
+          ON b.product_name = p.product_name
+         AND b.country_code = p.country_code
+         AND b.platform = p.platform
+         AND b.channel = p.channel
+        WHERE (%(campaign_ids)s::text[] IS NULL OR p.campaign_id = ANY(%(campaign_ids)s::text[]))
+          AND (%(evaluation_day)s IS NOT NULL
+               OR p.created_at::date <= %(evaluation_date)s::date - %(d3_days)s)
+    )
+    SELECT c.*
+    FROM candidates c
+    WHERE %(evaluation_day)s IS NOT NULL
+       OR NOT EXISTS (
+            SELECT 1
+            FROM creative_evaluation e
+            WHERE e.campaign_id = c.campaign_id
+              AND e.creative_id = c.creative_id
+              AND e.evaluation_day = c.evaluation_day
+       )
+    ORDER BY c.campaign_id, c.creative_id
+"""
+
+CREATIVE_EVALUATION_COLUMNS = (
+    'creative_id', 'creative_name', 'campaign_id', 'evaluation_day',
+    'evaluation_date', 'impressions', 'installs', 'cvr',
+    'actual_cpi', 'actual_roas',
+    'max_cpi_threshold', 'min_roas_threshold',
+    'creative_status',
+)
+
+# One row per (campaign, creative, stage); a re-evaluation only rewrites it
+# when the input fingerprint changed, and never rewrites TS-written rows
+# (NULL fingerprint)
+CREATIVE_EVALUATION_CONFLICT = "ON CONFLICT (campaign_id, creative_id, evaluation_day) DO UPDATE SET " + ", ".join(
+    f"{column} = EXCLUDED.{column}"
+    for column in CREATIVE_EVALUATION_COLUMNS + ('input_fingerprint',)
+    if column not in ('campaign_id', 'creative_id', 'evaluation_day')
+) + (" WHERE creative_evaluation.input_fingerprint IS NOT NULL"
+       " AND creative_evaluation.input_fingerprint IS DISTINCT FROM EXCLUDED.input_fingerprint")
+
+
+def creative_evaluation_fingerprint(record: tuple) -> str:
+    """
+    input_fingerprint of a CREATIVE_EVALUATION_COLUMNS record; evaluation_date
+    is left out so re-running a stage on a later day with the same data is a no-op
+    """
+    date_index = CREATIVE_EVALUATION_COLUMNS.index('evaluation_date')
+    return input_fingerprint(record[:date_index] + record[date_index + 1:])
+
+
+def classify_creatives(frame: pd.DataFrame) -> pd.DataFrame:
+    """
+    Apply the D3 / D7 rules of evaluate_creative_d3 / evaluate_creative_d7 to a
+    whole frame of due creatives at once.
+
+    Expects the DUE_CREATIVES_QUERY columns (thresholds as floats, NaN when the
+    creative has no baseline). Adds actual_roas, min_roas_threshold, cvr_value,
+    creative_status and has_baseline columns.
+    """
+    def values(column: str) -> np.ndarray:
+        # Decimal / None from the cursor -> float / NaN
+        return pd.to_numeric(frame[column], errors='coerce').to_numpy(dtype=float)
+
+    is_d7 = (frame['evaluation_day'] == 'D7').to_numpy()
+    cpi = values('cpi')
+    max_cpi = values('max_cpi')
+    actual_roas = np.where(is_d7, values('roas_d7'), values('roas_d3'))
+    min_roas = np.where(is_d7, values('min_roas_d7'), values('min_roas_d3'))
+    cvr = values('cvr')
+    excellent_cvr = values('excellent_cvr')
+
+    has_baseline = ~np.isnan(max_cpi) & ~np.isnan(min_roas) & (~is_d7 | ~np.isnan(excellent_cvr))
+    cpi_pass = cpi <= max_cpi
+    roas_pass = actual_roas >= min_roas
+    cvr_excellent = cvr >= excellent_cvr
+
+    status = np.select(
+        [
+            ~is_d7 & cpi_pass & roas_pass,
+            is_d7 & cpi_pass & roas_pass & cvr_excellent,
+            is_d7 & cpi_pass & roas_pass,
+        ],
+        ['测试中', '出量好素材', '及格'],
+        default='不及格',
+    )
+
+    return frame.assign(
+        actual_roas=actual_roas,
+        min_roas_threshold=min_roas,
+        # CVR only recorded at D7 (same as the single-creative path)
+        cvr_value=np.where(is_d7, cvr, np.nan),
+        creative_status=status,
+        has_baseline=has_baseline,
+    )
+
+
+def summarize_by_campaign(frame: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Per-campaign {D3: {status: n}, D7: {status: n}, skipped: n} summary"""
+    summary: Dict[str, Dict[str, Any]] = {}
+    for campaign_id in frame['campaign_id'].unique():
+        summary[campaign_id] = {"campaign_id": campaign_id, "D3": {}, "D7": {}, "skipped": 0}
+
+    evaluated = frame[frame['has_baseline']]
+    counts = evaluated.groupby(['campaign_id', 'evaluation_day', 'creative_status']).size()
+    for (campaign_id, evaluation_day, status), n in counts.items():
+        summary[campaign_id][evaluation_day][status] = int(n)
+
+    for campaign_id, n in frame[~frame['has_baseline']].groupby('campaign_id').size().items():
+        summary[campaign_id]['skipped'] = int(n)
+
+    return list(summary.values())
+
+
+# Per test campaign: creatives in the campaign and, from the D7 evaluation
+# of each creative (one row per creative, creative_stage_uidx), how many
+# were evaluated / passed.
+CLOSURE_QUERY = """
+    WITH latest AS (
+        SELECT
+            campaign_id,
+            creative_id,
+            creative_status
+        FROM creative_evaluation
+        WHERE evaluation_day = 'D7'
+          AND (%(campaign_ids)s::text[] IS NULL OR campaign_id = ANY(%(campaign_ids)s::text[]))
+    ),
+    totals AS (
+        SELECT campaign_id, COUNT(DISTINCT creative_id) AS total
+        FROM mock_creative_performance
+        WHERE (%(campaign_ids)s::text[] IS NULL OR campaign_id = ANY(%(campaign_ids)s::text[]))
+        GROUP BY campaign_id
+    )
+    SELECT
+        t.campaign_id,
+        t.total,
+        COUNT(l.creative_id) AS evaluated,
+        COUNT(*) FILTER (WHERE l.creative_status IN %(passed_statuses)s) AS passed
+    FROM totals t
+    LEFT JOIN latest l ON l.campaign_id = t.campaign_id
+    GROUP BY t.campaign_id, t.total
+    ORDER BY t.campaign_id
+"""
+
+
+def closure_result(row: Dict[str, Any]) -> Dict[str, Any]:
+    """check_campaign_closure result from a CLOSURE_QUERY row"""
+    total_creatives = int(row['total'])
+    evaluated_creatives = int(row['evaluated'])
+    passed_creatives = int(row['passed'])
+    failed_creatives = evaluated_creatives - passed_creatives
+
+    # Determine if should close
+    all_evaluated = evaluated_creatives >= total_creatives
+    none_passed = passed_creatives == 0
+
+    should_close = all_evaluated and none_passed
+
+    if should_close:
+        reason = f"所有{total_creatives}个素材已完成D7评价，无一及格，建议关停整个campaign"
+    elif not all_evaluated:
+        reason = f"还有{total_creatives - evaluated_creatives}个素材未完成D7评价"
+    else:
+        reason = f"有{passed_creatives}个素材及格或优秀，campaign可继续运行"
+
+    return {
+        "campaign_id": row['campaign_id'],
+        "should_close": should_close,
+        "reason": reason,
+        "total_creatives": total_creatives,
+        "evaluated_creatives": evaluated_creatives,
+        "passed_creatives": passed_creatives,
+        "failed_creatives": failed_creatives
+    }
 
 
 class CreativeEvaluator:
@@ -81,34 +293,18 @@ class CreativeEvaluator:
 
                 creative = creative_results[0]
 
-                # Get creative test baseline (thresholds)
-                baseline_query = """
-                    SELECT
-                        max_cpi,
-                        min_roas_d3,
-                        min_roas_d7,
-                        excellent_cvr
-                    FROM creative_test_baseline
-                    WHERE product_name = %s
-                      AND country_code = %s
-                      AND platform = %s
-                      AND channel = %s
-                    LIMIT 1
-                """
-
-                baseline_results = self.db.execute_query(
-                    baseline_query,
-                    (creative['product_name'], creative['country_code'],
-                     creative['platform'], creative['channel'])
+                # Get creative test baseline thresholds (cached, one load per process)
+                baseline = get_baseline_cache().creative(
+                    self.db, creative['product_name'], creative['country_code'],
+                    creative['platform'], creative['channel']
                 )
 
-                if not baseline_results or len(baseline_results) == 0:
+                if baseline is None:
                     return {
                         "error": f"No creative baseline found for {creative['product_name']}/{creative['country_code']}",
                         "creative_id": creative_id
                     }
 
-                baseline = baseline_results[0]
                 max_cpi = float(baseline['max_cpi'])
                 min_roas_d3 = float(baseline['min_roas_d3'])
 
@@ -224,33 +420,18 @@ class CreativeEvaluator:
 
                 creative = creative_results[0]
 
-                # Get creative test baseline
-                baseline_query = """
-                    SELECT
-                        max_cpi,
-                        min_roas_d7,
-                        excellent_cvr
-                    FROM creative_test_baseline
-                    WHERE product_name = %s
-                      AND country_code = %s
-                      AND platform = %s
-                      AND channel = %s
-                    LIMIT 1
-                """
-
-                baseline_results = self.db.execute_query(
-                    baseline_query,
-                    (creative['product_name'], creative['country_code'],
-                     creative['platform'], creative['channel'])
+                # Get creative test baseline (cached, one load per process)
+                baseline = get_baseline_cache().creative(
+                    self.db, creative['product_name'], creative['country_code'],
+                    creative['platform'], creative['channel']
                 )
 
-                if not baseline_results or len(baseline_results) == 0:
+                if baseline is None:
                     return {
                         "error": f"No creative baseline found",
                         "creative_id": creative_id
                     }
 
-                baseline = baseline_results[0]
                 max_cpi = float(baseline['max_cpi'])
                 min_roas_d7 = float(baseline['min_roas_d7'])
                 excellent_cvr = float(baseline['excellent_cvr'])
@@ -345,67 +526,160 @@ class CreativeEvaluator:
             - passed_creatives: int
             - failed_creatives: int
         """
+        result = self.check_campaign_closures([campaign_id])
+        if 'error' in result:
+            return {"error": result['error'], "campaign_id": campaign_id}
+        if result['campaigns']:
+            return result['campaigns'][0]
+        return closure_result({"campaign_id": campaign_id, "total": 0, "evaluated": 0, "passed": 0})
+
+    def check_campaign_closures(
+        self,
+        campaign_ids: Optional[List[str]] = None,
+        stream: Optional[NdjsonStream] = None
+    ) -> Dict[str, Any]:
+        """
+        Closure check for many test campaigns with one grouped query
+
+        Only the latest D7 evaluation per creative counts (DISTINCT ON), so
+        re-evaluations do not inflate the counts.
+
+        Args:
+            campaign_ids: Campaigns to check (default: every test campaign)
+            stream: Write each campaign result instead of collecting "campaigns"
+
+        Returns:
+            Dictionary containing:
+            - success: bool
+            - total_campaigns: int
+            - should_close: int
+            - campaigns: List of check_campaign_closure results
+        """
         try:
             with self.db:
-                # Get all D7 evaluations for this campaign
-                eval_query = """
-                    SELECT
-                        creative_id,
-                        creative_status
-                    FROM creative_evaluation
-                    WHERE campaign_id = %s
-                      AND evaluation_day = 'D7'
-                    ORDER BY created_at DESC
-                """
+                rows = self.db.execute_query(
+                    CLOSURE_QUERY,
+                    {"campaign_ids": campaign_ids, "passed_statuses": PASSED_STATUSES}
+                )
 
-                evaluations = self.db.execute_query(eval_query, (campaign_id,))
+            campaigns = BatchResults(stream)
+            should_close = 0
+            for row in rows:
+                campaign = closure_result(row)
+                should_close += campaign['should_close']
+                campaigns.append(campaign)
+            return {
+                "success": True,
+                "total_campaigns": len(campaigns),
+                "should_close": should_close,
+                "campaigns": campaigns.items
+            }
 
-                # Get total creatives in campaign (from mock data)
-                total_query = """
-                    SELECT COUNT(DISTINCT creative_id) as total
-                    FROM mock_creative_performance
-                    WHERE campaign_id = %s
-                """
+        except Exception as e:
+            print(f"Campaign closure check error: {e}", file=sys.stderr, flush=True)
+            return {"error": str(e)}
 
-                total_results = self.db.execute_query(total_query, (campaign_id,))
-                total_creatives = int(total_results[0]['total']) if total_results else 0
+    def evaluate_due_creatives(
+        self,
+        evaluation_date: Optional[str] = None,
+        campaign_ids: Optional[List[str]] = None,
+        evaluation_day: Optional[str] = None,
+        stream: Optional[NdjsonStream] = None
+    ) -> Dict[str, Any]:
+        """
+        Batch D3/D7 evaluation: one query for creatives + thresholds, rules
+        applied over the whole set, one bulk upsert into creative_evaluation.
 
-                evaluated_creatives = len(evaluations)
-                passed_creatives = len([
-                    e for e in evaluations
-                    if e['creative_status'] in ['及格', '出量好素材']
-                ])
-                failed_creatives = evaluated_creatives - passed_creatives
+        A creative is due for D3 once it has run D3_DUE_DAYS days and for D7
+        after D7_DUE_DAYS days, unless that stage was already evaluated.
 
-                # Determine if should close
-                all_evaluated = evaluated_creatives >= total_creatives
-                none_passed = passed_creatives == 0
+        Args:
+            evaluation_date: Evaluation date in ISO format (default: today)
+            campaign_ids: Restrict to these campaigns (default: all)
+            evaluation_day: 'D3' or 'D7' to (re-)evaluate every matched creative
+                at that stage, ignoring whether it is due
+            stream: Write each campaign summary (after the upsert) instead of
+                collecting "campaigns"
 
-                should_close = all_evaluated and none_passed
+        Returns:
+            Dictionary containing:
+            - success: bool
+            - evaluation_date: str
+            - evaluated: int
+            - unchanged: int (evaluated, but inputs matched the stored fingerprint)
+            - skipped: int (no creative test baseline)
+            - campaigns: [{campaign_id, D3: {status: n}, D7: {status: n}, skipped}]
+        """
+        if evaluation_day not in (None, 'D3', 'D7'):
+            return {"error": f"Invalid evaluation day: {evaluation_day}"}
+        if evaluation_date is None:
+            evaluation_date = date.today().isoformat()
 
-                if should_close:
-                    reason = f"所有{total_creatives}个素材已完成D7评价，无一及格，建议关停整个campaign"
-                elif not all_evaluated:
-                    reason = f"还有{total_creatives - evaluated_creatives}个素材未完成D7评价"
-                else:
-                    reason = f"有{passed_creatives}个素材及格或优秀，campaign可继续运行"
+        try:
+            with self.db:
+                rows = self.db.execute_query(
+                    DUE_CREATIVES_QUERY,
+                    {
+                        "evaluation_date": evaluation_date,
+                        "evaluation_day": evaluation_day,
+                        "campaign_ids": campaign_ids,
+                        "d3_days": D3_DUE_DAYS,
+                        "d7_days": D7_DUE_DAYS,
+                    },
+                    row_mode='record'
+                )
+
+                if not rows:
+                    return {
+                        "success": True,
+                        "evaluation_date": evaluation_date,
+                        "evaluated": 0,
+                        "unchanged": 0,
+                        "skipped": 0,
+                        "campaigns": []
+                    }
 
+                frame = classify_creatives(pd.DataFrame(rows))
+                evaluated = frame[frame['has_baseline']]
+
+                records = [
+                    (
+                        r.creative_id, r.creative_name, r.campaign_id, r.evaluation_day,
+                        evaluation_date, int(r.impressions), int(r.installs),
+                        None if np.isnan(r.cvr_value) else float(r.cvr_value),
+                        float(r.cpi), float(r.actual_roas),
+                        float(r.max_cpi), float(r.min_roas_threshold),
+                        r.creative_status,
+                    )
+                    for r in evaluated.itertuples(index=False)
+                ]
+                written = self.db.execute_bulk(
+                    f"""
+                        INSERT INTO creative_evaluation ({', '.join(CREATIVE_EVALUATION_COLUMNS)}, input_fingerprint, created_at)
+                        VALUES %s
+                        {CREATIVE_EVALUATION_CONFLICT}
+                    """,
+                    [record + (creative_evaluation_fingerprint(record),) for record in records],
+                    template=f"({', '.join(['%s'] * (len(CREATIVE_EVALUATION_COLUMNS) + 1))}, NOW())"
+                )
+                if written < 0:
+                    return {"error": "Failed to save creative evaluations"}
+
+                campaigns = BatchResults(stream)
+                for campaign in summarize_by_campaign(frame):
+                    campaigns.append(campaign)
                 return {
-                    "campaign_id": campaign_id,
-                    "should_close": should_close,
-                    "reason": reason,
-                    "total_creatives": total_creatives,
-                    "evaluated_creatives": evaluated_creatives,
-                    "passed_creatives": passed_creatives,
-                    "failed_creatives": failed_creatives
+                    "success": True,
+                    "evaluation_date": evaluation_date,
+                    "evaluated": len(records),
+                    "unchanged": len(records) - written,
+                    "skipped": int((~frame['has_baseline']).sum()),
+                    "campaigns": campaigns.items
                 }
 
         except Exception as e:
-            print(f"Campaign closure check error: {e}", file=sys.stderr, flush=True)
-            return {
-                "error": str(e),
-                "campaign_id": campaign_id
-            }
+            print(f"Batch creative evaluation error: {e}", file=sys.stderr, flush=True)
+            return {"error": str(e)}
 
     def save_creative_evaluation(
         self,
@@ -422,26 +696,22 @@ class CreativeEvaluator:
         min_roas_threshold: float,
         creative_status: str
     ) -> bool:
-        """Save creative evaluation to database"""
+        """Upsert the creative's evaluation for this stage (no-op when the inputs are unchanged)"""
         try:
-            query = """
-                INSERT INTO creative_evaluation (
-                    creative_id, creative_name, campaign_id, evaluation_day,
-                    evaluation_date, impressions, installs, cvr,
-                    actual_cpi, actual_roas,
-                    max_cpi_threshold, min_roas_threshold,
-                    creative_status, created_at
-                )
-                VALUES (%s, %s, %s, %s, CURRENT_DATE, %s, %s, %s, %s, %s, %s, %s, %s, NOW())
+            query = f"""
+                INSERT INTO creative_evaluation ({', '.join(CREATIVE_EVALUATION_COLUMNS)}, input_fingerprint, created_at)
+                VALUES (%s, %s, %s, %s, CURRENT_DATE, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW())
+                {CREATIVE_EVALUATION_CONFLICT}
             """
 
+            record = (creative_id, creative_name, campaign_id, evaluation_day,
+                      None, impressions, installs, cvr,
+                      actual_cpi, actual_roas,
+                      max_cpi_threshold, min_roas_threshold,
+                      creative_status)
             return self.db.execute_update(
                 query,
-                (creative_id, creative_name, campaign_id, evaluation_day,
-                 impressions, installs, cvr,
-                 actual_cpi, actual_roas,
-                 max_cpi_threshold, min_roas_threshold,
-                 creative_status)
+                record[:4] + record[5:] + (creative_evaluation_fingerprint(record),)
             )
 
         except Exception as e:
@@ -454,6 +724,7 @@ def main():
     input_data = read_input()
 
     evaluator = CreativeEvaluator()
+    stream = output_stream(input_data, 'campaigns')
 
     action = input_data.get('action')
 
@@ -467,14 +738,31 @@ def main():
             creative_id=input_data.get('creativeId'),
             campaign_id=input_data.get('campaignId')
         )
+    elif action == 'evaluate_all_due':
+        result = evaluator.evaluate_due_creatives(
+            evaluation_date=input_data.get('evaluationDate'),
+            stream=stream
+        )
+    elif action == 'evaluate_campaign':
+        result = evaluator.evaluate_due_creatives(
+            evaluation_date=input_data.get('evaluationDate'),
+            campaign_ids=input_data.get('campaignIds') or [input_data.get('campaignId')],
+            evaluation_day=input_data.get('evaluationDay'),
+            stream=stream
+        )
     elif action == 'check_closure':
         result = evaluator.check_campaign_closure(
             campaign_id=input_data.get('campaignId')
         )
+    elif action == 'check_closure_all':
+        result = evaluator.check_campaign_closures(
+            campaign_ids=input_data.get('campaignIds'),
+            stream=stream
+        )
     else:
         result = {"error": f"Unknown action: {action}"}
 
-    format_output(result)
+    format_output(result, stream)
 
 
 if __name__ == "__main__":
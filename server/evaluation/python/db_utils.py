@@ -3,15 +3,323 @@ Database connection utilities for Python evaluation engine
 """
 
 import os
+import re
+import sys
 import json
-from typing import Any, Dict, List, Optional
+import math
+import time
+import hashlib
+import random
+import numbers
+import itertools
+import threading
+from collections import OrderedDict, namedtuple
+from decimal import Decimal
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Tuple
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INERROR
+from psycopg2.extras import RealDictCursor, execute_values
 from dotenv import load_dotenv
 
+# Optional: faster encoding of streamed output (falls back to json)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Load environment variables
 load_dotenv()
 
+# Max seconds a streamed item may sit in the stdout buffer
+STREAM_FLUSH_INTERVAL = float(os.getenv('EVAL_STREAM_FLUSH_INTERVAL', '0.2'))
+
+# Rows per FETCH round trip of Database.iter_query
+CURSOR_ITERSIZE = int(os.getenv('EVAL_CURSOR_ITERSIZE', '2000'))
+
+# Row shapes of execute_query / iter_query:
+#   dict   - RealDictRow (column name -> value)
+#   tuple  - plain tuples in column order
+#   record - namedtuple per column list (attribute access, no per-row dict;
+#            pd.DataFrame takes the field names as columns)
+ROW_MODES = ('dict', 'tuple', 'record')
+
+_cursor_names = itertools.count(1)
+
+# Server-side prepared statements for execute_query / execute_update
+PREPARE_STATEMENTS = os.getenv('EVAL_PREPARE_STATEMENTS', 'true').lower() != 'false'
+PREPARED_CACHE_SIZE = int(os.getenv('EVAL_PREPARED_CACHE_SIZE', '64'))
+
+_PLACEHOLDER = re.compile(r"%\(([^)]+)\)s|%s|%%")
+_PREPARABLE = re.compile(
+    r"^\s*(?:(?:--[^\n]*\n|/\*.*?\*/)\s*)*(?:select|insert|update|delete|with|values)\b",
+    re.IGNORECASE | re.DOTALL
+)
+_MISSING = object()
+
+# Query instrumentation (opt-in: EVAL_QUERY_STATS=true or "queryStats": true in the input)
+QUERY_STATS_ENABLED = os.getenv('EVAL_QUERY_STATS', 'false').lower() == 'true'
+SLOW_QUERY_MS = float(os.getenv('EVAL_SLOW_QUERY_MS', '100'))
+SLOW_QUERY_EXPLAIN_RATE = float(os.getenv('EVAL_SLOW_QUERY_EXPLAIN_RATE', '0.1'))
+SLOW_QUERY_MAX_EXPLAINS = int(os.getenv('EVAL_SLOW_QUERY_MAX_EXPLAINS', '10'))
+
+
+@lru_cache(maxsize=64)
+def record_type(columns: Tuple[str, ...]):
+    """namedtuple class for a result's column names (cached per column list)"""
+    return namedtuple('Record', columns, rename=True)
+
+
+def _statement_text(query: str, limit: int = 200) -> str:
+    text = ' '.join(query.split())
+    return text if len(text) <= limit else text[:limit - 3] + '...'
+
+
+def _caller() -> str:
+    # First frame outside this module, e.g. "campaign_evaluator.CampaignEvaluator.evaluate_campaign"
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_code.co_filename == __file__:
+        frame = frame.f_back
+    if frame is None:
+        return '?'
+    code = frame.f_code
+    module = os.path.splitext(os.path.basename(code.co_filename))[0]
+    return f"{module}.{getattr(code, 'co_qualname', code.co_name)}"
+
+
+class QueryStats:
+    """
+    Per-run statement statistics of all Database instances in the process
+
+    When enabled, execute_query / execute_update / execute_bulk / iter_query
+    record per (calling evaluator method, statement): calls, total / max
+    milliseconds and rows returned or affected. Statements slower than
+    `slow_ms` are logged to stderr; a sample of them (`explain_rate`, at most
+    `max_explains` per run) is re-run under EXPLAIN (ANALYZE, BUFFERS) inside
+    a rolled-back savepoint and logged with the plan. format_output attaches
+    summary() to the result as "query_stats".
+    """
+
+    def __init__(self):
+        self.enabled = QUERY_STATS_ENABLED
+        self.slow_ms = SLOW_QUERY_MS
+        self.explain_rate = SLOW_QUERY_EXPLAIN_RATE
+        self.max_explains = SLOW_QUERY_MAX_EXPLAINS
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._statements: Dict[Tuple[str, str], List[float]] = {}
+            self.slow: List[Dict[str, Any]] = []
+            self.explained = 0
+
+    def should_explain(self, elapsed_ms: float) -> bool:
+        return (
+            elapsed_ms >= self.slow_ms
+            and self.explained < self.max_explains
+            and random.random() < self.explain_rate
+        )
+
+    def record(
+        self,
+        caller: str,
+        query: str,
+        elapsed_ms: float,
+        rows: int,
+        plan: Optional[List[str]] = None
+    ) -> None:
+        statement = _statement_text(query)
+        with self._lock:
+            entry = self._statements.setdefault((caller, statement), [0, 0.0, 0.0, 0])
+            entry[0] += 1
+            entry[1] += elapsed_ms
+            entry[2] = max(entry[2], elapsed_ms)
+            entry[3] += max(rows, 0)
+            if elapsed_ms < self.slow_ms:
+                return
+            slow = {"caller": caller, "query": statement, "ms": round(elapsed_ms, 2), "rows": rows}
+            if plan is not None:
+                self.explained += 1
+                slow["plan"] = plan
+            self.slow.append(slow)
+
+        print(f"Slow query ({elapsed_ms:.1f} ms, {rows} rows) in {caller}: {statement}", file=sys.stderr, flush=True)
+        if plan is not None:
+            print('\n'.join(f"    {line}" for line in plan), file=sys.stderr, flush=True)
+
+    def summary(self, top: int = 20) -> Dict[str, Any]:
+        """Totals, the `top` statements by total time, and the captured slow statements"""
+        with self._lock:
+            statements = [
+                {
+                    "caller": caller,
+                    "query": statement,
+                    "calls": int(calls),
+                    "total_ms": round(total, 2),
+                    "mean_ms": round(total / calls, 3),
+                    "max_ms": round(longest, 2),
+                    "rows": int(rows),
+                }
+                for (caller, statement), (calls, total, longest, rows) in self._statements.items()
+            ]
+            slow = list(self.slow)
+        statements.sort(key=lambda s: s["total_ms"], reverse=True)
+        by_caller: Dict[str, Dict[str, float]] = {}
+        for s in statements:
+            totals = by_caller.setdefault(s["caller"], {"calls": 0, "total_ms": 0.0})
+            totals["calls"] += s["calls"]
+            totals["total_ms"] = round(totals["total_ms"] + s["total_ms"], 2)
+        return {
+            "calls": sum(s["calls"] for s in statements),
+            "total_ms": round(sum(s["total_ms"] for s in statements), 2),
+            "slow_ms": self.slow_ms,
+            "by_caller": by_caller,
+            "statements": statements[:top],
+            "slow": slow,
+        }
+
+
+QUERY_STATS = QueryStats()
+
+
+def enable_query_stats(enabled: bool = True) -> QueryStats:
+    """Turn instrumentation on (or off) for this process"""
+    QUERY_STATS.enabled = enabled
+    return QUERY_STATS
+
+
+class PreparedStatements:
+    """
+    Server-side prepared statements of one connection, keyed by query text
+
+    The first execution of a query PREPAREs it (psycopg2 placeholders
+    rewritten to $1..$n); later executions send EXECUTE name(args), so
+    Postgres skips parsing and planning can reuse the cached plan.
+
+    - At most `size` query texts are kept; the least recently used one is
+      DEALLOCATEd when a new one is prepared
+    - Queries that cannot be prepared (DDL, `IN %s` with a tuple, parameters
+      whose type Postgres cannot infer, ...) fail inside a savepoint, are
+      remembered and run as plain queries from then on
+    - Prepared statements belong to the session: the cache is created and
+      dropped with the connection (Database.connect / close)
+    """
+
+    def __init__(self, conn, size: int = PREPARED_CACHE_SIZE):
+        self.conn = conn
+        self.size = size
+        # (query, no params) -> (name, parameter count or names, EXECUTE statement) or None
+        self._statements: 'OrderedDict[Tuple[str, bool], Optional[Tuple[str, Any, str]]]' = OrderedDict()
+        self._names = itertools.count(1)
+        self.hits = 0
+        self.prepared = 0
+        self.unprepared = 0
+
+    def execute(self, cursor, query: str, params: Any = None) -> None:
+        """Run `query` on `cursor` through its prepared statement when possible"""
+        if self.conn.get_transaction_status() == TRANSACTION_STATUS_INERROR:
+            # Fails as before; no savepoint can be taken in an aborted transaction
+            cursor.execute(query, params)
+            return
+
+        key = (query, params is None)
+        entry = self._statements.get(key, _MISSING)
+        if entry is _MISSING:
+            entry = self._prepare(cursor, key)
+        else:
+            self._statements.move_to_end(key)
+            if entry is not None:
+                self.hits += 1
+
+        args = self._arguments(entry, params) if entry is not None else None
+        if args is None:
+            cursor.execute(query, params)
+        else:
+            cursor.execute(entry[2], args or None)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "cached": sum(entry is not None for entry in self._statements.values()),
+            "prepared": self.prepared,
+            "hits": self.hits,
+            "unprepared": self.unprepared,
+        }
+
+    @staticmethod
+    def _arguments(entry: Tuple[str, Any, str], params: Any) -> Optional[List[Any]]:
+        # Parameters in $n order; None when they do not fit (psycopg2 then
+        # raises the usual error from the plain query)
+        names = entry[1]
+        if params is None:
+            return [] if names == 0 else None
+        if isinstance(names, tuple):
+            if not isinstance(params, Mapping) or any(name not in params for name in names):
+                return None
+            return [params[name] for name in names]
+        if isinstance(params, (str, bytes, Mapping)) or len(params) != names:
+            return None
+        return list(params)
+
+    @staticmethod
+    def _convert(query: str, literal: bool) -> Optional[Tuple[str, Any]]:
+        # psycopg2 placeholders -> $n; named parameters keep one $n per name
+        if literal:
+            return query, 0
+        named: Dict[str, int] = {}
+        positional = 0
+
+        def placeholder(match) -> str:
+            nonlocal positional
+            text = match.group(0)
+            if text == '%%':
+                return '%'
+            if text == '%s':
+                positional += 1
+                return f'${positional}'
+            return f'${named.setdefault(match.group(1), len(named) + 1)}'
+
+        converted = _PLACEHOLDER.sub(placeholder, query)
+        if named and positional:
+            return None
+        return converted, (tuple(named) if named else positional)
+
+    def _prepare(self, cursor, key: Tuple[str, bool]) -> Optional[Tuple[str, Any, str]]:
+        query, literal = key
+        converted = self._convert(query, literal) if _PREPARABLE.match(query) else None
+        entry = None
+        if converted is not None:
+            sql, names = converted
+            name = f"eval_stmt_{next(self._names)}"
+            cursor.execute("SAVEPOINT eval_prepare")
+            try:
+                cursor.execute(f"PREPARE {name} AS {sql}")
+                # Arguments are cast to the inferred parameter types: a list is
+                # sent as ARRAY[...] (text[]), which would not coerce to e.g. date[]
+                cursor.execute(
+                    "RELEASE SAVEPOINT eval_prepare; "
+                    "SELECT parameter_types::text[] AS types FROM pg_prepared_statements WHERE name = %s",
+                    (name,)
+                )
+                row = cursor.fetchone()
+                types = row['types'] if isinstance(row, dict) else row[0]
+                statement = f"EXECUTE {name}"
+                if types:
+                    statement += f" ({', '.join(f'%s::{t}' for t in types)})"
+                entry = (name, names, statement)
+                self.prepared += 1
+            except psycopg2.Error:
+                cursor.execute("ROLLBACK TO SAVEPOINT eval_prepare; RELEASE SAVEPOINT eval_prepare")
+        if entry is None:
+            self.unprepared += 1
+
+        self._statements[key] = entry
+        while len(self._statements) > self.size:
+            _, evicted = self._statements.popitem(last=False)
+            if evicted is not None:
+                cursor.execute(f"DEALLOCATE {evicted[0]}")
+        return entry
+
 
 class Database:
     """PostgreSQL database connection manager"""
@@ -23,12 +331,17 @@ class Database:
 
         self.conn = None
         self.cursor = None
+        self.tuple_cursor = None
+        self.statements: Optional[PreparedStatements] = None
+        self._depth = 0
 
     def connect(self):
         """Establish database connection"""
         try:
             self.conn = psycopg2.connect(self.connection_string)
             self.cursor = self.conn.cursor(cursor_factory=RealDictCursor)
+            self.tuple_cursor = self.conn.cursor()
+            self.statements = PreparedStatements(self.conn) if PREPARE_STATEMENTS else None
             return True
         except Exception as e:
             print(f"Database connection error: {e}", flush=True)
@@ -38,29 +351,121 @@ class Database:
         """Close database connection"""
         if self.cursor:
             self.cursor.close()
+        if self.tuple_cursor:
+            self.tuple_cursor.close()
         if self.conn:
             self.conn.close()
+        self.statements = None
+
+    def _execute(self, cursor, query: str, params: Any = None) -> None:
+        if self.statements is None:
+            cursor.execute(query, params)
+        else:
+            self.statements.execute(cursor, query, params)
 
-    def execute_query(self, query: str, params: tuple = None) -> List[Dict[str, Any]]:
+    def execute_query(self, query: str, params: tuple = None, row_mode: str = 'dict') -> List[Any]:
         """
-        Execute SELECT query and return results as list of dictionaries
+        Execute SELECT query and return all rows
 
         Args:
             query: SQL query string
             params: Query parameters (for parameterized queries)
+            row_mode: 'dict' (default), 'tuple' or 'record' (see ROW_MODES)
 
         Returns:
-            List of dictionaries (each row as a dict)
+            List of rows (dicts by default)
         """
+        started = time.perf_counter()
         try:
-            self.cursor.execute(query, params)
-            results = self.cursor.fetchall()
-            return [dict(row) for row in results]
+            if row_mode == 'dict':
+                self._execute(self.cursor, query, params)
+                rows = self.cursor.fetchall()
+            else:
+                self._execute(self.tuple_cursor, query, params)
+                rows = self.tuple_cursor.fetchall()
+                if row_mode == 'record':
+                    record = record_type(tuple(col.name for col in self.tuple_cursor.description))
+                    rows = list(map(record._make, rows))
+            if QUERY_STATS.enabled:
+                self._instrument(query, params, started, len(rows))
+            return rows
         except Exception as e:
             print(f"Query execution error: {e}", flush=True)
             print(f"Query: {query}", flush=True)
             return []
 
+    def iter_query(
+        self,
+        query: str,
+        params: tuple = None,
+        row_mode: str = 'dict',
+        itersize: int = CURSOR_ITERSIZE,
+        withhold: bool = False
+    ) -> Iterator[Any]:
+        """
+        Iterate over a SELECT through a named (server-side) cursor
+
+        Rows are fetched `itersize` at a time, so memory stays constant
+        however large the result is. The cursor lives in the current
+        transaction: a commit (execute_update / execute_bulk) while iterating
+        closes it unless `withhold` is set.
+
+        Unlike execute_query, errors are raised (after printing) - a scan cut
+        short must not look like a complete one.
+
+        Args:
+            query: SQL query string
+            params: Query parameters
+            row_mode: 'dict' (default), 'tuple' or 'record' (see ROW_MODES)
+            itersize: Rows per FETCH round trip
+            withhold: DECLARE ... WITH HOLD (survives commits)
+
+        Returns:
+            Iterator over the rows in the requested mode
+        """
+        if row_mode not in ROW_MODES:
+            raise ValueError(f"Invalid row mode: {row_mode}")
+        cursor = self.conn.cursor(
+            name=f"eval_iter_{next(_cursor_names)}",
+            cursor_factory=RealDictCursor if row_mode == 'dict' else None,
+            withhold=withhold
+        )
+        # Resolved here: inside the generator the calling frame is whoever consumes it
+        caller = _caller() if QUERY_STATS.enabled else None
+        return self._iterate(cursor, query, params, row_mode, itersize, caller)
+
+    def _iterate(self, cursor, query: str, params: Any, row_mode: str, itersize: int,
+                 caller: Optional[str]) -> Iterator[Any]:
+        # Instrumented time is spent in the database only, not in the consumer
+        fetch_seconds = 0.0
+        fetched = 0
+        try:
+            started = time.perf_counter()
+            cursor.execute(query, params)
+            fetch_seconds += time.perf_counter() - started
+            record = None
+            while True:
+                started = time.perf_counter()
+                rows = cursor.fetchmany(itersize)
+                fetch_seconds += time.perf_counter() - started
+                if not rows:
+                    break
+                fetched += len(rows)
+                if row_mode == 'record':
+                    record = record or record_type(tuple(col.name for col in cursor.description))
+                    yield from map(record._make, rows)
+                else:
+                    yield from rows
+            if caller is not None:
+                QUERY_STATS.record(caller, query, fetch_seconds * 1000, fetched)
+        except Exception as e:
+            print(f"Query iteration error: {e}", flush=True)
+            print(f"Query: {query}", flush=True)
+            raise
+        finally:
+            if not cursor.closed and not self.conn.closed:
+                cursor.close()
+
     def execute_update(self, query: str, params: tuple = None) -> bool:
         """
         Execute INSERT/UPDATE/DELETE query
@@ -72,9 +477,12 @@ class Database:
         Returns:
             True if successful, False otherwise
         """
+        started = time.perf_counter()
         try:
-            self.cursor.execute(query, params)
+            self._execute(self.cursor, query, params)
             self.conn.commit()
+            if QUERY_STATS.enabled:
+                self._instrument(query, params, started, self.cursor.rowcount)
             return True
         except Exception as e:
             print(f"Update execution error: {e}", flush=True)
@@ -82,14 +490,91 @@ class Database:
             self.conn.rollback()
             return False
 
+    def execute_bulk(self, query: str, rows: List[tuple], template: str = None, page_size: int = 500) -> int:
+        """
+        Execute a multi-row INSERT (``VALUES %s``) with psycopg2 execute_values
+
+        Args:
+            query: SQL with a single ``VALUES %s`` placeholder
+            rows: Row tuples
+            template: Optional per-row template, e.g. "(%s, %s, CURRENT_DATE)"
+            page_size: Rows per statement
+
+        Returns:
+            Number of rows affected, or -1 on error
+        """
+        if not rows:
+            return 0
+        started = time.perf_counter()
+        try:
+            affected = 0
+            for start in range(0, len(rows), page_size):
+                execute_values(self.cursor, query, rows[start:start + page_size],
+                               template=template, page_size=page_size)
+                affected += self.cursor.rowcount
+            self.conn.commit()
+            if QUERY_STATS.enabled:
+                # One entry per call (pages are not timed apart); no EXPLAIN of the expanded VALUES
+                QUERY_STATS.record(_caller(), query, (time.perf_counter() - started) * 1000, affected)
+            return affected
+        except Exception as e:
+            print(f"Bulk execution error: {e}", flush=True)
+            print(f"Query: {query}", flush=True)
+            self.conn.rollback()
+            return -1
+
+    def _instrument(self, query: str, params: Any, started: float, rows: int) -> None:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        plan = self._explain(query, params) if QUERY_STATS.should_explain(elapsed_ms) else None
+        QUERY_STATS.record(_caller(), query, elapsed_ms, rows, plan)
+
+    def _explain(self, query: str, params: Any) -> List[str]:
+        """
+        EXPLAIN (ANALYZE, BUFFERS) of a statement that just ran. ANALYZE
+        executes it again, so it runs in a savepoint that is rolled back
+        (writes are undone; sequences still advance). After a commit
+        (execute_update) there is no transaction to nest in: the EXPLAIN
+        runs in its own transaction, rolled back so the connection is left
+        idle as the caller committed it.
+        """
+        cursor = self.conn.cursor()
+        idle = self.conn.info.transaction_status == TRANSACTION_STATUS_IDLE
+        try:
+            if not idle:
+                cursor.execute("SAVEPOINT eval_explain")
+            try:
+                cursor.execute("EXPLAIN (ANALYZE, BUFFERS) " + query, params)
+                return [row[0] for row in cursor.fetchall()]
+            except psycopg2.Error as e:
+                return [f"EXPLAIN failed: {str(e).strip()}"]
+            finally:
+                if idle:
+                    self.conn.rollback()
+                else:
+                    cursor.execute("ROLLBACK TO SAVEPOINT eval_explain; RELEASE SAVEPOINT eval_explain")
+        except psycopg2.Error as e:
+            return [f"EXPLAIN failed: {str(e).strip()}"]
+        finally:
+            cursor.close()
+
     def __enter__(self):
-        """Context manager entry"""
-        self.connect()
+        """
+        Context manager entry
+
+        Nested `with db:` blocks (a batch method calling the per-item one)
+        share the outer connection and its prepared statements; only the
+        outermost block connects and closes.
+        """
+        if self._depth == 0:
+            self.connect()
+        self._depth += 1
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         """Context manager exit"""
-        self.close()
+        self._depth -= 1
+        if self._depth == 0:
+            self.close()
 
 
 def get_db() -> Database:
@@ -97,14 +582,136 @@ def get_db() -> Database:
     return Database()
 
 
-def format_output(data: Any) -> None:
+def _fingerprint_value(value: Any) -> Any:
+    if value is None or isinstance(value, (str, bool)):
+        return value
+    if isinstance(value, (numbers.Real, Decimal)):
+        # Decimal from the cursor, float / numpy scalars from pandas: same number, same hash
+        value = float(value)
+        return None if math.isnan(value) else value
+    if isinstance(value, dict):
+        return {str(k): _fingerprint_value(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)) or hasattr(value, 'tolist'):
+        return [_fingerprint_value(v) for v in (value.tolist() if hasattr(value, 'tolist') else value)]
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+def input_fingerprint(*parts: Any) -> str:
+    """
+    SHA-256 of an evaluation's inputs, stored in the input_fingerprint column
+
+    Numbers are compared by value (Decimal / int / numpy / float all hash
+    alike, NaN as null) and dates by ISO string, so the single-item and batch
+    paths fingerprint the same inputs identically.
+    """
+    payload = json.dumps([_fingerprint_value(p) for p in parts], separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, numbers.Integral):
+        return int(value)
+    if isinstance(value, numbers.Real):
+        return float(value)
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+def encode_json(data: Any) -> bytes:
+    """
+    Compact JSON for streamed output: Decimal as a number, date / datetime as
+    ISO 8601, numpy scalars and arrays as plain values. Uses orjson when it is
+    installed.
+    """
+    if orjson is not None:
+        return orjson.dumps(data, default=_json_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(data, default=_json_default, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+class NdjsonStream:
+    """
+    Streamed batch output (newline-delimited JSON on stdout)
+
+    One {"type": "item", "data": ...} line per result as soon as it is
+    produced, then one {"type": "summary", "data": ...} line: the usual
+    result without the `items_key` list, plus "streamed" (items written).
+    Items are flushed at once for the first one, then at least every
+    STREAM_FLUSH_INTERVAL seconds. Read by wrappers/python-stream.ts.
+    """
+
+    def __init__(self, items_key: str = 'results', out=None):
+        self.items_key = items_key
+        self.out = out or sys.stdout.buffer
+        self.count = 0
+        self._flushed_at = 0.0
+
+    def item(self, data: Any) -> None:
+        self.out.write(encode_json({"type": "item", "data": data}) + b"\n")
+        self.count += 1
+        now = time.monotonic()
+        if self.count == 1 or now - self._flushed_at >= STREAM_FLUSH_INTERVAL:
+            self.out.flush()
+            self._flushed_at = now
+
+    def summary(self, data: Any) -> None:
+        if isinstance(data, dict):
+            data = {k: v for k, v in data.items() if k != self.items_key}
+            data["streamed"] = self.count
+        self.out.write(encode_json({"type": "summary", "data": data}) + b"\n")
+        self.out.flush()
+
+
+class BatchResults:
+    """
+    Per-item results of a batch method: collected in `items`, or written to
+    an NdjsonStream as they are appended (then `items` stays empty)
+    """
+
+    def __init__(self, stream: Optional[NdjsonStream] = None):
+        self.stream = stream
+        self.items: List[Any] = []
+        self.count = 0
+
+    def append(self, item: Any) -> None:
+        self.count += 1
+        if self.stream is not None:
+            self.stream.item(item)
+        else:
+            self.items.append(item)
+
+    def __len__(self) -> int:
+        return self.count
+
+
+def output_stream(input_data: Dict[str, Any], items_key: str = 'results') -> Optional[NdjsonStream]:
+    """NdjsonStream when the input asks for streamed output ("stream": true)"""
+    return NdjsonStream(items_key) if input_data.get('stream') else None
+
+
+def format_output(data: Any, stream: Optional[NdjsonStream] = None) -> None:
     """
     Format and print data as JSON to stdout
     Used for TypeScript wrapper communication
 
     Args:
         data: Data to be output (dict, list, etc.)
+        stream: Streamed output; `data` is written as its summary record
+
+    With query instrumentation enabled, a dict result gets the run's
+    QUERY_STATS.summary() as "query_stats".
     """
+    if QUERY_STATS.enabled and isinstance(data, dict):
+        data = {**data, "query_stats": QUERY_STATS.summary()}
+    if stream is not None:
+        stream.summary(data)
+        return
     print(json.dumps(data, default=str), flush=True)
 
 
@@ -115,11 +722,16 @@ def read_input() -> Dict[str, Any]:
 
     Returns:
         Parsed JSON data as dictionary
+
+    "queryStats": true in the input enables query instrumentation for the run.
     """
     import sys
     try:
         input_data = sys.stdin.read()
-        return json.loads(input_data) if input_data else {}
+        data = json.loads(input_data) if input_data else {}
+        if isinstance(data, dict) and data.get('queryStats'):
+            enable_query_stats()
+        return data
     except Exception as e:
         print(f"Input reading error: {e}", flush=True)
         return {}
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Incremental evaluation listener
+
+Listens on the `af_data_synced` channel that the AppsFlyer sync NOTIFYs on commit
+(see sync_af_data.publish_synced_keys) and re-runs CampaignEvaluator /
+OperationEvaluator only for the (date, campaign) keys that changed, instead of
+re-scoring everything on a fixed schedule.
+
+Notifications are debounced: keys accumulate until no new notification has
+arrived for `debounce` seconds (or `max_wait` seconds after the first one), so a
+multi-day sync triggers one evaluation pass.
+
+Keys are AppsFlyer keys: (install date, `campaign` of af_cohort_kpi_daily /
+af_events, i.e. the AppsFlyer campaign name). They are mapped onto the Google
+Ads side the way operation-evaluator.ts pickAfContext maps the other way: a
+key matches a Google Ads campaign whose resource name / campaign id is the key,
+or whose `campaigns.name` is the key. The install date is taken as the
+performance date of mock_campaign_performance (cohort metrics per install day).
+
+Operations are re-scored when their T+7 evaluation date is one of the synced dates.
+
+Usage:
+    python evaluation_listener.py                        # listen forever
+    python evaluation_listener.py --debounce 10 --max-wait 60
+    echo '{"keys": {"2025-01-01": ["campaign_a"]}}' | python evaluation_listener.py --once
+"""
+
+import os
+import sys
+import json
+import time
+import select
+import signal
+import argparse
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Set
+
+import psycopg2
+import psycopg2.extensions
+
+from db_utils import get_db, format_output, read_input
+from campaign_evaluator import CampaignEvaluator
+from operation_evaluator import OperationEvaluator
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S',
+    stream=sys.stderr,
+)
+logger = logging.getLogger(__name__)
+
+# Must match sync_af_data.SYNC_NOTIFY_CHANNEL
+SYNC_NOTIFY_CHANNEL = "af_data_synced"
+
+# Operations are scored on data 7 days after they were made
+OPERATION_EVALUATION_DELAY_DAYS = 7
+
+
+def merge_keys(pending: Dict[str, Set[str]], keys: Dict[str, List[str]]) -> None:
+    """Merge {"YYYY-MM-DD": [campaign, ...]} into pending"""
+    for date_str, campaigns in keys.items():
+        pending.setdefault(date_str, set()).update(campaigns)
+
+
+def find_campaigns_for_keys(db, date_str: str, campaigns: Set[str]) -> List[str]:
+    """
+    mock_campaign_performance campaign_ids of `date_str` that the AppsFlyer
+    campaign keys map to (campaign id or name, directly or via `campaigns`)
+    """
+    names = sorted(campaigns)
+    rows = db.execute_query(
+        """
+            SELECT DISTINCT p.campaign_id
+            FROM mock_campaign_performance p
+            WHERE p.date = %s
+              AND (p.campaign_id = ANY(%s)
+                   OR p.campaign_name = ANY(%s)
+                   OR p.campaign_id IN (
+                       SELECT c.campaign_id FROM campaigns c WHERE c.name = ANY(%s) OR c.resource_name = ANY(%s)
+                   ))
+            ORDER BY p.campaign_id
+        """,
+        (date_str, names, names, names, names)
+    )
+    return [row['campaign_id'] for row in rows]
+
+
+def find_operations_for_keys(keys: Dict[str, Set[str]]) -> List[int]:
+    """
+    change_events whose T+7 evaluation date is a synced date and whose campaign
+    (a Google Ads resource name) is, or is named like, a synced AppsFlyer campaign
+    """
+    db = get_db()
+    operation_ids: Set[int] = set()
+    with db:
+        for date_str, campaigns in keys.items():
+            operation_date = (
+                datetime.strptime(date_str, "%Y-%m-%d") - timedelta(days=OPERATION_EVALUATION_DELAY_DAYS)
+            ).strftime("%Y-%m-%d")
+            names = sorted(campaigns)
+            rows = db.execute_query(
+                """
+                    SELECT ce.id
+                    FROM change_events ce
+                    WHERE DATE(ce.timestamp) = %s
+                      AND ce.resource_type IN ('CAMPAIGN_BUDGET', 'CAMPAIGN')
+                      AND (ce.campaign = ANY(%s)
+                           OR EXISTS (
+                               SELECT 1
+                               FROM campaigns c
+                               WHERE c.account_id = ce.account_id
+                                 AND c.resource_name = ce.campaign
+                                 AND c.name = ANY(%s)
+                           ))
+                """,
+                (operation_date, names, names)
+            )
+            operation_ids.update(row['id'] for row in rows)
+    return sorted(operation_ids)
+
+
+def evaluate_keys(keys: Dict[str, Set[str]], evaluate_operations: bool = True) -> Dict[str, Any]:
+    """
+    Re-run campaign evaluation for the campaigns the (date, campaign) keys map
+    to and operation scoring for operations whose evaluation date was synced.
+
+    Returns:
+        Summary with per-evaluator success/failure counts
+    """
+    started = time.monotonic()
+    campaign_evaluator = CampaignEvaluator()
+    campaign_results = {"evaluated": 0, "failed": 0}
+    # One connection (and its prepared statements) for all keys
+    with campaign_evaluator.db:
+        for date_str in sorted(keys):
+            for campaign_id in find_campaigns_for_keys(campaign_evaluator.db, date_str, keys[date_str]):
+                result = campaign_evaluator.evaluate_campaign(campaign_id, date_str)
+                campaign_results["failed" if 'error' in result else "evaluated"] += 1
+
+    operation_results = {"evaluated": 0, "failed": 0}
+    operation_ids = find_operations_for_keys(keys) if evaluate_operations else []
+    if operation_ids:
+        # Already-scored operations are re-scored with the refreshed data
+        result = OperationEvaluator().evaluate_operations_batch(operation_ids=operation_ids, only_unevaluated=False)
+        if result.get('success'):
+            operation_results = {"evaluated": result['success_count'], "failed": result['failed_count']}
+        else:
+            operation_results["failed"] = len(operation_ids)
+
+    return {
+        "success": True,
+        "dates": len(keys),
+        "campaign_keys": sum(len(c) for c in keys.values()),
+        "campaigns": campaign_results,
+        "operations": operation_results,
+        "duration_seconds": round(time.monotonic() - started, 3),
+    }
+
+
+class EvaluationListener:
+    """LISTEN af_data_synced, debounce, evaluate the accumulated keys"""
+
+    def __init__(self, debounce: float = 5.0, max_wait: float = 30.0, evaluate_operations: bool = True):
+        self.connection_string = os.getenv('DATABASE_URL')
+        if not self.connection_string:
+            raise ValueError("DATABASE_URL environment variable is not set")
+        self.debounce = debounce
+        self.max_wait = max_wait
+        self.evaluate_operations = evaluate_operations
+        self.pending: Dict[str, Set[str]] = {}
+        self.first_pending_at = 0.0
+        self.last_notify_at = 0.0
+        self.stopping = False
+
+    def handle_payload(self, payload: str) -> None:
+        try:
+            message = json.loads(payload)
+            keys = message["keys"]
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring malformed notification ({e}): {payload[:200]}")
+            return
+        now = time.monotonic()
+        if not self.pending:
+            self.first_pending_at = now
+        self.last_notify_at = now
+        merge_keys(self.pending, keys)
+
+    def seconds_until_due(self) -> float:
+        if not self.pending:
+            return float("inf")
+        now = time.monotonic()
+        return max(0.0, min(self.last_notify_at + self.debounce, self.first_pending_at + self.max_wait) - now)
+
+    def flush(self) -> None:
+        if not self.pending:
+            return
+        keys, self.pending = self.pending, {}
+        logger.info(f"Evaluating {sum(len(c) for c in keys.values())} campaign keys over {len(keys)} dates")
+        try:
+            summary = evaluate_keys(keys, self.evaluate_operations)
+            logger.info(f"Incremental evaluation done: {summary}")
+        except Exception as e:
+            logger.error(f"Incremental evaluation failed: {e}")
+
+    def connect(self):
+        conn = psycopg2.connect(self.connection_string)
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cur:
+            cur.execute(f"LISTEN {SYNC_NOTIFY_CHANNEL}")
+        logger.info(f"Listening on channel '{SYNC_NOTIFY_CHANNEL}'")
+        return conn
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, lambda *_: setattr(self, "stopping", True))
+        conn = None
+        while not self.stopping:
+            try:
+                if conn is None:
+                    conn = self.connect()
+                timeout = min(self.seconds_until_due(), 5.0)
+                if select.select([conn], [], [], timeout) != ([], [], []):
+                    conn.poll()
+                    while conn.notifies:
+                        self.handle_payload(conn.notifies.pop(0).payload)
+                if self.seconds_until_due() == 0:
+                    self.flush()
+            except psycopg2.OperationalError as e:
+                logger.warning(f"Listener connection lost ({e}); reconnecting in 5s")
+                conn = None
+                time.sleep(5)
+            except KeyboardInterrupt:
+                break
+        # Do not drop keys that were already announced
+        self.flush()
+        if conn is not None:
+            conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental evaluation on AppsFlyer sync notifications")
+    parser.add_argument("--debounce", type=float, default=float(os.getenv("EVAL_LISTENER_DEBOUNCE", "5")),
+                        help="Quiet seconds before evaluating (default: 5)")
+    parser.add_argument("--max-wait", type=float, default=float(os.getenv("EVAL_LISTENER_MAX_WAIT", "30")),
+                        help="Evaluate at most this many seconds after the first pending key (default: 30)")
+    parser.add_argument("--no-operations", action="store_true", help="Only re-run campaign evaluation")
+    parser.add_argument("--once", action="store_true",
+                        help='Evaluate {"keys": {date: [campaign, ...]}} from stdin and exit')
+    args = parser.parse_args()
+
+    if args.once:
+        keys: Dict[str, Set[str]] = {}
+        merge_keys(keys, read_input().get('keys', {}))
+        format_output(evaluate_keys(keys, not args.no_operations))
+        return
+
+    EvaluationListener(args.debounce, args.max_wait, not args.no_operations).run()
+
+
+if __name__ == "__main__":
+    main()
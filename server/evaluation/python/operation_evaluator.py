@@ -8,8 +8,363 @@ Generates optimizer leaderboards based on operation performance.
 
 import sys
 from datetime import datetime, timedelta
-from typing import Dict, Any, List, Optional
-from db_utils import get_db, format_output, read_input
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from db_utils import (
+    get_db, format_output, read_input, input_fingerprint, output_stream, BatchResults, NdjsonStream,
+)
+from baseline_cache import get_baseline_cache
+from scoring import (
+    OPERATION_THRESHOLDS, OPERATION_SCORES,
+    STAGE_THRESHOLDS, STAGE_BASE_SCORES, STAGE_RISK_LEVELS, STAGE_SUGGESTION_TYPES,
+    achievement_rates, operation_codes, stage_codes, labels,
+)
+
+OPERATION_SCORE_COLUMNS = (
+    'operation_id', 'campaign_id', 'optimizer_email', 'operation_type',
+    'operation_date', 'evaluation_date',
+    'actual_roas7', 'actual_ret7',
+    'baseline_roas7', 'baseline_ret7',
+    'roas_achievement_rate', 'ret_achievement_rate',
+)
+
+# Operations with their T+7 performance row and safety baseline, one statement,
+# as T+7 stage rows for score_operation_stages (the T+7 score is the T+7 stage).
+# Missing performance / baseline come back as NULLs and are reported per operation.
+BATCH_OPERATIONS_QUERY = """
+    SELECT
+        ce.id AS operation_id,
+        ce.user_email AS optimizer_email,
+        ce.operation_type,
+        ce.field_changes,
+        ce.resource_name AS campaign_name,
+        ce.campaign AS campaign_id,
+        DATE(ce.timestamp) AS operation_date,
+        'T+7' AS score_stage,
+        %(stage_factor)s::numeric AS stage_factor,
+        DATE(ce.timestamp) + 7 AS evaluation_date,
+        p.campaign_id IS NOT NULL AS has_performance,
+        p.actual_roas7,
+        p.actual_ret7,
+        b.id IS NOT NULL AS has_baseline,
+        b.baseline_roas7,
+        b.baseline_ret7
+    FROM change_events ce
+    LEFT JOIN mock_campaign_performance p
+      ON p.campaign_id = ce.campaign
+     AND p.date = DATE(ce.timestamp) + 7
+    LEFT JOIN safety_baseline b
+      ON b.product_name = p.product_name
+     AND b.country_code = p.country_code
+     AND b.platform = p.platform
+     AND b.channel = p.channel
+    WHERE ce.resource_type IN ('CAMPAIGN_BUDGET', 'CAMPAIGN')
+      AND (%(target_date)s::date IS NULL OR DATE(ce.timestamp) = %(target_date)s::date)
+      AND (%(operation_ids)s::int[] IS NULL OR ce.id = ANY(%(operation_ids)s::int[]))
+      AND (NOT %(only_unevaluated)s OR NOT EXISTS (
+            SELECT 1 FROM operation_score os WHERE os.operation_id = ce.id AND os.score_stage = 'T+7'
+      ))
+    ORDER BY ce.id
+"""
+
+# Score buckets on min(roas, ret) achievement rate (scoring.OPERATION_THRESHOLDS),
+# also passed to OPTIMIZER_STATS_REFRESH_QUERY
+QUALIFIED_RATE, EXCELLENT_RATE = (int(t) for t in OPERATION_THRESHOLDS)
+
+# Recompute optimizer_daily_stats for the touched (optimizer, operation date)
+# buckets; NULL arrays rebuild the whole table. The statement lives in the
+# refresh_optimizer_daily_stats function (add-optimizer-daily-stats migration),
+# which the TS refreshOptimizerDailyStats calls as well.
+OPTIMIZER_STATS_REFRESH_QUERY = """
+    SELECT refresh_optimizer_daily_stats(
+        %(emails)s::text[], %(dates)s::date[], %(qualified_rate)s, %(excellent_rate)s
+    )
+"""
+
+# Leaderboards for several windows in one pass over optimizer_daily_stats
+LEADERBOARD_QUERY = """
+    SELECT
+        w.days AS period_days,
+        s.optimizer_email,
+        SUM(s.total_operations) AS total_operations,
+        SUM(s.roas_achievement_sum) / NULLIF(SUM(s.roas_achievement_count), 0) AS avg_roas_achievement,
+        SUM(s.ret_achievement_sum) / NULLIF(SUM(s.ret_achievement_count), 0) AS avg_ret_achievement,
+        SUM(s.min_achievement_sum) / NULLIF(SUM(s.min_achievement_count), 0) AS avg_min_achievement,
+        SUM(s.excellent_count) AS excellent_count,
+        SUM(s.qualified_count) AS good_count,
+        SUM(s.failed_count) AS failed_count
+    FROM unnest(%(windows)s::int[]) AS w(days)
+    JOIN optimizer_daily_stats s
+      ON s.operation_date >= %(end_date)s::date - w.days
+    WHERE (%(operation_type)s::text IS NULL OR s.operation_type = %(operation_type)s::text)
+      AND (%(account_id)s::int IS NULL OR s.account_id = %(account_id)s::int)
+      AND (%(score_stage)s::text IS NULL OR s.score_stage = %(score_stage)s::text)
+    GROUP BY w.days, s.optimizer_email
+    ORDER BY w.days, avg_min_achievement DESC NULLS LAST
+"""
+
+# Stage scoring (same rules as the TS operation-evaluator wrapper)
+SCORE_STAGES = {'T+1': 1, 'T+3': 3, 'T+7': 7}
+STAGE_FACTORS = {'T+1': 0.5, 'T+3': 0.8, 'T+7': 1.0}
+# min(roas, ret) achievement bins -> base score / risk / suggestion live in
+# scoring.STAGE_THRESHOLDS / STAGE_BASE_SCORES / STAGE_RISK_LEVELS / STAGE_SUGGESTION_TYPES
+
+# Stages these evaluators can score. mock_campaign_performance and
+# safety_baseline only carry 7-day ROAS / retention; T+1 / T+3 compare D1 / D3
+# cohort metrics against the stage-day baseline_metrics and are scored by the
+# AppsFlyer evaluator (wrappers/operation-evaluator.ts evaluateStage).
+CATCH_UP_STAGES = ('T+7',)
+
+# Bold / precise / excellent operation recognition (base score, change magnitude)
+RECOGNITION_MIN_BASE_SCORE = 80
+EXCELLENT_BASE_SCORE = 100
+BOLD_MAGNITUDE = 0.2
+PRECISE_MAGNITUDE = 0.05
+
+# Every (operation, stage) whose evaluation date has passed and that has no
+# score yet, with the day-7 performance row and the safety baseline.
+# Operations older than the lookback are left alone.
+DUE_STAGES_QUERY = """
+    WITH stages AS (
+        SELECT * FROM unnest(%(stages)s::text[], %(stage_days)s::int[], %(stage_factors)s::numeric[])
+            AS st(score_stage, stage_days, stage_factor)
+    ),
+    due AS (
+        SELECT
+            ce.id AS operation_id,
+            ce.user_email AS optimizer_email,
+            ce.operation_type,
+            ce.field_changes,
+            ce.resource_name AS campaign_name,
+            ce.campaign AS campaign_id,
+            DATE(ce.timestamp) AS operation_date,
+            st.score_stage,
+            st.stage_days,
+            st.stage_factor,
+            DATE(ce.timestamp) + st.stage_days AS evaluation_date
+        FROM change_events ce
+        CROSS JOIN stages st
+        WHERE ce.resource_type IN ('CAMPAIGN_BUDGET', 'CAMPAIGN')
+          AND DATE(ce.timestamp) >= %(as_of)s::date - %(lookback_days)s
+          AND DATE(ce.timestamp) + st.stage_days <= %(as_of)s::date
+          AND NOT EXISTS (
+                SELECT 1 FROM operation_score os
+                WHERE os.operation_id = ce.id AND os.score_stage = st.score_stage
+          )
+    )
+    SELECT
+        due.*,
+        p.campaign_id IS NOT NULL AS has_performance,
+        p.actual_roas7,
+        p.actual_ret7,
+        b.id IS NOT NULL AS has_baseline,
+        b.baseline_roas7,
+        b.baseline_ret7
+    FROM due
+    LEFT JOIN mock_campaign_performance p
+      ON p.campaign_id = due.campaign_id
+     AND p.date = due.evaluation_date
+    LEFT JOIN safety_baseline b
+      ON b.product_name = p.product_name
+     AND b.country_code = p.country_code
+     AND b.platform = p.platform
+     AND b.channel = p.channel
+    ORDER BY due.operation_id, due.stage_days
+"""
+
+STAGE_SCORE_COLUMNS = OPERATION_SCORE_COLUMNS + (
+    'score_stage', 'stage_factor',
+    'actual_roas', 'actual_ret', 'baseline_roas', 'baseline_ret',
+    'roas_achievement', 'retention_achievement', 'min_achievement',
+    'risk_level', 'base_score', 'final_score',
+    'suggestion_type', 'suggestion_detail',
+    'value_before', 'value_after', 'change_percentage',
+    'operation_magnitude', 'operation_type_label',
+    'is_bold_success', 'special_recognition',
+)
+
+# A NULL stored fingerprint marks a row scored by the TS AppsFlyer evaluator
+# (createOperationScore); the Python re-scores never overwrite those.
+STAGE_SCORE_CONFLICT = "ON CONFLICT (operation_id, score_stage) DO UPDATE SET " + ", ".join(
+    f"{column} = EXCLUDED.{column}"
+    for column in STAGE_SCORE_COLUMNS + ('input_fingerprint',)
+    if column not in ('operation_id', 'score_stage')
+) + (" WHERE operation_score.input_fingerprint IS NOT NULL"
+       " AND operation_score.input_fingerprint IS DISTINCT FROM EXCLUDED.input_fingerprint")
+
+
+def stage_score_fingerprint(record: Tuple) -> str:
+    """input_fingerprint of a STAGE_SCORE_COLUMNS record (T+N stage score)"""
+    return input_fingerprint('stage', record, STAGE_THRESHOLDS, STAGE_FACTORS)
+
+
+def extract_change_values(field_changes: Any) -> Tuple[Optional[float], Optional[float], Optional[float]]:
+    """(value_before, value_after, change_percentage) from the first numeric field change"""
+    if not isinstance(field_changes, dict):
+        return None, None, None
+    for entry in field_changes.values():
+        if not isinstance(entry, dict):
+            continue
+        try:
+            before = float(str(entry.get('old')).replace(',', ''))
+            after = float(str(entry.get('new')).replace(',', ''))
+        except ValueError:
+            continue
+        if not (np.isfinite(before) and np.isfinite(after)):
+            continue
+        if before == 0:
+            return before, after, None
+        return before, after, (after - before) / before
+    return None, None, None
+
+
+def magnitude_label(change_percentage: Optional[float]) -> Optional[str]:
+    if change_percentage is None:
+        return None
+    magnitude = abs(change_percentage)
+    if magnitude <= 0.05:
+        return '微调'
+    if magnitude <= 0.2:
+        return '常规调整'
+    return '大胆操作'
+
+
+def recognition(base_score: Optional[int], magnitude: Optional[float]) -> Tuple[bool, Optional[str]]:
+    """(is_bold_success, special_recognition) as the TS evaluateStage awards them"""
+    if base_score is None or base_score < RECOGNITION_MIN_BASE_SCORE:
+        return False, None
+    magnitude = magnitude or 0
+    if magnitude > BOLD_MAGNITUDE:
+        return True, '🌟 大胆创新奖'
+    if magnitude <= PRECISE_MAGNITUDE:
+        return False, '🎯 精准调优奖'
+    if base_score >= EXCELLENT_BASE_SCORE:
+        return False, '🏆 卓越表现奖'
+    return False, None
+
+
+def stage_score_record(r: Any) -> Tuple:
+    """
+    STAGE_SCORE_COLUMNS record of a scored score_operation_stages row
+
+    Every Python operation_score writer (evaluate_due_stages, the T+7 batch
+    and the single-operation path) builds its row here, so a stage has one
+    column set and one input fingerprint whichever path scored it. The
+    metrics are 7-day values (CATCH_UP_STAGES).
+    """
+    before, after, change = extract_change_values(r.field_changes)
+    base_score = None if np.isnan(r.base_score) else int(r.base_score)
+    magnitude = None if change is None else abs(change)
+    return (
+        r.operation_id, r.campaign_id, r.optimizer_email, r.operation_type,
+        r.operation_date, r.evaluation_date,
+        float(r.actual_roas7), float(r.actual_ret7),
+        float(r.baseline_roas7), float(r.baseline_ret7),
+        float(r.roas_achievement_rate), float(r.ret_achievement_rate),
+        r.score_stage, float(r.stage_factor),
+        float(r.actual_roas7), float(r.actual_ret7),
+        float(r.baseline_roas7), float(r.baseline_ret7),
+        _nullable(r.roas_achievement), _nullable(r.retention_achievement),
+        _nullable(r.min_achievement),
+        r.risk_level,
+        base_score,
+        _nullable(r.final_score),
+        r.suggestion_type,
+        f"Auto-suggest: {r.suggestion_type}" if r.suggestion_type else None,
+        before, after, change,
+        magnitude,
+        magnitude_label(change),
+        *recognition(base_score, magnitude),
+    )
+
+
+def score_operation_stages(frame: pd.DataFrame) -> pd.DataFrame:
+    """
+    Stage scores for DUE_STAGES_QUERY / BATCH_OPERATIONS_QUERY rows: achievement as a fraction of the
+    baseline (None when the baseline is not positive), base score / risk level
+    / suggestion from scoring.STAGE_THRESHOLDS, final score = base score * stage factor.
+    """
+    frame = score_operations(frame)
+    roas, ret, min_achievement = achievement_rates(
+        frame['actual_roas7'], frame['actual_ret7'], frame['baseline_roas7'], frame['baseline_ret7'],
+        missing_baseline=np.nan, scale=1.0
+    )
+
+    bucket = stage_codes(min_achievement)
+    base_score = labels(STAGE_BASE_SCORES.astype(float), bucket, np.nan)
+    stage_factor = pd.to_numeric(frame['stage_factor']).to_numpy(dtype=float)
+
+    return frame.assign(
+        roas_achievement=roas,
+        retention_achievement=ret,
+        min_achievement=min_achievement,
+        base_score=base_score,
+        final_score=np.round(base_score * stage_factor, 2),
+        risk_level=labels(STAGE_RISK_LEVELS, bucket),
+        suggestion_type=labels(STAGE_SUGGESTION_TYPES, bucket),
+    )
+
+
+def _nullable(value: Any) -> Optional[float]:
+    if value is None:
+        return None
+    value = float(value)
+    return None if np.isnan(value) else value
+
+
+def format_leaderboard_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """get_optimizer_leaderboard entry from a LEADERBOARD_QUERY row"""
+    total_ops = int(row['total_operations'])
+    excellent = int(row['excellent_count'])
+    good = int(row['good_count'])
+    failed = int(row['failed_count'])
+
+    return {
+        "optimizer_email": row['optimizer_email'],
+        "total_operations": total_ops,
+        "avg_roas_achievement": round(float(row['avg_roas_achievement'] or 0), 2),
+        "avg_ret_achievement": round(float(row['avg_ret_achievement'] or 0), 2),
+        "avg_min_achievement": round(float(row['avg_min_achievement'] or 0), 2),
+        "excellent_count": excellent,
+        "excellent_rate": round(excellent / total_ops * 100, 1) if total_ops > 0 else 0.0,
+        "good_count": good,
+        "good_rate": round(good / total_ops * 100, 1) if total_ops > 0 else 0.0,
+        "failed_count": failed,
+        "failed_rate": round(failed / total_ops * 100, 1) if total_ops > 0 else 0.0
+    }
+
+
+def score_operations(frame: pd.DataFrame) -> pd.DataFrame:
+    """
+    Vectorized evaluate_operation steps 4-5.
+
+    Expects BATCH_OPERATIONS_QUERY columns (operation_type is
+    change_events.operation_type, as the TS evaluator stores it); adds
+    roas/ret/min_achievement_rate and score.
+    """
+    def values(column: str) -> np.ndarray:
+        # Decimal / None from the cursor -> float / NaN
+        return pd.to_numeric(frame[column], errors='coerce').to_numpy(dtype=float)
+
+    actual_roas7, actual_ret7 = values('actual_roas7'), values('actual_ret7')
+    baseline_roas7, baseline_ret7 = values('baseline_roas7'), values('baseline_ret7')
+    roas_rate, ret_rate, min_rate = achievement_rates(actual_roas7, actual_ret7, baseline_roas7, baseline_ret7)
+    # A missing actual (NaN rate) scores 失败
+    score = labels(OPERATION_SCORES, operation_codes(min_rate), OPERATION_SCORES[0])
+
+    return frame.assign(
+        actual_roas7=actual_roas7,
+        actual_ret7=actual_ret7,
+        baseline_roas7=baseline_roas7,
+        baseline_ret7=baseline_ret7,
+        roas_achievement_rate=roas_rate,
+        ret_achievement_rate=ret_rate,
+        min_achievement_rate=min_rate,
+        score=score,
+    )
 
 
 class OperationEvaluator:
@@ -50,7 +405,8 @@ class OperationEvaluator:
                         id,
                         user_email,
                         resource_type,
-                        summary,
+                        operation_type,
+                        field_changes,
                         timestamp,
                         resource_name as campaign_name,
                         campaign as campaign_id
@@ -69,25 +425,14 @@ class OperationEvaluator:
 
                 operation = operation_results[0]
 
-                operation_date = operation['timestamp']
-                evaluation_date = operation_date + timedelta(days=7)
+                operation_date = operation['timestamp'].date()
+                evaluation_date = operation_date + timedelta(days=SCORE_STAGES['T+7'])
                 evaluation_date_str = evaluation_date.strftime("%Y-%m-%d")
                 operation_date_str = operation_date.strftime("%Y-%m-%d")
 
                 campaign_id = operation['campaign_id']
                 optimizer_email = operation['user_email']
 
-                # Determine operation type from summary
-                summary = operation['summary']
-                if 'Budget' in summary:
-                    operation_type = 'BUDGET_UPDATE'
-                elif 'tROAS' in summary or 'ROAS' in summary:
-                    operation_type = 'TROAS_UPDATE'
-                elif 'status' in summary.lower():
-                    operation_type = 'STATUS_CHANGE'
-                else:
-                    operation_type = 'OTHER'
-
                 # 2. Get campaign performance data 7 days after operation
                 performance_query = """
                     SELECT
@@ -118,78 +463,57 @@ class OperationEvaluator:
                 actual_roas7 = float(performance['actual_roas7'])
                 actual_ret7 = float(performance['actual_ret7'])
 
-                # 3. Get baseline at operation time
-                baseline_query = """
-                    SELECT baseline_roas7, baseline_ret7
-                    FROM safety_baseline
-                    WHERE product_name = %s
-                      AND country_code = %s
-                      AND platform = %s
-                      AND channel = %s
-                    LIMIT 1
-                """
-
-                baseline_results = self.db.execute_query(
-                    baseline_query,
-                    (performance['product_name'], performance['country_code'],
-                     performance['platform'], performance['channel'])
+                # 3. Get baseline at operation time (cached, one load per process)
+                baseline = get_baseline_cache().safety(
+                    self.db, performance['product_name'], performance['country_code'],
+                    performance['platform'], performance['channel']
                 )
 
-                if not baseline_results or len(baseline_results) == 0:
+                if baseline is None:
                     return {
                         "error": "No baseline found",
                         "operation_id": operation_id
                     }
 
-                baseline = baseline_results[0]
                 baseline_roas7 = float(baseline['baseline_roas7'])
                 baseline_ret7 = float(baseline['baseline_ret7'])
 
-                # 4. Calculate achievement rates
-                roas_achievement_rate = (actual_roas7 / baseline_roas7 * 100) if baseline_roas7 > 0 else 0.0
-                ret_achievement_rate = (actual_ret7 / baseline_ret7 * 100) if baseline_ret7 > 0 else 0.0
-                min_achievement_rate = min(roas_achievement_rate, ret_achievement_rate)
-
-                # 5. Determine score
-                if min_achievement_rate >= 110:
-                    score = "优秀"
-                elif min_achievement_rate >= 85:
-                    score = "合格"
-                else:
-                    score = "失败"
+                # 4-5. Achievement rates, score and T+7 stage score (same scorer as the batch paths)
+                r = next(score_operation_stages(pd.DataFrame([{
+                    "operation_id": operation_id,
+                    "optimizer_email": optimizer_email,
+                    "operation_type": operation['operation_type'],
+                    "field_changes": operation['field_changes'],
+                    "campaign_id": campaign_id,
+                    "operation_date": operation_date,
+                    "score_stage": 'T+7',
+                    "stage_factor": STAGE_FACTORS['T+7'],
+                    "evaluation_date": evaluation_date,
+                    "actual_roas7": actual_roas7,
+                    "actual_ret7": actual_ret7,
+                    "baseline_roas7": baseline_roas7,
+                    "baseline_ret7": baseline_ret7,
+                }])).itertuples(index=False))
 
                 # 6. Save to database
-                self.save_operation_score(
-                    operation_id=operation_id,
-                    campaign_id=campaign_id,
-                    optimizer_email=optimizer_email,
-                    operation_type=operation_type,
-                    operation_date=operation_date_str,
-                    evaluation_date=evaluation_date_str,
-                    actual_roas7=actual_roas7,
-                    actual_ret7=actual_ret7,
-                    baseline_roas7=baseline_roas7,
-                    baseline_ret7=baseline_ret7,
-                    roas_achievement_rate=roas_achievement_rate,
-                    ret_achievement_rate=ret_achievement_rate
-                )
+                self.save_operation_score(stage_score_record(r))
 
                 return {
                     "operation_id": operation_id,
                     "campaign_id": campaign_id,
                     "campaign_name": operation['campaign_name'],
                     "optimizer_email": optimizer_email,
-                    "operation_type": operation_type,
+                    "operation_type": r.operation_type,
                     "operation_date": operation_date_str,
                     "evaluation_date": evaluation_date_str,
                     "actual_roas7": actual_roas7,
                     "actual_ret7": actual_ret7,
                     "baseline_roas7": baseline_roas7,
                     "baseline_ret7": baseline_ret7,
-                    "roas_achievement_rate": round(roas_achievement_rate, 2),
-                    "ret_achievement_rate": round(ret_achievement_rate, 2),
-                    "min_achievement_rate": round(min_achievement_rate, 2),
-                    "score": score
+                    "roas_achievement_rate": round(float(r.roas_achievement_rate), 2),
+                    "ret_achievement_rate": round(float(r.ret_achievement_rate), 2),
+                    "min_achievement_rate": round(float(r.min_achievement_rate), 2),
+                    "score": r.score
                 }
 
         except Exception as e:
@@ -199,52 +523,124 @@ class OperationEvaluator:
                 "operation_id": operation_id
             }
 
-    def save_operation_score(
-        self,
-        operation_id: int,
-        campaign_id: str,
-        optimizer_email: str,
-        operation_type: str,
-        operation_date: str,
-        evaluation_date: str,
-        actual_roas7: float,
-        actual_ret7: float,
-        baseline_roas7: float,
-        baseline_ret7: float,
-        roas_achievement_rate: float,
-        ret_achievement_rate: float
-    ) -> bool:
-        """Save operation score to database"""
+    def save_operation_score(self, record: Tuple) -> bool:
+        """
+        Save a stage score (STAGE_SCORE_COLUMNS record from stage_score_record)
+        to database; re-evaluation overwrites the same stage
+
+        Skips the write, and the optimizer stats refresh, when the stored
+        input fingerprint matches.
+        """
         try:
-            query = """
-                INSERT INTO operation_score (
-                    operation_id, campaign_id, optimizer_email, operation_type,
-                    operation_date, evaluation_date,
-                    actual_roas7, actual_ret7,
-                    baseline_roas7, baseline_ret7,
-                    roas_achievement_rate, ret_achievement_rate,
-                    created_at
-                )
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW())
+            query = f"""
+                INSERT INTO operation_score ({', '.join(STAGE_SCORE_COLUMNS)}, input_fingerprint, created_at)
+                VALUES ({', '.join(['%s'] * len(STAGE_SCORE_COLUMNS))}, %s, NOW())
+                {STAGE_SCORE_CONFLICT}
             """
 
-            return self.db.execute_update(
-                query,
-                (operation_id, campaign_id, optimizer_email, operation_type,
-                 operation_date, evaluation_date,
-                 actual_roas7, actual_ret7,
-                 baseline_roas7, baseline_ret7,
-                 roas_achievement_rate, ret_achievement_rate)
-            )
+            saved = self.db.execute_update(query, record + (stage_score_fingerprint(record),))
+            if saved and self.db.cursor.rowcount:
+                self.refresh_optimizer_stats([(record[2], record[4])])
+            return saved
 
         except Exception as e:
             print(f"Save operation score error: {e}", file=sys.stderr, flush=True)
             return False
 
+    def refresh_optimizer_stats(self, keys: Optional[Iterable[Tuple[str, Any]]] = None) -> bool:
+        """
+        Recompute optimizer_daily_stats buckets from operation_score
+
+        Called after every operation_score write with the touched
+        (optimizer_email, operation_date) pairs; keys=None rebuilds the whole
+        table. Operations without an optimizer email are not ranked.
+
+        Must be called inside `with self.db`.
+        """
+        params: Dict[str, Any] = {
+            "emails": None, "dates": None,
+            "excellent_rate": EXCELLENT_RATE, "qualified_rate": QUALIFIED_RATE,
+        }
+        if keys is not None:
+            pairs = sorted({(email, str(day)) for email, day in keys if email})
+            if not pairs:
+                return True
+            params["emails"] = [email for email, _ in pairs]
+            params["dates"] = [day for _, day in pairs]
+        return self.db.execute_update(OPTIMIZER_STATS_REFRESH_QUERY, params)
+
+    def get_optimizer_leaderboards(
+        self,
+        windows: Iterable[int] = (7, 30, 90),
+        limit: int = 20,
+        operation_type: Optional[str] = None,
+        account_id: Optional[int] = None,
+        score_stage: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Rolling leaderboards for several windows from optimizer_daily_stats
+
+        Args:
+            windows: Look back periods in days (default: 7, 30, 90)
+            limit: Maximum number of optimizers per window (default: 20)
+            operation_type: Only this operation type (change_events.operation_type, e.g. UPDATE)
+            account_id: Only operations of this account
+            score_stage: Only this stage (T+1/T+3/T+7)
+
+        Returns:
+            Dictionary containing:
+            - end_date: str
+            - windows: {days: get_optimizer_leaderboard result}
+        """
+        windows = sorted({int(days) for days in windows})
+        try:
+            with self.db:
+                end_date = datetime.now()
+                end_date_str = end_date.strftime("%Y-%m-%d")
+                rows = self.db.execute_query(
+                    LEADERBOARD_QUERY,
+                    {
+                        "windows": windows,
+                        "end_date": end_date_str,
+                        "operation_type": operation_type,
+                        "account_id": account_id,
+                        "score_stage": score_stage,
+                    }
+                )
+
+            boards: Dict[int, List[Dict[str, Any]]] = {days: [] for days in windows}
+            for row in rows:
+                board = boards[row['period_days']]
+                if len(board) < limit:
+                    board.append(format_leaderboard_row(row))
+
+            return {
+                "end_date": end_date_str,
+                "windows": {
+                    str(days): {
+                        "period_days": days,
+                        "start_date": (end_date - timedelta(days=days)).strftime("%Y-%m-%d"),
+                        "end_date": end_date_str,
+                        "total_optimizers": len(board),
+                        "leaderboard": board
+                    }
+                    for days, board in boards.items()
+                }
+            }
+
+        except Exception as e:
+            print(f"Leaderboard error: {e}", file=sys.stderr, flush=True)
+            return {
+                "error": str(e)
+            }
+
     def get_optimizer_leaderboard(
         self,
         days: int = 30,
-        limit: int = 20
+        limit: int = 20,
+        operation_type: Optional[str] = None,
+        account_id: Optional[int] = None,
+        score_stage: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         Get optimizer leaderboard based on operation performance
@@ -252,151 +648,254 @@ class OperationEvaluator:
         Args:
             days: Look back period in days (default: 30)
             limit: Maximum number of optimizers to return (default: 20)
+            operation_type / account_id / score_stage: Optional filters
 
         Returns:
             Dictionary containing:
             - period_days: int
             - leaderboard: List of optimizer stats
         """
+        result = self.get_optimizer_leaderboards([days], limit, operation_type, account_id, score_stage)
+        if 'error' in result:
+            return result
+        return result['windows'][str(days)]
+
+    def evaluate_operations_batch(
+        self,
+        target_date: Optional[str] = None,
+        operation_ids: Optional[List[int]] = None,
+        only_unevaluated: bool = True,
+        stream: Optional[NdjsonStream] = None
+    ) -> Dict[str, Any]:
+        """
+        Set-based evaluate_operation for many operations
+
+        One statement joins change_events, mock_campaign_performance (T+7) and
+        safety_baseline; achievement rates, scores and the T+7 stage score are
+        computed over the whole set (score_operation_stages, like
+        evaluate_due_stages) and all rows are written with one bulk
+        INSERT ... ON CONFLICT (operation_id, score_stage); rows whose input
+        fingerprint is unchanged are left alone (unchanged_count).
+
+        Args:
+            target_date: Operation date (YYYY-MM-DD); None for any date
+            operation_ids: Restrict to these operations
+            only_unevaluated: Skip operations that already have a T+7 score
+            stream: Write each per-operation result as it is scored instead
+                of collecting "results" (written before the bulk upsert; the
+                summary's success covers the write)
+
+        Returns:
+            Summary with per-operation results, same shape as
+            evaluate_operations_7days_ago
+        """
         try:
             with self.db:
-                # Calculate date range
-                end_date = datetime.now()
-                start_date = end_date - timedelta(days=days)
-                start_date_str = start_date.strftime("%Y-%m-%d")
+                rows = self.db.execute_query(
+                    BATCH_OPERATIONS_QUERY,
+                    {
+                        "target_date": target_date,
+                        "operation_ids": operation_ids,
+                        "only_unevaluated": only_unevaluated,
+                        "stage_factor": STAGE_FACTORS['T+7'],
+                    },
+                    row_mode='record'
+                )
 
-                # Get optimizer statistics
-                leaderboard_query = """
-                    SELECT
-                        optimizer_email,
-                        COUNT(*) as total_operations,
-                        AVG(roas_achievement_rate) as avg_roas_achievement,
-                        AVG(ret_achievement_rate) as avg_ret_achievement,
-                        AVG(LEAST(roas_achievement_rate, ret_achievement_rate)) as avg_min_achievement,
-                        COUNT(CASE WHEN LEAST(roas_achievement_rate, ret_achievement_rate) >= 110 THEN 1 END) as excellent_count,
-                        COUNT(CASE WHEN LEAST(roas_achievement_rate, ret_achievement_rate) >= 85 AND LEAST(roas_achievement_rate, ret_achievement_rate) < 110 THEN 1 END) as good_count,
-                        COUNT(CASE WHEN LEAST(roas_achievement_rate, ret_achievement_rate) < 85 THEN 1 END) as failed_count
-                    FROM operation_score
-                    WHERE operation_date >= %s
-                    GROUP BY optimizer_email
-                    ORDER BY avg_min_achievement DESC
-                    LIMIT %s
-                """
+                results = BatchResults(stream)
+                records = []
+                if rows:
+                    frame = score_operation_stages(pd.DataFrame(rows))
+                    for r in frame.itertuples(index=False):
+                        if not r.has_performance:
+                            results.append({
+                                "operation_id": r.operation_id,
+                                "error": f"No performance data found for campaign {r.campaign_id} on {r.evaluation_date}"
+                            })
+                            continue
+                        if not r.has_baseline:
+                            results.append({"operation_id": r.operation_id, "error": "No baseline found"})
+                            continue
+
+                        record = stage_score_record(r)
+                        records.append(record + (stage_score_fingerprint(record),))
+                        results.append({
+                            "operation_id": r.operation_id,
+                            "optimizer": r.optimizer_email,
+                            "score": r.score,
+                            "min_achievement_rate": round(float(r.min_achievement_rate), 2)
+                        })
 
-                leaderboard = self.db.execute_query(
-                    leaderboard_query,
-                    (start_date_str, limit)
+                written = self.db.execute_bulk(
+                    f"""
+                        INSERT INTO operation_score ({', '.join(STAGE_SCORE_COLUMNS)}, input_fingerprint, created_at)
+                        VALUES %s
+                        {STAGE_SCORE_CONFLICT}
+                    """,
+                    records,
+                    template=f"({', '.join(['%s'] * (len(STAGE_SCORE_COLUMNS) + 1))}, NOW())"
                 )
+                if written < 0:
+                    return {"success": False, "error": "Failed to save operation scores"}
+                if written:
+                    self.refresh_optimizer_stats((r[2], r[4]) for r in records)
 
-                # Format results
-                results = []
-                for row in leaderboard:
-                    total_ops = int(row['total_operations'])
-                    excellent = int(row['excellent_count'])
-                    good = int(row['good_count'])
-                    failed = int(row['failed_count'])
-
-                    results.append({
-                        "optimizer_email": row['optimizer_email'],
-                        "total_operations": total_ops,
-                        "avg_roas_achievement": round(float(row['avg_roas_achievement']), 2),
-                        "avg_ret_achievement": round(float(row['avg_ret_achievement']), 2),
-                        "avg_min_achievement": round(float(row['avg_min_achievement']), 2),
-                        "excellent_count": excellent,
-                        "excellent_rate": round(excellent / total_ops * 100, 1) if total_ops > 0 else 0.0,
-                        "good_count": good,
-                        "good_rate": round(good / total_ops * 100, 1) if total_ops > 0 else 0.0,
-                        "failed_count": failed,
-                        "failed_rate": round(failed / total_ops * 100, 1) if total_ops > 0 else 0.0
-                    })
-
+                success_count = len(records)
                 return {
-                    "period_days": days,
-                    "start_date": start_date_str,
-                    "end_date": end_date.strftime("%Y-%m-%d"),
-                    "total_optimizers": len(results),
-                    "leaderboard": results
+                    "success": True,
+                    "target_date": target_date,
+                    "total_operations": len(results),
+                    "success_count": success_count,
+                    "unchanged_count": success_count - written,
+                    "failed_count": len(results) - success_count,
+                    "results": results.items
                 }
 
         except Exception as e:
-            print(f"Leaderboard error: {e}", file=sys.stderr, flush=True)
+            print(f"Batch evaluation error: {e}", file=sys.stderr, flush=True)
             return {
+                "success": False,
                 "error": str(e)
             }
 
-    def evaluate_operations_7days_ago(self) -> Dict[str, Any]:
+    def evaluate_due_stages(
+        self,
+        as_of: Optional[str] = None,
+        lookback_days: int = 30,
+        stages: Optional[List[str]] = None,
+        stream: Optional[NdjsonStream] = None
+    ) -> Dict[str, Any]:
         """
-        Batch evaluate all operations from 7 days ago
+        Score every operation stage in CATCH_UP_STAGES (T+7) that is due and not yet scored
 
-        This should be run daily to evaluate operations that were made 7 days ago.
+        One query finds all due (operation, stage) pairs in the lookback window,
+        including stages missed on earlier days, together with their day-7
+        performance and baseline; all stages are scored together and upserted
+        with one bulk INSERT ... ON CONFLICT (operation_id, score_stage).
+        Stages without performance data yet stay pending and are picked up by
+        the next run. T+1 / T+3 need D1 / D3 cohort metrics that the mock
+        performance tables do not have and are rejected.
+
+        Args:
+            as_of: Evaluation date (default: today)
+            lookback_days: Only operations from the last N days (default: 30)
+            stages: Subset of CATCH_UP_STAGES (default: all)
+            stream: Write each (operation, stage) result as it is scored
+                instead of collecting "results"
 
         Returns:
-            Summary of evaluation results
+            Dictionary containing:
+            - success: bool
+            - as_of: str
+            - total_due / scored / pending / failed: int
+            - stages: {stage: scored count}
+            - results: per (operation, stage) score, pending flag or error
         """
-        try:
-            # Calculate target date (7 days ago)
-            target_date = datetime.now() - timedelta(days=7)
-            target_date_str = target_date.strftime("%Y-%m-%d")
+        stages = stages or list(CATCH_UP_STAGES)
+        unknown = [stage for stage in stages if stage not in SCORE_STAGES]
+        if unknown:
+            return {"success": False, "error": f"Unknown stages: {unknown}"}
+        unsupported = [stage for stage in stages if stage not in CATCH_UP_STAGES]
+        if unsupported:
+            return {
+                "success": False,
+                "error": f"Stages {unsupported} need D1/D3 cohort metrics; score them with the AppsFlyer evaluator"
+            }
+        if as_of is None:
+            as_of = datetime.now().strftime("%Y-%m-%d")
 
+        try:
             with self.db:
-                # Get all operations from 7 days ago that haven't been evaluated
-                operations_query = """
-                    SELECT ce.id
-                    FROM change_events ce
-                    LEFT JOIN operation_score os ON ce.id = os.operation_id
-                    WHERE DATE(ce.timestamp) = %s
-                      AND os.id IS NULL
-                      AND ce.resource_type IN ('CAMPAIGN_BUDGET', 'CAMPAIGN')
-                    ORDER BY ce.id
-                """
-
-                operations = self.db.execute_query(operations_query, (target_date_str,))
-
-                results = []
-                success_count = 0
-                failed_count = 0
-
-                for op in operations:
-                    operation_id = op['id']
-                    evaluation = self.evaluate_operation(operation_id)
+                rows = self.db.execute_query(
+                    DUE_STAGES_QUERY,
+                    {
+                        "stages": stages,
+                        "stage_days": [SCORE_STAGES[stage] for stage in stages],
+                        "stage_factors": [STAGE_FACTORS[stage] for stage in stages],
+                        "as_of": as_of,
+                        "lookback_days": lookback_days,
+                    },
+                    row_mode='record'
+                )
 
-                    if 'error' not in evaluation:
-                        success_count += 1
+                results = BatchResults(stream)
+                records = []
+                stage_counts = {stage: 0 for stage in stages}
+                pending = 0
+                if rows:
+                    frame = score_operation_stages(pd.DataFrame(rows))
+                    for r in frame.itertuples(index=False):
+                        key = {"operation_id": r.operation_id, "stage": r.score_stage}
+                        if not r.has_performance:
+                            pending += 1
+                            results.append({**key, "pending": True})
+                            continue
+                        if not r.has_baseline:
+                            results.append({**key, "error": "No baseline found"})
+                            continue
+
+                        record = stage_score_record(r)
+                        records.append(record + (stage_score_fingerprint(record),))
+                        stage_counts[r.score_stage] += 1
                         results.append({
-                            "operation_id": operation_id,
-                            "optimizer": evaluation['optimizer_email'],
-                            "score": evaluation['score'],
-                            "min_achievement_rate": evaluation['min_achievement_rate']
-                        })
-                    else:
-                        failed_count += 1
-                        results.append({
-                            "operation_id": operation_id,
-                            "error": evaluation['error']
+                            **key,
+                            "optimizer": r.optimizer_email,
+                            "base_score": None if np.isnan(r.base_score) else int(r.base_score),
+                            "final_score": _nullable(r.final_score),
+                            "risk_level": r.risk_level
                         })
 
+                written = self.db.execute_bulk(
+                    f"""
+                        INSERT INTO operation_score ({', '.join(STAGE_SCORE_COLUMNS)}, input_fingerprint, created_at)
+                        VALUES %s
+                        {STAGE_SCORE_CONFLICT}
+                    """,
+                    records,
+                    template=f"({', '.join(['%s'] * (len(STAGE_SCORE_COLUMNS) + 1))}, NOW())"
+                )
+                if written < 0:
+                    return {"success": False, "error": "Failed to save operation scores"}
+                if written:
+                    self.refresh_optimizer_stats((r[2], r[4]) for r in records)
+
                 return {
                     "success": True,
-                    "target_date": target_date_str,
-                    "total_operations": len(operations),
-                    "success_count": success_count,
-                    "failed_count": failed_count,
-                    "results": results
+                    "as_of": as_of,
+                    "total_due": len(results),
+                    "scored": len(records),
+                    "pending": pending,
+                    "failed": len(results) - len(records) - pending,
+                    "stages": stage_counts,
+                    "results": results.items
                 }
 
         except Exception as e:
-            print(f"Batch evaluation error: {e}", file=sys.stderr, flush=True)
+            print(f"Stage evaluation error: {e}", file=sys.stderr, flush=True)
             return {
                 "success": False,
                 "error": str(e)
             }
 
+    def evaluate_operations_7days_ago(self, stream: Optional[NdjsonStream] = None) -> Dict[str, Any]:
+        """
+        Batch evaluate all operations from 7 days ago
+
+        This should be run daily to evaluate operations that were made 7 days ago.
+
+        Returns:
+            Summary of evaluation results
+        """
+        target_date = datetime.now() - timedelta(days=7)
+        return self.evaluate_operations_batch(target_date=target_date.strftime("%Y-%m-%d"), stream=stream)
+
 
 def main():
     """Main entry point for CLI usage"""
     input_data = read_input()
 
     evaluator = OperationEvaluator()
+    stream = output_stream(input_data)
 
     action = input_data.get('action')
 
@@ -409,15 +908,47 @@ def main():
         # Get optimizer leaderboard
         result = evaluator.get_optimizer_leaderboard(
             days=input_data.get('days', 30),
-            limit=input_data.get('limit', 20)
+            limit=input_data.get('limit', 20),
+            operation_type=input_data.get('operationType'),
+            account_id=input_data.get('accountId'),
+            score_stage=input_data.get('scoreStage')
         )
+    elif action == 'evaluate_due_stages':
+        # Score every due T+7 stage, catching up missed days
+        result = evaluator.evaluate_due_stages(
+            as_of=input_data.get('asOf'),
+            lookback_days=input_data.get('lookbackDays', 30),
+            stages=input_data.get('stages'),
+            stream=stream
+        )
+    elif action == 'leaderboards':
+        # Rolling leaderboards for several windows
+        result = evaluator.get_optimizer_leaderboards(
+            windows=input_data.get('windows', [7, 30, 90]),
+            limit=input_data.get('limit', 20),
+            operation_type=input_data.get('operationType'),
+            account_id=input_data.get('accountId'),
+            score_stage=input_data.get('scoreStage')
+        )
+    elif action == 'refresh_optimizer_stats':
+        # Rebuild optimizer_daily_stats from operation_score
+        with evaluator.db:
+            result = {"success": evaluator.refresh_optimizer_stats()}
     elif action == 'evaluate_7days_ago':
         # Batch evaluate operations from 7 days ago
-        result = evaluator.evaluate_operations_7days_ago()
+        result = evaluator.evaluate_operations_7days_ago(stream=stream)
+    elif action == 'evaluate_batch':
+        # Set-based evaluation for a date and/or explicit operations
+        result = evaluator.evaluate_operations_batch(
+            target_date=input_data.get('targetDate'),
+            operation_ids=input_data.get('operationIds'),
+            only_unevaluated=input_data.get('onlyUnevaluated', True),
+            stream=stream
+        )
     else:
         result = {"error": f"Unknown action: {action}"}
 
-    format_output(result)
+    format_output(result, stream)
 
 
 if __name__ == "__main__":
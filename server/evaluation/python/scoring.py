@@ -0,0 +1,101 @@
+"""
+Shared array scoring kernel
+
+Achievement rates and the threshold ladders used by CampaignEvaluator (A3
+status / recommendation) and OperationEvaluator (A5 score, T+N stage score).
+Everything works on NumPy arrays so the batch paths score whole frames at
+once; single-item paths pass length-1 arrays and index [0].
+
+Ladders are sorted threshold arrays: code = np.searchsorted(thresholds, rate,
+side='right') is the number of thresholds <= rate, i.e. the same as the
+`rate < threshold` if/elif chains it replaces. NaN rates get code -1.
+
+Usage:
+    from scoring import achievement_rates, campaign_codes, CAMPAIGN_STATUSES
+
+    roas_rate, ret_rate, min_rate = achievement_rates(actual_roas, actual_ret, base_roas, base_ret)
+    status = CAMPAIGN_STATUSES[campaign_codes(min_rate)]
+"""
+
+from typing import Tuple
+
+import numpy as np
+
+# A3 campaign ladder on min achievement rate (%)
+CAMPAIGN_THRESHOLDS = np.array([60.0, 85.0, 100.0, 110.0])
+CAMPAIGN_STATUSES = np.array(['danger', 'warning', 'observation', 'healthy', 'excellent'], dtype=object)
+RECOMMENDATION_TYPES = np.array(['关停', '保守缩量', '继续观察', '保守扩量或观察', '激进扩量'], dtype=object)
+RECOMMENDATION_DESCRIPTIONS = np.array([
+    "达成率低于60%，严重亏损，建议立即关停campaign",
+    "达成率60-85%，表现不佳，建议减少投入观察变化",
+    "达成率85-100%，接近及格线，保持现状等待更多数据",
+    "达成率100-110%，表现达标，可小幅增加投入测试",
+    "达成率≥110%，表现优异，建议大幅增加投入",
+], dtype=object)
+
+# A5 T+7 operation score on min achievement rate (%)
+OPERATION_THRESHOLDS = np.array([85.0, 110.0])
+OPERATION_SCORES = np.array(['失败', '合格', '优秀'], dtype=object)
+
+# T+N stage score on min achievement as a fraction of baseline (scale=1),
+# same cut points as the TS operation-evaluator wrapper
+STAGE_THRESHOLDS = np.array([0.6, 0.85, 1.0, 1.1])
+STAGE_BASE_SCORES = np.array([0, 40, 60, 80, 100])
+STAGE_RISK_LEVELS = np.array(['danger', 'warning', 'observe', 'healthy', 'excellent'], dtype=object)
+STAGE_SUGGESTION_TYPES = np.array(['stop', 'shrink', 'observe', 'expand', 'expand'], dtype=object)
+
+
+def achievement_rates(
+    actual_roas,
+    actual_ret,
+    baseline_roas,
+    baseline_ret,
+    missing_baseline: float = 0.0,
+    scale: float = 100.0
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    (roas_rate, ret_rate, min_rate), actual / baseline * scale (percent by default)
+
+    A non-positive baseline yields `missing_baseline` for that rate: 0.0 for
+    the A3/A5 paths (historic behaviour), NaN for stage scoring, where the
+    min then skips the missing rate and uses the other one.
+    """
+    actual_roas = np.asarray(actual_roas, dtype=float)
+    actual_ret = np.asarray(actual_ret, dtype=float)
+    baseline_roas = np.asarray(baseline_roas, dtype=float)
+    baseline_ret = np.asarray(baseline_ret, dtype=float)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        roas_rate = np.where(baseline_roas > 0, actual_roas / baseline_roas * scale, missing_baseline)
+        ret_rate = np.where(baseline_ret > 0, actual_ret / baseline_ret * scale, missing_baseline)
+    minimum = np.fmin if np.isnan(missing_baseline) else np.minimum
+    return roas_rate, ret_rate, minimum(roas_rate, ret_rate)
+
+
+def ladder_codes(rates, thresholds: np.ndarray) -> np.ndarray:
+    """Index into a ladder's labels for each rate; -1 where the rate is NaN"""
+    rates = np.asarray(rates, dtype=float)
+    codes = np.searchsorted(thresholds, rates, side='right')
+    return np.where(np.isnan(rates), -1, codes)
+
+
+def campaign_codes(min_rate) -> np.ndarray:
+    """Index into CAMPAIGN_STATUSES / RECOMMENDATION_TYPES / RECOMMENDATION_DESCRIPTIONS"""
+    return ladder_codes(min_rate, CAMPAIGN_THRESHOLDS)
+
+
+def operation_codes(min_rate) -> np.ndarray:
+    """Index into OPERATION_SCORES"""
+    return ladder_codes(min_rate, OPERATION_THRESHOLDS)
+
+
+def stage_codes(min_rate) -> np.ndarray:
+    """Index into STAGE_BASE_SCORES / STAGE_RISK_LEVELS / STAGE_SUGGESTION_TYPES (fraction rates)"""
+    return ladder_codes(min_rate, STAGE_THRESHOLDS)
+
+
+def labels(table: np.ndarray, codes: np.ndarray, missing=None) -> np.ndarray:
+    """table[codes] with `missing` where code is -1"""
+    codes = np.asarray(codes)
+    out = table[np.clip(codes, 0, None)]
+    return np.where(codes < 0, missing, out) if (codes < 0).any() else out
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+What-if backtester for CampaignEvaluator thresholds
+
+Loads mock_campaign_performance for a date range and the safety baselines
+once, computes the achievement rates once (they do not depend on the
+thresholds), then re-buckets them for every threshold set of a grid in
+parallel worker processes. Nothing is written: the connection is opened
+read-only and campaign_evaluation is never touched.
+
+For each threshold set the report holds the status / recommendation /
+campaign type distribution and how many (campaign, date) evaluations would
+move from the current status to another one.
+
+Baselines: safety_baseline only keeps the current values, so history is
+scored against today's baselines (same as re-running the evaluator now).
+
+Usage:
+    python threshold_backtest.py --start 2026-09-01 --end 2026-09-30 \\
+        --danger 50,60 --warning 80,85 --healthy 105,110,120 --test-spend 500,1000
+    python threshold_backtest.py --start 2026-09-01 --end 2026-09-30 --workers 1 --top 5
+"""
+
+import os
+import sys
+import time
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from db_utils import get_db, format_output
+from campaign_evaluator import CampaignEvaluator
+from scoring import CAMPAIGN_STATUSES, RECOMMENDATION_TYPES, achievement_rates
+
+# Same row the evaluator reads per (campaign, date), with its safety baseline
+HISTORY_QUERY = """
+    SELECT DISTINCT ON (p.campaign_id, p.date)
+        p.campaign_id,
+        p.date,
+        p.total_spend,
+        p.actual_roas7,
+        p.actual_ret7,
+        b.baseline_roas7,
+        b.baseline_ret7
+    FROM mock_campaign_performance p
+    LEFT JOIN safety_baseline b
+      ON b.product_name = p.product_name
+     AND b.country_code = p.country_code
+     AND b.platform = p.platform
+     AND b.channel = p.channel
+    WHERE p.date BETWEEN %(start_date)s AND %(end_date)s
+    ORDER BY p.campaign_id, p.date
+"""
+
+THRESHOLD_KEYS = ('danger', 'warning', 'observation', 'healthy', 'test_spend')
+
+CURRENT_THRESHOLDS = {
+    'danger': CampaignEvaluator.DANGER_THRESHOLD,
+    'warning': CampaignEvaluator.WARNING_THRESHOLD,
+    'observation': CampaignEvaluator.OBSERVATION_THRESHOLD,
+    'healthy': CampaignEvaluator.HEALTHY_THRESHOLD,
+    'test_spend': CampaignEvaluator.TEST_CAMPAIGN_THRESHOLD,
+}
+
+N_STATUSES = len(CAMPAIGN_STATUSES)
+
+# Set in each worker by _init_worker (inherited copy-on-write under fork)
+_HISTORY: Dict[str, np.ndarray] = {}
+
+
+def load_history(start_date: str, end_date: str) -> Dict[str, Any]:
+    """
+    Read the date range once and reduce it to the arrays the sweep needs:
+    total_spend and min achievement rate per (campaign, date) with a baseline.
+    """
+    db = get_db()
+    with db:
+        db.conn.set_session(readonly=True)
+        # Tuples from a server-side cursor: no per-row dict, constant fetch memory
+        frame = pd.DataFrame.from_records(
+            db.iter_query(HISTORY_QUERY, {"start_date": start_date, "end_date": end_date}, row_mode='tuple'),
+            columns=[
+                'campaign_id', 'date', 'total_spend', 'actual_roas7', 'actual_ret7', 'baseline_roas7', 'baseline_ret7'
+            ]
+        )
+    has_baseline = frame['baseline_roas7'].notna() & frame['baseline_ret7'].notna()
+    scored = frame[has_baseline]
+
+    def values(column: str) -> np.ndarray:
+        return pd.to_numeric(scored[column], errors='coerce').to_numpy(dtype=float)
+
+    _, _, min_rate = achievement_rates(
+        values('actual_roas7'), values('actual_ret7'), values('baseline_roas7'), values('baseline_ret7')
+    )
+    return {
+        "rows": len(frame),
+        "without_baseline": int((~has_baseline).sum()),
+        "campaigns": int(scored['campaign_id'].nunique()),
+        "total_spend": values('total_spend'),
+        "min_rate": min_rate,
+    }
+
+
+def threshold_grid(options: Dict[str, Sequence[float]]) -> List[Dict[str, float]]:
+    """
+    Cartesian product of the per-threshold options (missing keys keep the
+    current value); ladders that are not strictly increasing are dropped.
+    """
+    values = [sorted(set(options.get(key) or [CURRENT_THRESHOLDS[key]])) for key in THRESHOLD_KEYS]
+    grid = []
+    for combo in itertools.product(*values):
+        thresholds = dict(zip(THRESHOLD_KEYS, combo))
+        ladder = [thresholds[k] for k in ('danger', 'warning', 'observation', 'healthy')]
+        if all(a < b for a, b in zip(ladder, ladder[1:])):
+            grid.append(thresholds)
+    return grid
+
+
+def status_codes(min_rate: np.ndarray, thresholds: Dict[str, float]) -> np.ndarray:
+    ladder = np.array([thresholds['danger'], thresholds['warning'], thresholds['observation'], thresholds['healthy']])
+    # Same bucketing as CampaignEvaluator.status_code; NaN rates fall in the top bucket
+    return np.searchsorted(ladder, min_rate, side='right')
+
+
+def summarize(codes: np.ndarray, current: np.ndarray, is_test: np.ndarray, thresholds: Dict[str, float]) -> Dict[str, Any]:
+    status_counts = np.bincount(codes, minlength=N_STATUSES)
+    transitions = np.bincount(current * N_STATUSES + codes, minlength=N_STATUSES ** 2).reshape(N_STATUSES, N_STATUSES)
+    by_type = {
+        campaign_type: dict(zip(CAMPAIGN_STATUSES, np.bincount(codes[mask], minlength=N_STATUSES).tolist()))
+        for campaign_type, mask in (("test", is_test), ("mature", ~is_test))
+    }
+    changed = int(transitions.sum() - np.trace(transitions))
+    return {
+        "thresholds": thresholds,
+        "status_summary": dict(zip(CAMPAIGN_STATUSES, status_counts.tolist())),
+        "recommendation_summary": dict(zip(RECOMMENDATION_TYPES, status_counts.tolist())),
+        "campaign_types": {"test": int(is_test.sum()), "mature": int((~is_test).sum())},
+        "status_by_type": by_type,
+        "changed_count": changed,
+        "changed_rate": round(changed / len(codes) * 100, 2) if len(codes) else 0.0,
+        "transitions": {
+            CAMPAIGN_STATUSES[i]: {CAMPAIGN_STATUSES[j]: int(transitions[i, j])
+                                   for j in range(N_STATUSES) if i != j and transitions[i, j]}
+            for i in range(N_STATUSES) if transitions[i].sum() - transitions[i, i]
+        },
+    }
+
+
+def _init_worker(total_spend: np.ndarray, min_rate: np.ndarray) -> None:
+    _HISTORY['total_spend'] = total_spend
+    _HISTORY['min_rate'] = min_rate
+    _HISTORY['current'] = status_codes(min_rate, CURRENT_THRESHOLDS)
+
+
+def _evaluate_chunk(grid: List[Dict[str, float]]) -> List[Dict[str, Any]]:
+    min_rate, total_spend, current = _HISTORY['min_rate'], _HISTORY['total_spend'], _HISTORY['current']
+    return [
+        summarize(status_codes(min_rate, thresholds), current, total_spend < thresholds['test_spend'], thresholds)
+        for thresholds in grid
+    ]
+
+
+def run_backtest(
+    start_date: str,
+    end_date: str,
+    options: Optional[Dict[str, Sequence[float]]] = None,
+    workers: Optional[int] = None,
+    top: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Sweep the threshold grid over [start_date, end_date]
+
+    Args:
+        options: {"danger": [...], "warning": [...], "observation": [...],
+                  "healthy": [...], "test_spend": [...]}; missing keys keep
+                 the current CampaignEvaluator value
+        workers: Worker processes (default: CPU count, 1 = in-process)
+        top: Only return the `top` sets with the fewest changed evaluations
+
+    Returns:
+        Baseline (current thresholds) summary plus one summary per threshold set
+    """
+    try:
+        started = time.monotonic()
+        history = load_history(start_date, end_date)
+        grid = threshold_grid(options or {})
+        workers = max(1, min(workers or os.cpu_count() or 1, len(grid)))
+
+        _init_worker(history['total_spend'], history['min_rate'])
+        current = _evaluate_chunk([CURRENT_THRESHOLDS])[0]
+
+        if workers == 1 or len(history['min_rate']) == 0:
+            scenarios = _evaluate_chunk(grid)
+        else:
+            chunks = [grid[i::workers] for i in range(workers)]
+            with ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_worker,
+                initargs=(history['total_spend'], history['min_rate'])
+            ) as pool:
+                scenarios = [s for chunk in pool.map(_evaluate_chunk, chunks) for s in chunk]
+
+        scenarios.sort(key=lambda s: (s['changed_count'], [s['thresholds'][k] for k in THRESHOLD_KEYS]))
+        if top:
+            scenarios = scenarios[:top]
+
+        return {
+            "success": True,
+            "start_date": start_date,
+            "end_date": end_date,
+            "rows": history['rows'],
+            "evaluations": len(history['min_rate']),
+            "without_baseline": history['without_baseline'],
+            "campaigns": history['campaigns'],
+            "grid_size": len(grid),
+            "workers": workers,
+            "current": current,
+            "scenarios": scenarios,
+            "duration_seconds": round(time.monotonic() - started, 3),
+        }
+
+    except Exception as e:
+        print(f"Threshold backtest error: {e}", file=sys.stderr, flush=True)
+        return {
+            "success": False,
+            "error": str(e)
+        }
+
+
+def _floats(value: Optional[str]) -> Optional[List[float]]:
+    return [float(v) for v in value.split(",") if v.strip()] if value else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Read-only what-if backtest of CampaignEvaluator thresholds")
+    parser.add_argument("--start", required=True, help="First performance date (YYYY-MM-DD)")
+    parser.add_argument("--end", required=True, help="Last performance date (YYYY-MM-DD)")
+    for key, flag in (("danger", "--danger"), ("warning", "--warning"), ("observation", "--observation"),
+                      ("healthy", "--healthy"), ("test_spend", "--test-spend")):
+        parser.add_argument(flag, dest=key, help=f"Comma-separated values (default: {CURRENT_THRESHOLDS[key]:g})")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: CPU count)")
+    parser.add_argument("--top", type=int, help="Only report the N sets that change the fewest evaluations")
+    args = parser.parse_args()
+
+    options = {key: _floats(getattr(args, key)) for key in THRESHOLD_KEYS}
+    format_output(run_backtest(args.start, args.end, options, args.workers, args.top))
+
+
+if __name__ == "__main__":
+    main()
@@ -15,6 +15,7 @@ import {
   getSafetyBaseline,
 } from '../../db/queries-evaluation'
 import type { BaselineSettings, NewBaselineSettings } from '../../db/schema'
+import { streamPythonScript, type StreamedSummary } from './python-stream'
 
 export interface BaselineResult {
   baseline_roas7: number | null
@@ -346,6 +347,37 @@ export async function updateAllBaselines(currentDate?: Date): Promise<UpdateAllB
   return runPythonScript<UpdateAllBaselinesResult>('baseline_calculator.py', input)
 }
 
+/**
+ * Batch update all safety baselines, streaming each result
+ *
+ * @deprecated Use updateAllBaselinesFromAF instead. This function uses mock data via Python.
+ *
+ * Same as updateAllBaselines, but each combination's result is passed to
+ * `onResult` as soon as Python writes it (NDJSON).
+ *
+ * @param onResult - Called for each product/country/platform/channel result, in order
+ * @param currentDate - Current date (optional, defaults to now)
+ * @returns Update counts without `results`, plus the number of streamed results
+ */
+export async function updateAllBaselinesStream(
+  onResult: (result: UpdateAllBaselinesResult['results'][number]) => void | Promise<void>,
+  currentDate?: Date
+): Promise<StreamedSummary<Omit<UpdateAllBaselinesResult, 'results'>>> {
+  console.warn(
+    '[DEPRECATED] updateAllBaselinesStream uses mock data. Use updateAllBaselinesFromAF instead.'
+  )
+
+  const input = {
+    action: 'update_all',
+    currentDate: currentDate?.toISOString(),
+  }
+
+  return streamPythonScript<
+    UpdateAllBaselinesResult['results'][number],
+    Omit<UpdateAllBaselinesResult, 'results'>
+  >('baseline_calculator.py', input, onResult)
+}
+
 /**
  * Re-export database functions for direct access
  */
@@ -13,6 +13,7 @@ import {
 } from '../../db/queries-evaluation'
 import { getSafetyBaseline, createCampaignEvaluation } from '../../db/queries-evaluation'
 import { calculateBaselineFromAF, getOrCreateBaselineSettings } from './baseline-calculator'
+import { streamPythonScript, type StreamedSummary } from './python-stream'
 
 // ============================================
 // TYPE DEFINITIONS
@@ -579,6 +580,38 @@ export async function evaluateAllCampaigns(evaluationDate?: Date): Promise<Batch
   return { ...result, dataSource: 'mock' }
 }
 
+/**
+ * Batch evaluate all campaigns, streaming each result
+ *
+ * @deprecated Use evaluateAllCampaignsFromAF instead. This function uses mock data via Python.
+ *
+ * Same as evaluateAllCampaigns, but each per-campaign result is passed to
+ * `onResult` as soon as Python writes it (NDJSON) instead of in one final array.
+ *
+ * @param onResult - Called for each campaign result, in order
+ * @param evaluationDate - Date to evaluate (default: today)
+ * @returns Batch summary without `results`, plus the number of streamed results
+ */
+export async function evaluateAllCampaignsStream(
+  onResult: (result: BatchEvaluationResult['results'][number]) => void | Promise<void>,
+  evaluationDate?: Date
+): Promise<StreamedSummary<Omit<BatchEvaluationResult, 'results'>>> {
+  console.warn(
+    '[DEPRECATED] evaluateAllCampaignsStream uses mock data. Use evaluateAllCampaignsFromAF instead.'
+  )
+
+  const input = {
+    action: 'evaluate_all',
+    evaluationDate: evaluationDate?.toISOString(),
+  }
+
+  const summary = await streamPythonScript<
+    BatchEvaluationResult['results'][number],
+    Omit<BatchEvaluationResult, 'results'>
+  >('campaign_evaluator.py', input, onResult)
+  return { ...summary, dataSource: 'mock' }
+}
+
 /**
  * Re-export database functions for direct access
  */
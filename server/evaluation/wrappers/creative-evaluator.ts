@@ -6,6 +6,7 @@
 
 import { spawn } from "child_process";
 import path from "path";
+import { streamPythonScript, type StreamedSummary } from "./python-stream";
 
 export interface CreativeEvaluationD3Result {
   creative_id: string;
@@ -55,6 +56,31 @@ export interface CampaignClosureCheckResult {
   error?: string;
 }
 
+export interface CampaignClosureBatchResult {
+  success: boolean;
+  total_campaigns: number;
+  should_close: number;
+  campaigns: CampaignClosureCheckResult[];
+  error?: string;
+}
+
+export interface CreativeBatchCampaignSummary {
+  campaign_id: string;
+  D3: Partial<Record<"不及格" | "测试中", number>>;
+  D7: Partial<Record<"不及格" | "及格" | "出量好素材", number>>;
+  skipped: number;
+}
+
+export interface CreativeBatchEvaluationResult {
+  success: boolean;
+  evaluation_date: string;
+  evaluated: number;
+  unchanged: number; // evaluated, but the stored input fingerprint matched (not rewritten)
+  skipped: number;
+  campaigns: CreativeBatchCampaignSummary[];
+  error?: string;
+}
+
 /**
  * Run Python script and return parsed JSON output
  */
@@ -187,6 +213,92 @@ export async function evaluateCreativeD7(
   );
 }
 
+/**
+ * Evaluate every creative due for D3 or D7 in one Python run
+ *
+ * A creative is due for D3 after 3 days and for D7 after 7 days unless that
+ * stage already has a creative_evaluation row. Creatives without a creative
+ * test baseline are skipped and counted per campaign.
+ *
+ * @param evaluationDate - Evaluation date (YYYY-MM-DD, default: today)
+ * @returns Per-campaign status counts
+ *
+ * @example
+ * ```typescript
+ * const result = await evaluateAllDueCreatives();
+ * for (const campaign of result.campaigns) {
+ *   console.log(campaign.campaign_id, campaign.D7);
+ * }
+ * ```
+ */
+export async function evaluateAllDueCreatives(
+  evaluationDate?: string
+): Promise<CreativeBatchEvaluationResult> {
+  const input = {
+    action: "evaluate_all_due",
+    evaluationDate,
+  };
+
+  return runPythonScript<CreativeBatchEvaluationResult>(
+    "creative_evaluator.py",
+    input
+  );
+}
+
+/**
+ * Evaluate all due creatives, streaming each campaign summary
+ *
+ * Same as evaluateAllDueCreatives, but each campaign summary is passed to
+ * `onCampaign` as soon as Python writes it (NDJSON) instead of in one final array.
+ *
+ * @param onCampaign - Called for each campaign summary, in order
+ * @param evaluationDate - Evaluation date (YYYY-MM-DD, default: today)
+ * @returns Batch totals without `campaigns`, plus the number of streamed summaries
+ */
+export async function evaluateAllDueCreativesStream(
+  onCampaign: (campaign: CreativeBatchCampaignSummary) => void | Promise<void>,
+  evaluationDate?: string
+): Promise<StreamedSummary<Omit<CreativeBatchEvaluationResult, "campaigns">>> {
+  const input = {
+    action: "evaluate_all_due",
+    evaluationDate,
+  };
+
+  return streamPythonScript<
+    CreativeBatchCampaignSummary,
+    Omit<CreativeBatchEvaluationResult, "campaigns">
+  >("creative_evaluator.py", input, onCampaign);
+}
+
+/**
+ * Evaluate all creatives of a test campaign in one Python run
+ *
+ * Without `evaluationDay` only due creatives are evaluated; with "D3" / "D7"
+ * every creative in the campaign is (re-)evaluated at that stage.
+ *
+ * @param campaignId - Campaign ID
+ * @param evaluationDay - Optional stage to force
+ * @param evaluationDate - Evaluation date (YYYY-MM-DD, default: today)
+ * @returns Per-campaign status counts
+ */
+export async function evaluateCampaignCreatives(
+  campaignId: string,
+  evaluationDay?: "D3" | "D7",
+  evaluationDate?: string
+): Promise<CreativeBatchEvaluationResult> {
+  const input = {
+    action: "evaluate_campaign",
+    campaignId,
+    evaluationDay,
+    evaluationDate,
+  };
+
+  return runPythonScript<CreativeBatchEvaluationResult>(
+    "creative_evaluator.py",
+    input
+  );
+}
+
 /**
  * Check if test campaign should be closed
  *
@@ -218,6 +330,59 @@ export async function checkCampaignClosure(
   );
 }
 
+/**
+ * Check closure for many (default: all) test campaigns in one Python run
+ *
+ * Counts only the latest D7 evaluation of each creative.
+ *
+ * @param campaignIds - Campaigns to check (default: every test campaign)
+ * @returns Closure recommendation per campaign
+ *
+ * @example
+ * ```typescript
+ * const { campaigns } = await checkAllCampaignClosures();
+ * const toClose = campaigns.filter((c) => c.should_close);
+ * ```
+ */
+export async function checkAllCampaignClosures(
+  campaignIds?: string[]
+): Promise<CampaignClosureBatchResult> {
+  const input = {
+    action: "check_closure_all",
+    campaignIds,
+  };
+
+  return runPythonScript<CampaignClosureBatchResult>(
+    "creative_evaluator.py",
+    input
+  );
+}
+
+/**
+ * Check closure for many (default: all) test campaigns, streaming each result
+ *
+ * Same as checkAllCampaignClosures, but each campaign result is passed to
+ * `onCampaign` as soon as Python writes it (NDJSON).
+ *
+ * @param onCampaign - Called for each campaign closure result, in order
+ * @param campaignIds - Campaigns to check (default: every test campaign)
+ * @returns Batch totals without `campaigns`, plus the number of streamed results
+ */
+export async function checkAllCampaignClosuresStream(
+  onCampaign: (campaign: CampaignClosureCheckResult) => void | Promise<void>,
+  campaignIds?: string[]
+): Promise<StreamedSummary<Omit<CampaignClosureBatchResult, "campaigns">>> {
+  const input = {
+    action: "check_closure_all",
+    campaignIds,
+  };
+
+  return streamPythonScript<
+    CampaignClosureCheckResult,
+    Omit<CampaignClosureBatchResult, "campaigns">
+  >("creative_evaluator.py", input, onCampaign);
+}
+
 /**
  * Get creative evaluations from database (using existing queries)
  *
@@ -21,6 +21,7 @@ import {
 } from '../../db/queries-evaluation'
 import { getBaselineMetrics } from '../../db/queries-appsflyer'
 import { getOrCreateBaselineSettings } from './baseline-calculator'
+import { streamPythonScript, type StreamedSummary } from './python-stream'
 
 // ============================================
 // TYPE DEFINITIONS
@@ -746,11 +747,13 @@ export async function evaluateOperation(operationId: number): Promise<OperationE
  *
  * @param days - Look back period in days (default: 30)
  * @param limit - Maximum number of optimizers to return (default: 20)
+ * @param filters - Optional operation type / account / score stage filters
  * @returns Leaderboard with optimizer statistics
  */
 export async function getOptimizerLeaderboard(
   days: number = 30,
-  limit: number = 20
+  limit: number = 20,
+  filters: { operationType?: string; accountId?: number; scoreStage?: ScoreStage } = {}
 ): Promise<LeaderboardResult> {
   console.warn(
     '[DEPRECATED] getOptimizerLeaderboard uses mock data. Use getOptimizerLeaderboardFromDb instead.'
@@ -760,6 +763,7 @@ export async function getOptimizerLeaderboard(
     action: 'leaderboard',
     days,
     limit,
+    ...filters,
   }
 
   const result = await runPythonScript<LeaderboardResult>('operation_evaluator.py', input)
@@ -788,10 +792,40 @@ export async function evaluateOperations7DaysAgo(): Promise<BatchEvaluationResul
   return { ...result, dataSource: 'mock', pending_count: 0 }
 }
 
+/**
+ * Batch evaluate all operations from 7 days ago, streaming each result
+ *
+ * @deprecated Use evaluateOperations7DaysAgoFromAF instead. This function uses mock data via Python.
+ *
+ * Same as evaluateOperations7DaysAgo, but each per-operation result is passed
+ * to `onResult` as soon as Python writes it (NDJSON).
+ *
+ * @param onResult - Called for each operation result, in order
+ * @returns Batch summary without `results`, plus the number of streamed results
+ */
+export async function evaluateOperations7DaysAgoStream(
+  onResult: (result: BatchEvaluationResult['results'][number]) => void | Promise<void>
+): Promise<StreamedSummary<Omit<BatchEvaluationResult, 'results'>>> {
+  console.warn(
+    '[DEPRECATED] evaluateOperations7DaysAgoStream uses mock data. Use evaluateOperations7DaysAgoFromAF instead.'
+  )
+
+  const input = {
+    action: 'evaluate_7days_ago',
+  }
+
+  const summary = await streamPythonScript<
+    BatchEvaluationResult['results'][number],
+    Omit<BatchEvaluationResult, 'results'>
+  >('operation_evaluator.py', input, onResult)
+  return { ...summary, dataSource: 'mock', pending_count: 0 }
+}
+
 /**
  * Re-export database functions for direct access
  */
 export {
   getOperationScores,
   getOptimizerLeaderboard as getOptimizerLeaderboardFromDb,
+  getOptimizerLeaderboards as getOptimizerLeaderboardsFromDb,
 } from '../../db/queries-evaluation'
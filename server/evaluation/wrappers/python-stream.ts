@@ -0,0 +1,91 @@
+/**
+ * Streamed Python batch output
+ *
+ * With `stream: true` in the input, the Python evaluators write newline-delimited
+ * JSON (db_utils.NdjsonStream): one {"type":"item","data":...} line per result as
+ * it is produced, then one {"type":"summary","data":...} line holding the usual
+ * result without its item list, plus `streamed` (number of items written).
+ *
+ * Items are handed to `onItem` line by line, so neither side holds the whole
+ * batch and the first results arrive before the batch finishes.
+ */
+
+import { spawn } from 'child_process'
+import path from 'path'
+import readline from 'readline'
+
+export type StreamedSummary<T> = T & { streamed: number }
+
+type StreamRecord<TItem, TSummary> =
+  | { type: 'item'; data: TItem }
+  | { type: 'summary'; data: StreamedSummary<TSummary> }
+
+/**
+ * Run a Python evaluator in streaming mode
+ *
+ * @param scriptName - Script in server/evaluation/python
+ * @param input - Action input (`stream: true` is added)
+ * @param onItem - Called for each item in order; a returned promise is awaited
+ *   before the next line is read
+ * @returns The summary record
+ */
+export async function streamPythonScript<TItem, TSummary>(
+  scriptName: string,
+  input: Record<string, unknown>,
+  onItem: (item: TItem) => void | Promise<void>
+): Promise<StreamedSummary<TSummary>> {
+  const scriptPath = path.join(process.cwd(), 'server', 'evaluation', 'python', scriptName)
+
+  const pythonProcess = spawn('python3', [scriptPath])
+
+  let stderrData = ''
+  const otherOutput: string[] = []
+  let summary: StreamedSummary<TSummary> | undefined
+
+  pythonProcess.stderr.on('data', (data) => {
+    stderrData += data.toString()
+  })
+
+  const exited = new Promise<number | null>((resolve, reject) => {
+    pythonProcess.on('close', resolve)
+    pythonProcess.on('error', (error) => {
+      reject(new Error(`Failed to start Python process: ${error.message}`))
+    })
+  })
+
+  pythonProcess.stdin.write(JSON.stringify({ ...input, stream: true }))
+  pythonProcess.stdin.end()
+
+  const lines = readline.createInterface({ input: pythonProcess.stdout, crlfDelay: Infinity })
+  for await (const line of lines) {
+    if (!line.trim()) continue
+
+    let record: StreamRecord<TItem, TSummary>
+    try {
+      record = JSON.parse(line)
+    } catch {
+      // Stray prints (e.g. connection errors) are kept for the error message
+      otherOutput.push(line)
+      continue
+    }
+
+    if (record.type === 'item') {
+      await onItem(record.data)
+    } else if (record.type === 'summary') {
+      summary = record.data
+    } else {
+      otherOutput.push(line)
+    }
+  }
+
+  const code = await exited
+  if (code !== 0) {
+    throw new Error(`Python script exited with code ${code}\nStderr: ${stderrData}`)
+  }
+  if (!summary) {
+    throw new Error(
+      `Python output had no summary record\nOutput: ${otherOutput.join('\n')}\nStderr: ${stderrData}`
+    )
+  }
+  return summary
+}